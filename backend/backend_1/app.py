@@ -2,6 +2,10 @@ from flask import Flask
 from flask_cors import CORS
 from controllers.face_controller import face_routes
 from config.settings import init_app_config
+from models.student import init_student_model
+from services.model_registry import init_model_registry
+from services.upload_queue import init_upload_queue
+from utils.metrics import init_request_metrics
 
 def create_app():
     app = Flask(__name__)
@@ -9,9 +13,21 @@ def create_app():
     # Initialize configurations
     init_app_config(app)
     
+    # Indexes for the roll number, class and name lookups
+    init_student_model(app)
+    
+    # Load and warm up the detector and embedder once instead of on the first request
+    init_model_registry(app)
+    
+    # Upload registration images in the background, resuming uploads left over from the last run
+    init_upload_queue(app)
+    
     # Enable CORS
     CORS(app)
     
+    # Per-request latency and the Prometheus /metrics endpoint
+    init_request_metrics(app)
+    
     # Register routes
     app.register_blueprint(face_routes)
     
@@ -11,19 +11,51 @@ CLOUDINARY_CLOUD_NAME = os.getenv('CLOUDINARY_CLOUD_NAME')
 CLOUDINARY_API_KEY = os.getenv('CLOUDINARY_API_KEY')
 CLOUDINARY_API_SECRET = os.getenv('CLOUDINARY_API_SECRET')
 
+# Object storage for registration images: 'cloudinary', or 'local' to store them on disk (offline/testing)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'cloudinary')
+LOCAL_STORAGE_FOLDER = os.getenv('LOCAL_STORAGE_FOLDER', 'local_storage')
+
+# Background upload queue
+UPLOAD_SPOOL_FOLDER = 'upload_spool'  # Images waiting for upload, re-queued after a restart
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '4'))  # Uploads running in parallel
+UPLOAD_QUEUE_DEPTH = int(os.getenv('UPLOAD_QUEUE_DEPTH', '1000'))  # Queued uploads before new ones are uploaded inline
+UPLOAD_MAX_ATTEMPTS = int(os.getenv('UPLOAD_MAX_ATTEMPTS', '5'))  # Attempts per image before giving up
+UPLOAD_RETRY_BACKOFF = float(os.getenv('UPLOAD_RETRY_BACKOFF', '2.0'))  # Seconds before the first retry, doubled on each attempt
+
 # App configuration
 UPLOAD_FOLDER = 'temp_uploads'
 FACE_MODEL = 'Facenet'
+FACE_EMBEDDING_VERSION = 1  # Bump when the embedding pipeline changes so stored vectors are ignored
 FACE_DETECTOR = 'opencv'
+UPLOAD_DETECTOR = os.getenv('UPLOAD_DETECTOR', 'haar')  # Single-face check of registration images
+RECOGNITION_DETECTOR = os.getenv('RECOGNITION_DETECTOR', FACE_DETECTOR)  # Group photos
+DNN_PROTOTXT = os.getenv('DNN_PROTOTXT', 'models/deploy.prototxt')  # OpenCV DNN face model, not shipped with the repo
+DNN_MODEL = os.getenv('DNN_MODEL', 'models/res10_300x300_ssd_iter_140000.caffemodel')
+DNN_CONFIDENCE = float(os.getenv('DNN_CONFIDENCE', '0.5'))
 FACE_DISTANCE_METRIC = 'cosine'
-FACE_DISTANCE_THRESHOLD = 0.5  # Threshold for considering a match
+FACE_DISTANCE_THRESHOLD = 0.40  # Cosine distance for a match, DeepFace.verify's Facenet threshold (backend_2 uses the same)
+INDEX_FOLDER = 'indexes'  # Persisted ANN index of the student gallery
+ANN_INDEX = os.getenv('ANN_INDEX', 'exact')  # Index used for large galleries: 'exact', or 'ivf' (faster, loses recall: benchmarks/ann_recall.py)
+ANN_MIN_ROWS = int(os.getenv('ANN_MIN_ROWS', '100000'))  # Below this a full matrix multiply is faster
+ANN_NPROBE = int(os.getenv('ANN_NPROBE', '8'))  # IVF lists scanned per query
+ANN_CANDIDATES = int(os.getenv('ANN_CANDIDATES', '50'))  # Gallery rows returned per face
+IMAGES_PER_STUDENT = 5  # Registration images per student
+REGISTRATION_WORKERS = int(os.getenv('REGISTRATION_WORKERS', '5'))  # Images of a batch registration checked in parallel
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', 'true').lower() == 'true'  # Load and warm up models at startup
+QUALITY_CHECK_MODE = os.getenv('QUALITY_CHECK_MODE', 'full')  # 'full' checks the whole image, 'proxy' a downscaled copy (validate with benchmarks/quality_proxy_validation.py first)
+QUALITY_PROXY_MAX_SIDE = int(os.getenv('QUALITY_PROXY_MAX_SIDE', '1024'))  # Longer side of the quality-check proxy
+QUALITY_BLUR_SCALE_EXPONENT = float(os.getenv('QUALITY_BLUR_SCALE_EXPONENT', '4.0'))  # Proxy Laplacian variance is divided by scale^exponent before the clear-pass test, below 4 smooth images can pass on the proxy and fail at full resolution
+QUALITY_PROXY_MARGIN = float(os.getenv('QUALITY_PROXY_MARGIN', '2.5'))  # Proxy blur scores below threshold * margin are rechecked at full resolution
 
 def init_app_config(app):
     """Initialize app configuration"""
     # Create temp upload directory if it doesn't exist
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(INDEX_FOLDER, exist_ok=True)
+    os.makedirs(UPLOAD_SPOOL_FOLDER, exist_ok=True)
     
     # App configurations
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
+    app.config['PRELOAD_MODELS'] = PRELOAD_MODELS
     
\ No newline at end of file
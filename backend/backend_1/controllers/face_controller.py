@@ -3,7 +3,10 @@ import uuid
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 from services.face_service import FaceService
-from config.settings import UPLOAD_FOLDER
+from services.model_registry import registry
+from services.detector_registry import detectors
+from services.upload_queue import upload_queue
+from config.settings import UPLOAD_FOLDER, IMAGES_PER_STUDENT
 
 face_routes = Blueprint('face_routes', __name__)
 
@@ -12,6 +15,13 @@ def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def parse_classes(form):
+    """Read the optional class filter: repeated 'class' fields or comma-separated values"""
+    classes = []
+    for value in form.getlist('class'):
+        classes.extend(c.strip() for c in value.split(',') if c.strip())
+    return classes or None
+
 def save_temp_file(file):
     """Save uploaded file to temporary location"""
     filename = secure_filename(f"{uuid.uuid4()}_{file.filename}")
@@ -79,6 +89,48 @@ def upload_face():
             os.remove(image_path)
         return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
 
+@face_routes.route('/api/register-student', methods=['POST'])
+def register_student():
+    """Register a student with all registration images in one request"""
+    images = request.files.getlist('images')
+    if len(images) != IMAGES_PER_STUDENT:
+        return jsonify({"success": False, "message": f"Exactly {IMAGES_PER_STUDENT} images are required"}), 400
+    
+    required_fields = ['name', 'roll_no', 'class']
+    for field in required_fields:
+        if field not in request.form:
+            return jsonify({"success": False, "message": f"Missing required field: {field}"}), 400
+    
+    for image in images:
+        if not allowed_file(image.filename):
+            return jsonify({"success": False, "message": f"Invalid file type: {image.filename}"}), 400
+    
+    # Save files temporarily
+    image_paths = [save_temp_file(image) for image in images]
+    
+    try:
+        success, message, student_id, errors = FaceService.register_student(
+            image_paths, request.form['name'], request.form['roll_no'], request.form['class']
+        )
+    
+        if not success:
+            return jsonify({"success": False, "message": message, "errors": errors}), 400
+    
+        return jsonify({
+            "success": True,
+            "message": message,
+            "student_id": student_id,
+            "registration_complete": True
+        })
+    
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
+    finally:
+        # Clean up temporary files
+        for image_path in image_paths:
+            if os.path.exists(image_path):
+                os.remove(image_path)
+
 @face_routes.route('/api/recognize-group', methods=['POST'])
 def recognize_group():
     """Recognize students in a group photo"""
@@ -95,7 +147,9 @@ def recognize_group():
     
     try:
         # Process the group image
-        success, message, recognized_students = FaceService.recognize_faces_in_group(image_path)
+        success, message, recognized_students = FaceService.recognize_faces_in_group(
+            image_path, parse_classes(request.form)
+        )
         
         # Clean up temporary file
         if os.path.exists(image_path):
@@ -114,4 +168,14 @@ def recognize_group():
         # Clean up on error
         if os.path.exists(image_path):
             os.remove(image_path)
-        return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
\ No newline at end of file
+        return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
+
+@face_routes.route('/api/models', methods=['GET'])
+def model_status():
+    """Report per-model load and warm-up times, the detector instances built and uploads still pending"""
+    return jsonify({
+        "success": True,
+        "models": registry.report(),
+        "detectors": detectors.report(),
+        "pending_uploads": upload_queue.pending()
+    })
\ No newline at end of file
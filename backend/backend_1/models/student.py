@@ -1,36 +1,91 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, ASCENDING
 from bson import ObjectId
-from config.settings import MONGODB_URI
+from config.settings import MONGODB_URI, FACE_MODEL, FACE_EMBEDDING_VERSION
 
-client = MongoClient(MONGODB_URI)
+def _connect(uri):
+    """MongoDB client, or an in-memory mongomock client for mongomock:// URIs (tests)"""
+    if uri.startswith('mongomock://'):
+        import mongomock
+        return mongomock.MongoClient()
+    return MongoClient(uri)
+
+client = _connect(MONGODB_URI)
 db = client.get_database('FaceDetection2')
 
 # Collections
 students = db.students
 face_images = db.face_images
+meta = db.meta
+
+GALLERY_VERSION_ID = 'gallery_version'  # meta document counting enrolment writes
+GALLERY_PROJECTION = {"name": 1, "roll_no": 1, "class": 1, "face_embeddings": 1}
 
 class Student:
     """Student model for MongoDB"""
     
     @staticmethod
-    def create(name, roll_no, student_class, image_urls=None):
+    def create(name, roll_no, student_class, image_urls=None, face_embeddings=None, pending_uploads=None):
         """Create a new student record"""
         student_data = {
             "name": name,
             "roll_no": roll_no,
             "class": student_class,
             "image_urls": image_urls or [],
+            "face_embeddings": face_embeddings or [],
+            "pending_uploads": {str(slot): token for slot, token in (pending_uploads or {}).items()},
+            "embedding_model": FACE_MODEL,
+            "embedding_version": FACE_EMBEDDING_VERSION,
             "created_at": ObjectId().generation_time
         }
         
         result = students.insert_one(student_data)
         return str(result.inserted_id)
     
+    @staticmethod
+    def ensure_indexes():
+        """Create the indexes used by the roll number, class and name lookups"""
+        students.create_index([("roll_no", ASCENDING)])
+        students.create_index([("class", ASCENDING)])
+        students.create_index([("name", ASCENDING), ("roll_no", ASCENDING)])
+    
     @staticmethod
     def get_all():
         """Get all students"""
         return list(students.find())
     
+    @staticmethod
+    def get_gallery_records():
+        """
+        Students with embeddings from the current model and pipeline version,
+        projected to the fields the recognition gallery needs
+        """
+        return students.find(
+            {"embedding_model": FACE_MODEL, "embedding_version": FACE_EMBEDDING_VERSION},
+            GALLERY_PROJECTION
+        )
+    
+    @staticmethod
+    def get_gallery_version():
+        """Current write version of the gallery, 0 before the first enrolment"""
+        document = meta.find_one({"_id": GALLERY_VERSION_ID})
+        return document["version"] if document else 0
+    
+    @staticmethod
+    def bump_gallery_version():
+        """
+        Record an enrolment write, so every process rebuilds its cached gallery
+        
+        Returns:
+            int: New gallery version
+        """
+        document = meta.find_one_and_update(
+            {"_id": GALLERY_VERSION_ID},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return document["version"]
+    
     @staticmethod
     def get_by_id(student_id):
         """Get student by ID"""
@@ -49,9 +104,83 @@ class Student:
             {"$set": {"image_urls": image_urls}}
         )
     
+    @staticmethod
+    def update_face_slot(student_id, slot, face_embedding, upload_token, reset_embeddings=False):
+        """
+        Store a re-registered image slot: its embedding, an empty URL until the
+        background upload finishes, and the token of that upload
+        
+        Only the fields of this slot are set, so uploads of other slots that
+        complete concurrently are never overwritten
+        
+        Args:
+            reset_embeddings: Drop the embeddings of the other slots (computed by another model)
+        """
+        update = {
+            f"image_urls.{slot}": None,
+            f"pending_uploads.{slot}": upload_token,
+            "embedding_model": FACE_MODEL,
+            "embedding_version": FACE_EMBEDDING_VERSION
+        }
+        if reset_embeddings:
+            face_embeddings = [None] * 5
+            face_embeddings[slot] = face_embedding
+            update["face_embeddings"] = face_embeddings
+        else:
+            update[f"face_embeddings.{slot}"] = face_embedding
+        return students.update_one({"_id": ObjectId(student_id)}, {"$set": update})
+    
+    @staticmethod
+    def complete_upload(student_id, slot, token, secure_url):
+        """
+        Set the URL of an uploaded image, unless a newer upload of the slot was started since
+        
+        Returns:
+            bool: True if the record was patched
+        """
+        result = students.update_one(
+            {"_id": ObjectId(student_id), f"pending_uploads.{slot}": token},
+            {
+                "$set": {f"image_urls.{slot}": secure_url},
+                "$unset": {f"pending_uploads.{slot}": ""}
+            }
+        )
+        return result.modified_count > 0
+    
+    @staticmethod
+    def save_registration(name, roll_no, student_class, image_urls, face_embeddings, pending_uploads=None):
+        """
+        Create or replace a student's complete registration in a single write
+        
+        Returns:
+            str: Student ID
+        """
+        result = students.find_one_and_update(
+            {"roll_no": roll_no},
+            {
+                "$set": {
+                    "name": name,
+                    "class": student_class,
+                    "image_urls": image_urls,
+                    "face_embeddings": face_embeddings,
+                    "pending_uploads": {str(slot): token for slot, token in (pending_uploads or {}).items()},
+                    "embedding_model": FACE_MODEL,
+                    "embedding_version": FACE_EMBEDDING_VERSION
+                },
+                "$setOnInsert": {"created_at": ObjectId().generation_time}
+            },
+            upsert=True,
+            projection={"_id": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return str(result["_id"])
+    
     @staticmethod
     def exists(name, roll_no):
         """Check if student exists"""
         return students.count_documents({"name": name, "roll_no": roll_no}) > 0
-    
-    
\ No newline at end of file
+
+def init_student_model(app):
+    """Create the student collection indexes when the app is created"""
+    Student.ensure_indexes()
+    return students
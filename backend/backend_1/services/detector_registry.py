@@ -0,0 +1,197 @@
+import os
+import time
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+import cv2
+import numpy as np
+from utils.metrics import metrics
+
+from config.settings import DNN_PROTOTXT, DNN_MODEL, DNN_CONFIDENCE
+
+
+# From Box to DetectorRegistry this file is a copy of backend_2/detectors.py, keep the
+# two identical. Settings and the registered detectors are specific to each app
+Box = namedtuple('Box', ['x', 'y', 'w', 'h', 'confidence'])
+
+
+def _bgr(image):
+    """BGR array of an ImageContext, or the BGR array itself"""
+    return getattr(image, 'bgr', image)
+
+
+def _gray(image):
+    """Gray view of an ImageContext (cached there), or of a BGR/gray array"""
+    gray = getattr(image, 'gray', None)
+    if gray is not None:
+        return gray
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+class HaarDetector:
+    """OpenCV Haar cascade, fast but frontal faces only"""
+
+    def __init__(self, scale_factor=1.3, min_neighbors=5):
+        self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    def detect(self, image):
+        faces = self.cascade.detectMultiScale(_gray(image), self.scale_factor, self.min_neighbors)
+        return [Box(int(x), int(y), int(w), int(h), 1.0) for x, y, w, h in faces]
+
+
+class DNNDetector:
+    """OpenCV DNN ResNet-10 SSD face detector"""
+
+    def __init__(self, prototxt=DNN_PROTOTXT, model=DNN_MODEL, confidence=DNN_CONFIDENCE):
+        if not os.path.exists(prototxt) or not os.path.exists(model):
+            raise FileNotFoundError(f"OpenCV DNN face model not found ({prototxt}, {model})")
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, model)
+        self.confidence = confidence
+
+    def detect(self, image):
+        image = _bgr(image)
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(image, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+
+        boxes = []
+        for detection in detections[detections[:, 2] >= self.confidence]:
+            x1, y1, x2, y2 = (detection[3:7] * np.array([width, height, width, height])).astype(int)
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(width, x2), min(height, y2)
+            if x2 > x1 and y2 > y1:
+                boxes.append(Box(int(x1), int(y1), int(x2 - x1), int(y2 - y1), float(detection[2])))
+        return boxes
+
+
+class DeepFaceDetector:
+    """A DeepFace detector backend (opencv, ssd, mtcnn, retinaface, mediapipe)"""
+
+    def __init__(self, backend):
+        from deepface import DeepFace
+        self.extract_faces = DeepFace.extract_faces
+        self.backend = backend
+
+    def detect(self, image):
+        faces = self.extract_faces(img_path=_bgr(image), detector_backend=self.backend, enforce_detection=False)
+        boxes = []
+        for face in faces:
+            # Without a detection DeepFace returns the whole image with confidence 0
+            if not face.get('confidence'):
+                continue
+            area = face['facial_area']
+            boxes.append(Box(int(area['x']), int(area['y']), int(area['w']), int(area['h']), float(face['confidence'])))
+        return boxes
+
+
+class DetectorRegistry:
+    """
+    Face detectors behind one detect(image) -> boxes interface.
+
+    Detector objects are not safe to share between threads, so each one is
+    checked out of a per-name pool for the duration of a call: a thread
+    reuses an idle instance and a new one is only built when every existing
+    instance is busy. Unlike thread-local storage this also keeps instances
+    when the server starts a new thread per request.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._deepface_backends = {}
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.timings = {}
+
+    def register(self, name, factory, deepface_backend=None):
+        """
+        Register a detector
+
+        Args:
+            name: Registry key
+            factory: Callable building a detector with a detect(image) method
+            deepface_backend: DeepFace detector_backend name if the detector wraps one
+        """
+        self._factories[name] = factory
+        self._deepface_backends[name] = deepface_backend
+        self._idle[name] = []
+
+    def deepface_backend(self, name):
+        """DeepFace detector_backend behind a detector, None for the OpenCV ones"""
+        if name not in self._factories:
+            raise ValueError(f"Unknown face detector '{name}', expected one of {self.names()}")
+        return self._deepface_backends[name]
+
+    def names(self):
+        return sorted(self._factories)
+
+    def _build(self, name):
+        if name not in self._factories:
+            raise ValueError(f"Unknown face detector '{name}', expected one of {self.names()}")
+
+        start = time.perf_counter()
+        detector = self._factories[name]()
+        build_seconds = time.perf_counter() - start
+
+        with self._lock:
+            timing = self.timings.setdefault(name, {"instances": 0, "build_seconds": 0.0})
+            timing["instances"] += 1
+            timing["build_seconds"] = round(timing["build_seconds"] + build_seconds, 4)
+        print(f"Built {name} detector in {build_seconds:.2f}s")
+        return detector
+
+    @contextmanager
+    def acquire(self, name):
+        """Check out a detector instance, building one if none is idle"""
+        with self._lock:
+            pool = self._idle.get(name)
+            detector = pool.pop() if pool else None
+        if detector is None:
+            detector = self._build(name)
+        try:
+            yield detector
+        finally:
+            with self._lock:
+                self._idle[name].append(detector)
+
+    def detect(self, name, image):
+        """
+        Detect faces with the named detector
+
+        Args:
+            name: Registered detector name
+            image: ImageContext or BGR image
+
+        Returns:
+            list: Box(x, y, w, h, confidence) per face
+        """
+        with self.acquire(name) as detector:
+            with metrics.timer(f'detect_{name}'):
+                boxes = detector.detect(image)
+        metrics.inc('model_invocations_total', model=name)
+        metrics.inc('faces_detected_total', len(boxes), detector=name)
+        return boxes
+
+    def preload(self, names):
+        """Build and warm up one instance of each named detector"""
+        dummy = np.random.randint(0, 255, (160, 160, 3), dtype=np.uint8)
+        for name in sorted(set(names)):
+            try:
+                with self.acquire(name) as detector:
+                    detector.detect(dummy)
+            except Exception as e:
+                print(f"Preloading {name} detector failed: {str(e)}")
+
+    def report(self):
+        """Instances built and total build time per detector"""
+        with self._lock:
+            return {name: dict(timing, idle=len(self._idle[name])) for name, timing in self.timings.items()}
+
+
+detectors = DetectorRegistry()
+detectors.register('haar', HaarDetector)
+detectors.register('opencv-dnn', DNNDetector)
+for backend in ('opencv', 'ssd', 'mtcnn', 'retinaface', 'mediapipe'):
+    detectors.register(backend, lambda backend=backend: DeepFaceDetector(backend), deepface_backend=backend)
@@ -1,48 +1,52 @@
-import os
-import cv2
 import numpy as np
-import requests
-import uuid
+from concurrent.futures import ThreadPoolExecutor
 from deepface import DeepFace
 from models.student import Student
-from services.cloudinary_service import CloudinaryService
-from utils.image_utils import check_image_quality
+from services.upload_queue import upload_queue
+from services.detector_registry import detectors
+from services.model_registry import registry, input_size
+from utils.image_utils import ImageContext, check_image_quality, fit_to_input
+from services.gallery_service import GalleryService
+from utils.embedding_utils import embedding_to_binary
+from utils.metrics import metrics
 from config.settings import (
     FACE_MODEL, 
     FACE_DETECTOR, 
-    FACE_DISTANCE_METRIC,
-    FACE_DISTANCE_THRESHOLD
+    UPLOAD_DETECTOR,
+    RECOGNITION_DETECTOR,
+    FACE_EMBEDDING_VERSION,
+    FACE_DISTANCE_THRESHOLD,
+    REGISTRATION_WORKERS
 )
 
 class FaceService:
     """Service for face detection and recognition operations"""
     
     @staticmethod
-    def detect_face(image_path):
+    def detect_face(image):
         """
         Detects if there's exactly one face in the image with good conditions
         
         Args:
-            image_path: Path to image file
+            image: ImageContext or path to image file
             
         Returns:
             tuple: (success, message)
         """
         try:
+            image = ImageContext.wrap(image)
+            
             # Check image quality first (brightness, blur, etc.)
-            quality_check, quality_message = check_image_quality(image_path)
+            with metrics.timer('quality'):
+                quality_check, quality_message = check_image_quality(image)
             if not quality_check:
                 return False, quality_message
             
-            # Use haar cascade for quick face detection
-            img = cv2.imread(image_path)
-            if img is None:
+            if image.bgr is None:
                 return False, "Failed to read image"
-                
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
             
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+            # Quick single-face check with the upload detector (haar cascade on the cached gray view by default)
+            faces = detectors.detect(UPLOAD_DETECTOR, image)
             
             if len(faces) == 0:
                 return False, "No face detected"
@@ -53,6 +57,83 @@ class FaceService:
         except Exception as e:
             return False, f"Error: {str(e)}"
     
+    @staticmethod
+    def compute_embedding(image):
+        """
+        Compute the face embedding of a single-face image
+        
+        Args:
+            image: ImageContext or path to image file
+            
+        Returns:
+            numpy.ndarray: Embedding vector, or None on failure
+        """
+        return FaceService.compute_embeddings([image])[0]
+    
+    @staticmethod
+    def compute_embeddings(images):
+        """
+        Compute the face embeddings of several single-face images in one batch:
+        every face is detected and aligned once, then all of them go through
+        the model in a single forward pass
+        
+        Args:
+            images: ImageContexts or paths to image files
+            
+        Returns:
+            list: Embedding vector (or None on failure) per image
+        """
+        embeddings = [None] * len(images)
+        try:
+            model = registry.get('embedder')
+            target_size = input_size(model)
+            
+            faces = []
+            positions = []
+            for position, image in enumerate(images):
+                face = FaceService.align_face(ImageContext.wrap(image))
+                if face is not None:
+                    faces.append(fit_to_input(face, target_size))
+                    positions.append(position)
+            if not faces:
+                return embeddings
+            
+            # DeepFace clients wrap the Keras model, older versions return it directly
+            keras_model = getattr(model, 'model', model)
+            with metrics.timer('embed'):
+                vectors = np.asarray(keras_model.predict(np.stack(faces), verbose=0), dtype=np.float32)
+            metrics.inc('model_invocations_total', model=FACE_MODEL)
+            
+            for position, vector in zip(positions, vectors.reshape(len(faces), -1)):
+                embeddings[position] = vector
+        except Exception as e:
+            print(f"Embedding error: {str(e)}")
+        return embeddings
+    
+    @staticmethod
+    def align_face(image):
+        """
+        Detect and align the face of a single-face image with FACE_DETECTOR
+        
+        Args:
+            image: ImageContext of the image
+            
+        Returns:
+            numpy.ndarray: Aligned RGB face in [0, 1], or None if the image could not be read
+        """
+        if image.bgr is None:
+            return None
+        
+        # DeepFace takes the decoded BGR array, so the file is not read again
+        with metrics.timer('align'):
+            faces = DeepFace.extract_faces(
+                img_path=image.bgr,
+                detector_backend=FACE_DETECTOR,
+                enforce_detection=False,
+                align=True
+            )
+        return faces[0]["face"] if faces else None
+    
     @staticmethod
     def process_student_image(image_path, name, roll_no, student_class, image_index):
         """
@@ -68,155 +149,201 @@ class FaceService:
         Returns:
             tuple: (success, message, student_id)
         """
+        # Decode the upload once for the quality check, detection and embedding
+        image = ImageContext(image_path)
+        
         # Check if face is valid
-        is_valid, message = FaceService.detect_face(image_path)
+        is_valid, message = FaceService.detect_face(image)
         if not is_valid:
             return False, message, None
         
-        # Upload to Cloudinary
-        student_folder = f"students/{name}_{roll_no}"
-        public_id = f"{student_folder}/image_{image_index}"
+        # Compute the embedding once so recognition never has to re-embed this image
+        embedding = FaceService.compute_embedding(image)
+        if embedding is None:
+            return False, "Failed to compute face embedding", None
         
-        upload_result = CloudinaryService.upload_image(
-            image_path=image_path,
-            folder=student_folder,
-            public_id=f"image_{image_index}"
-        )
-        
-        if not upload_result:
-            return False, "Failed to upload image", None
+        # The image is uploaded in the background, its URL is filled in when the upload finishes
+        upload_token = upload_queue.new_token()
         
         # Get or create student record
         student = Student.get_by_roll_no(roll_no)
         
         if student:
             student_id = str(student["_id"])
-            # Update image URLs array
-            image_urls = student.get("image_urls", [])
+            # Only the slot is written, so the gallery keeps the stored name and class
+            name, student_class = student["name"], student["class"]
+            # Embeddings from another model or pipeline version are not comparable, drop them
+            stale_embeddings = (student.get("embedding_model") != FACE_MODEL or
+                                student.get("embedding_version") != FACE_EMBEDDING_VERSION)
             
-            # If index already exists, replace it
-            while len(image_urls) <= image_index:
-                image_urls.append(None)
-                
-            image_urls[image_index] = upload_result["secure_url"]
-            Student.update_image_urls(student_id, image_urls)
+            # Replace only this slot, uploads of the other slots may be completing right now
+            Student.update_face_slot(
+                student_id, image_index, embedding_to_binary(embedding), upload_token, stale_embeddings
+            )
         else:
             # Create new student with first image
             image_urls = [None] * 5  # Create array with 5 None elements
-            image_urls[image_index] = upload_result["secure_url"]
-            student_id = Student.create(name, roll_no, student_class, image_urls)
+            face_embeddings = [None] * 5
+            face_embeddings[image_index] = embedding_to_binary(embedding)
+            student_id = Student.create(
+                name, roll_no, student_class, image_urls, face_embeddings, {image_index: upload_token}
+            )
+        
+        upload_queue.enqueue(
+            image_path, f"students/{name}_{roll_no}", f"image_{image_index}",
+            student_id, image_index, upload_token
+        )
+        
+        # Make the new embedding searchable without reloading the gallery
+        GalleryService.add_embeddings(student_id, name, roll_no, student_class, {image_index: embedding})
         
         return True, f"Image {image_index+1} processed successfully", student_id
     
     @staticmethod
-    def recognize_faces_in_group(group_image_path):
+    def register_student(image_paths, name, roll_no, student_class):
+        """
+        Register all images of a student in one call: every image is checked
+        in parallel and all of them are embedded in one batch, the student
+        record is written once and the images are uploaded in the background
+        
+        Args:
+            image_paths: Paths to the uploaded images, in slot order
+            name: Student name
+            roll_no: Student roll number
+            student_class: Student class
+        
+        Returns:
+            tuple: (success, message, student_id, errors) where errors lists
+            {"image_index", "message"} for every rejected image
+        """
+        images = [ImageContext(path) for path in image_paths]
+        
+        # Quality and single-face checks first, so nothing is embedded for a rejected batch
+        with ThreadPoolExecutor(max_workers=max(1, REGISTRATION_WORKERS)) as pool:
+            checks = list(pool.map(FaceService.detect_face, images))
+        errors = [
+            {"image_index": i, "message": message}
+            for i, (is_valid, message) in enumerate(checks) if not is_valid
+        ]
+        if errors:
+            return False, f"{len(errors)} of {len(images)} images were rejected", None, errors
+        
+        # One forward pass for all images instead of one model call per image
+        embeddings = FaceService.compute_embeddings(images)
+        errors = [
+            {"image_index": i, "message": "Failed to compute face embedding"}
+            for i, embedding in enumerate(embeddings) if embedding is None
+        ]
+        if errors:
+            return False, f"{len(errors)} of {len(images)} images could not be embedded", None, errors
+        
+        # Written once with empty URLs, the background uploads fill them in
+        upload_tokens = {slot: upload_queue.new_token() for slot in range(len(images))}
+        student_id = Student.save_registration(
+            name, roll_no, student_class,
+            [None] * len(images),
+            [embedding_to_binary(embedding) for embedding in embeddings],
+            upload_tokens
+        )
+        
+        for slot, token in upload_tokens.items():
+            upload_queue.enqueue(
+                image_paths[slot], f"students/{name}_{roll_no}", f"image_{slot}", student_id, slot, token
+            )
+        
+        # Make the new embeddings searchable without reloading the gallery
+        GalleryService.add_embeddings(student_id, name, roll_no, student_class, dict(enumerate(embeddings)))
+        
+        return True, f"All {len(images)} images processed successfully", student_id, []
+    
+    @staticmethod
+    def embed_group_faces(image):
+        """
+        Detect and embed every face of a group photo with RECOGNITION_DETECTOR
+        
+        Args:
+            image: ImageContext of the group photo
+            
+        Returns:
+            list: One embedding per detected face
+        """
+        backend = detectors.deepface_backend(RECOGNITION_DETECTOR)
+        if backend:
+            # DeepFace detects, aligns and embeds in one pass, like the registration images
+            with metrics.timer('detect_embed_group'):
+                detected_faces = DeepFace.represent(
+                    img_path=image.bgr,
+                    model_name=FACE_MODEL,
+                    detector_backend=backend,
+                    enforce_detection=True
+                )
+            metrics.inc('model_invocations_total', model=FACE_MODEL)
+            metrics.inc('faces_detected_total', len(detected_faces), detector=backend)
+            return [face["embedding"] for face in detected_faces]
+        
+        # OpenCV detectors only return boxes, embed each crop without detecting again
+        embeddings = []
+        image_height, image_width = image.bgr.shape[:2]
+        for x, y, w, h, _ in detectors.detect(RECOGNITION_DETECTOR, image):
+            # Boxes can reach past the image edge, negative starts would wrap the slice around
+            x_start, y_start = max(0, x), max(0, y)
+            x_end, y_end = min(image_width, x + w), min(image_height, y + h)
+            if x_end <= x_start or y_end <= y_start:
+                continue
+            with metrics.timer('embed'):
+                representations = DeepFace.represent(
+                    img_path=image.bgr[y_start:y_end, x_start:x_end],
+                    model_name=FACE_MODEL,
+                    detector_backend='skip',
+                    enforce_detection=False
+                )
+            metrics.inc('model_invocations_total', model=FACE_MODEL)
+            embeddings.append(representations[0]["embedding"])
+        return embeddings
+    
+    @staticmethod
+    def recognize_faces_in_group(group_image_path, classes=None):
         """
         Recognize students in a group photo
         
         Args:
             group_image_path: Path to group image
+            classes: Optional list of classes to search, all students when empty
             
         Returns:
             tuple: (success, message, recognized_students)
         """
         try:
+            # Decode once, DeepFace gets the same array the quality check used
+            image = ImageContext(group_image_path)
+            
             # Check image quality first
-            quality_check, quality_message = check_image_quality(group_image_path)
+            with metrics.timer('quality'):
+                quality_check, quality_message = check_image_quality(image)
             if not quality_check:
                 return False, quality_message, []
             
-            # Extract faces from the group photo
-            detected_faces = DeepFace.extract_faces(
-                img_path=group_image_path,
-                enforce_detection=True,
-                detector_backend=FACE_DETECTOR
-            )
+            # Detect and embed every face in the group photo
+            detected_faces = FaceService.embed_group_faces(image)
             
             if not detected_faces or len(detected_faces) == 0:
                 return False, "No faces detected in the group photo", []
                 
             print(f"Detected {len(detected_faces)} faces in the group photo")
             
-            # Get all students from database
-            all_students = Student.get_all()
-            recognized_students = []
+            # Match against the in-process gallery of embeddings stored at registration
+            face_embeddings = np.array(detected_faces, dtype=np.float32)
+            matches, _ = GalleryService.match(face_embeddings, FACE_DISTANCE_THRESHOLD, classes)
             
-            # For each student in the database
-            for student in all_students:
-                # Skip students with incomplete image data
-                image_urls = student.get("image_urls", [])
-                if not image_urls or len(image_urls) == 0 or None in image_urls:
-                    continue
-                    
-                student_id = str(student["_id"])
-                student_name = student["name"]
-                
-                # Create a temp folder for this verification
-                temp_student_folder = os.path.join("temp_uploads", f"temp_{student_id}")
-                os.makedirs(temp_student_folder, exist_ok=True)
-                
-                # Download and save at least one reference image
-                reference_img_path = None
-                
-
-                # Inside your loop over image_urls
-                for i, url in enumerate(image_urls):
-                    if url:
-                        try:
-                            response = requests.get(url, stream=True)
-                            if response.status_code == 200:
-                                temp_img_path = os.path.join(temp_student_folder, f"ref_{i}.jpg")
-                                with open(temp_img_path, 'wb') as out_file:
-                                    out_file.write(response.content)
-                                reference_img_path = temp_img_path
-                                break  # Stop after first valid image
-                        except Exception as e:
-                            print(f"Error downloading reference image: {str(e)}")
-
-                
-                # If we couldn't get a reference image, skip this student
-                if not reference_img_path:
+            recognized_students = []
+            for student in matches:
+                if student is None:
                     continue
-                
-                # Try to verify student against any of the detected faces
-                student_found = False
-                try:
-                    # For efficiency, we first check if any of the detected faces matches this student
-                    # Instead of creating multiple temp files, we could convert the faces to a format
-                    # that DeepFace.verify can accept directly in memory
-                    verification = DeepFace.verify(
-                        img1_path=group_image_path,
-                        img2_path=reference_img_path,
-                        model_name=FACE_MODEL,
-                        distance_metric=FACE_DISTANCE_METRIC,
-                        enforce_detection=False  # Already detected
-                    )
-                    
-                    if verification.get('verified', False):
-                        student_found = True
-                except Exception as e:
-                    print(f"Verification error for {student_name}: {str(e)}")
-                
-                # If student found, add to recognized list if not already there
-                if student_found:
-                    if not any(s.get('roll_no') == student['roll_no'] for s in recognized_students):
-                        recognized_students.append({
-                            'name': student['name'],
-                            'roll_no': student['roll_no'],
-                            'class': student['class']
-                        })
-                
-                # Clean up temp files
-                try:
-                    if os.path.exists(temp_student_folder):
-                        import shutil
-                        shutil.rmtree(temp_student_folder)
-                except Exception as e:
-                    print(f"Error cleaning up temp files: {str(e)}")
-            
-            # Check if number of recognized students exceeds number of detected faces
-            if len(recognized_students) > len(detected_faces):
-                return False, "Recognition error: more students recognized than faces detected", []
+                recognized_students.append({
+                    'name': student['name'],
+                    'roll_no': student['roll_no'],
+                    'class': student['class']
+                })
             
             return True, f"Successfully recognized {len(recognized_students)} students", recognized_students
             
@@ -0,0 +1,295 @@
+import os
+import json
+import threading
+import numpy as np
+from models.student import Student
+from utils.ann_index import create_index, load_index
+from utils.embedding_utils import binary_to_embedding, student_similarities, assign_faces
+from utils.metrics import metrics
+from config.settings import (
+    INDEX_FOLDER,
+    ANN_INDEX,
+    ANN_MIN_ROWS,
+    ANN_CANDIDATES
+)
+
+ANN_INDEX_PATH = os.path.join(INDEX_FOLDER, 'ann_index.npz')
+ANN_KEYS_PATH = os.path.join(INDEX_FOLDER, 'ann_index_keys.json')
+ANN_SAVE_EVERY = 1000  # Persist the ANN index after this many unsaved inserts
+
+class Gallery:
+    """
+    Stored embeddings of all registered students with an ANN index over them.
+    vectors and row_to_student are views into buffers that double when full,
+    so an incremental insert does not copy the whole gallery.
+    """
+
+    def __init__(self, index_kind=ANN_INDEX, ann_min_rows=ANN_MIN_ROWS):
+        self.students = []
+        self.positions = {}
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.row_keys = []
+        self.row_to_student = np.zeros(0, dtype=np.int64)
+        self._vector_buffer = self.vectors
+        self._student_buffer = self.row_to_student
+        self.key_rows = {}
+        self.class_rows = {}
+        self.index = create_index(index_kind)
+        self.ann_min_rows = ann_min_rows
+        self.unsaved = 0
+        self.lock = threading.Lock()
+
+    def _append_rows(self, student, slots, embeddings):
+        """
+        Append rows for one student, superseding older rows of the same slots and its old summary
+
+        Returns:
+            tuple: (first new row, superseded rows)
+        """
+        if student["id"] not in self.positions:
+            self.positions[student["id"]] = len(self.students)
+            self.students.append(student)
+        position = self.positions[student["id"]]
+
+        previous = self.students[position]
+        self.students[position] = student
+        if previous["class"] != student["class"]:
+            # Re-registered into another class, its remaining rows move to the new partition
+            old_rows = self.class_rows.get(previous["class"], [])
+            self.class_rows[previous["class"]] = [row for row in old_rows if self.row_to_student[row] != position]
+            self.class_rows.setdefault(student["class"], []).extend(
+                row for row in old_rows if self.row_to_student[row] == position
+            )
+
+        start = len(self.row_keys)
+        superseded = []
+        class_rows = self.class_rows.setdefault(student["class"], [])
+        for slot in slots:
+            key = (student["id"], slot)
+            if key in self.key_rows:
+                self.row_to_student[self.key_rows[key]] = -1
+                superseded.append(self.key_rows[key])
+            self.key_rows[key] = len(self.row_keys)
+            class_rows.append(len(self.row_keys))
+            self.row_keys.append(key)
+
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(slots), -1)
+        end = start + len(slots)
+        self._reserve(end, embeddings.shape[1])
+        self._vector_buffer[start:end] = embeddings
+        self._student_buffer[start:end] = position
+        self.vectors = self._vector_buffer[:end]
+        self.row_to_student = self._student_buffer[:end]
+        return start, superseded
+
+    def _reserve(self, rows, dim):
+        """Grow the row buffers to hold at least rows rows, doubling their capacity"""
+        if rows <= len(self._student_buffer):
+            return
+        capacity = max(rows, 2 * len(self._student_buffer), 64)
+        current = len(self.row_to_student)
+        vector_buffer = np.zeros((capacity, dim), dtype=np.float32)
+        if current:
+            vector_buffer[:current] = self.vectors
+        student_buffer = np.full(capacity, -1, dtype=np.int64)
+        student_buffer[:current] = self.row_to_student
+        self._vector_buffer = vector_buffer
+        self._student_buffer = student_buffer
+
+    def add(self, student, slot, embedding):
+        """
+        Incrementally insert one embedding
+
+        Args:
+            student: Dict with id, name, roll_no and class
+            slot: Image index (0-4)
+            embedding: Embedding vector
+        """
+        with self.lock:
+            row, superseded = self._append_rows(student, [slot], [embedding])
+            self.index.add(self.vectors[row:], [row])
+            # Superseded rows would otherwise take candidate slots in every search
+            self.index.remove(superseded)
+            self.unsaved += 1
+            if self.unsaved >= ANN_SAVE_EVERY:
+                self._save()
+
+    def build_index(self):
+        """Reuse the persisted index when it covers a prefix of the current rows, else rebuild it"""
+        with self.lock:
+            index = None
+            try:
+                index = load_index(ANN_INDEX_PATH)
+                with open(ANN_KEYS_PATH, "r") as f:
+                    saved_keys = [tuple(key) for key in json.load(f)]
+                if (index is None or index.kind != self.index.kind or len(index) != len(saved_keys) or
+                        saved_keys != self.row_keys[:len(saved_keys)]):
+                    index = None
+            except Exception:
+                index = None
+
+            if index is None:
+                index = create_index(self.index.kind)
+            if len(index) < len(self.row_keys):
+                start = len(index)
+                index.add(self.vectors[start:], np.arange(start, len(self.row_keys)))
+            index.remove(np.flatnonzero(self.row_to_student < 0))
+
+            self.index = index
+            self._save()
+
+    def _save(self):
+        self.index.save(ANN_INDEX_PATH)
+        with open(ANN_KEYS_PATH, "w") as f:
+            json.dump(self.row_keys, f)
+        self.unsaved = 0
+
+    def partition_size(self, classes):
+        """Number of active embeddings stored for the given classes"""
+        with self.lock:
+            return len(self._partition_rows(classes))
+
+    def _partition_rows(self, classes):
+        rows = [row for student_class in classes for row in self.class_rows.get(student_class, [])]
+        rows = np.asarray(rows, dtype=np.int64)
+        return rows[self.row_to_student[rows] >= 0]
+
+    def match(self, face_embeddings, threshold, classes=None):
+        """
+        Match face embeddings to students
+
+        Args:
+            face_embeddings: (F x D) array of face embeddings
+            threshold: Maximum cosine distance for a match
+            classes: Optional list of classes, only their partition is searched
+
+        Returns:
+            list: Student dict (or None) for every face
+        """
+        with self.lock:
+            active = self.row_to_student >= 0
+            num_students = len(self.students)
+
+            if classes:
+                # Class partitions are small, score them with one matrix multiply
+                rows = self._partition_rows(classes)
+                similarities = student_similarities(
+                    face_embeddings,
+                    self.vectors[rows] if len(rows) else np.zeros((0, 0), dtype=np.float32),
+                    self.row_to_student[rows],
+                    num_students
+                )
+            elif int(active.sum()) >= self.ann_min_rows and len(self.index) > 0:
+                # Only score the candidate rows returned by the ANN index
+                row_similarities, rows = self.index.search(face_embeddings, ANN_CANDIDATES)
+                row_students = np.where(rows >= 0, self.row_to_student[np.maximum(rows, 0)], -1)
+                similarities = np.full((len(rows), num_students), -np.inf, dtype=np.float32)
+                face_ids, candidate_ids = np.nonzero(row_students >= 0)
+                np.maximum.at(
+                    similarities,
+                    (face_ids, row_students[face_ids, candidate_ids]),
+                    row_similarities[face_ids, candidate_ids]
+                )
+            else:
+                similarities = student_similarities(
+                    face_embeddings,
+                    self.vectors[active],
+                    self.row_to_student[active],
+                    num_students
+                )
+
+            return [
+                self.students[index] if index is not None else None
+                for index in assign_faces(similarities, threshold)
+            ]
+
+class GalleryService:
+    """
+    Process-wide gallery loaded from MongoDB on first use, and again whenever
+    the gallery write version shows an enrolment by another process
+    """
+
+    _gallery = None
+    _version = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_gallery():
+        """Get the gallery, rebuilding it from MongoDB if it is missing or out of date"""
+        version = Student.get_gallery_version()
+        if GalleryService._gallery is None or version != GalleryService._version:
+            with GalleryService._lock:
+                if GalleryService._gallery is None or version != GalleryService._version:
+                    GalleryService._gallery = GalleryService._build()
+                    GalleryService._version = version
+        return GalleryService._gallery
+
+    @staticmethod
+    def _build():
+        gallery = Gallery()
+        # Only students registered with the current model, and only the fields matching needs
+        for student in Student.get_gallery_records():
+            slots = []
+            embeddings = []
+            for slot, data in enumerate(student.get("face_embeddings", [])):
+                if data is not None:
+                    slots.append(slot)
+                    embeddings.append(binary_to_embedding(data))
+            if not slots:
+                continue
+
+            gallery._append_rows(GalleryService._summary(student), slots, embeddings)
+
+        gallery.build_index()
+        print(f"Loaded gallery with {len(gallery.students)} students and {len(gallery.row_keys)} embeddings")
+        return gallery
+
+    @staticmethod
+    def _summary(student):
+        return {
+            "id": str(student["_id"]),
+            "name": student["name"],
+            "roll_no": student["roll_no"],
+            "class": student["class"]
+        }
+
+    @staticmethod
+    def add_embeddings(student_id, name, roll_no, student_class, embeddings):
+        """
+        Record an enrolment: bump the gallery write version and insert the
+        new embeddings if the gallery is already loaded
+
+        Args:
+            embeddings: Dict of slot -> embedding written for the student
+        """
+        version = Student.bump_gallery_version()
+        with GalleryService._lock:
+            if GalleryService._gallery is None:
+                return
+            student = {"id": student_id, "name": name, "roll_no": roll_no, "class": student_class}
+            for slot, embedding in embeddings.items():
+                GalleryService._gallery.add(student, slot, embedding)
+            # Still current only if no other process enrolled since the last load
+            if GalleryService._version == version - 1:
+                GalleryService._version = version
+
+    @staticmethod
+    def match(face_embeddings, threshold, classes=None):
+        """
+        Match face embeddings against the gallery
+
+        Args:
+            face_embeddings: (F x D) array of face embeddings
+            threshold: Maximum cosine distance for a match
+            classes: Optional list of classes to search, all students when empty
+
+        Returns:
+            tuple: (matches, classes) where classes is None if the global gallery was searched
+        """
+        with metrics.timer('gallery_load'):
+            gallery = GalleryService.get_gallery()
+        if classes and gallery.partition_size(classes) == 0:
+            print(f"No students enrolled in {classes}, falling back to global search")
+            classes = None
+        with metrics.timer('match'):
+            return gallery.match(face_embeddings, threshold, classes), classes
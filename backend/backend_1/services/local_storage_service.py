@@ -0,0 +1,52 @@
+import os
+import shutil
+from pathlib import Path
+from config.settings import LOCAL_STORAGE_FOLDER
+
+class LocalStorageService:
+    """Filesystem stand-in for CloudinaryService, for offline development and testing"""
+
+    @staticmethod
+    def upload_image(image_path, folder, public_id=None):
+        """
+        Copy an image into the local storage folder
+
+        Args:
+            image_path: Local path to image
+            folder: Folder to store image in
+            public_id: Custom public ID for the image
+
+        Returns:
+            dict: Cloudinary-like response with public_id and secure_url (a file:// URL)
+        """
+        public_id = public_id or Path(image_path).stem
+        extension = Path(image_path).suffix or '.jpg'
+
+        try:
+            target_folder = os.path.join(LOCAL_STORAGE_FOLDER, folder)
+            os.makedirs(target_folder, exist_ok=True)
+            target_path = os.path.join(target_folder, public_id + extension)
+            shutil.copyfile(image_path, target_path)
+            return {
+                "public_id": f"{folder}/{public_id}",
+                "secure_url": Path(target_path).resolve().as_uri()
+            }
+        except Exception as e:
+            print(f"Local storage upload error: {str(e)}")
+            return None
+
+    @staticmethod
+    def delete_image(public_id):
+        """Delete an image from the local storage folder"""
+        try:
+            folder = os.path.join(LOCAL_STORAGE_FOLDER, os.path.dirname(public_id))
+            name = os.path.basename(public_id)
+            deleted = 0
+            for filename in os.listdir(folder):
+                if os.path.splitext(filename)[0] == name:
+                    os.remove(os.path.join(folder, filename))
+                    deleted += 1
+            return {"result": "ok" if deleted else "not found"}
+        except Exception as e:
+            print(f"Local storage delete error: {str(e)}")
+            return None
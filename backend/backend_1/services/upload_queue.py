@@ -0,0 +1,190 @@
+import os
+import json
+import uuid
+import queue
+import shutil
+import threading
+from models.student import Student
+from utils.metrics import metrics
+from config.settings import (
+    STORAGE_BACKEND,
+    UPLOAD_SPOOL_FOLDER,
+    UPLOAD_WORKERS,
+    UPLOAD_QUEUE_DEPTH,
+    UPLOAD_MAX_ATTEMPTS,
+    UPLOAD_RETRY_BACKOFF
+)
+
+def get_storage():
+    """Storage service selected by STORAGE_BACKEND, imported lazily so 'local' needs no Cloudinary SDK"""
+    if STORAGE_BACKEND == 'local':
+        from services.local_storage_service import LocalStorageService
+        return LocalStorageService
+    from services.cloudinary_service import CloudinaryService
+    return CloudinaryService
+
+class UploadQueue:
+    """
+    Uploads registration images in the background and patches the student's
+    image_urls slot with the secure_url once an upload succeeds.
+
+    Each image is moved into the spool folder next to a small JSON task file,
+    so uploads still waiting when the process stops are queued again by
+    resume(). Failed uploads are retried with exponential backoff. A
+    student's pending_uploads entry for the slot holds the token of the
+    latest upload, so an older upload finishing late never overwrites a
+    newer image.
+    """
+
+    def __init__(self, storage=None, spool_folder=UPLOAD_SPOOL_FOLDER, workers=UPLOAD_WORKERS,
+                 max_queue=UPLOAD_QUEUE_DEPTH, max_attempts=UPLOAD_MAX_ATTEMPTS, backoff=UPLOAD_RETRY_BACKOFF):
+        self.storage = storage
+        self.spool_folder = spool_folder
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.started = False
+        self.in_flight = 0
+
+    def start(self):
+        """Start the worker threads, once"""
+        with self.lock:
+            if self.started:
+                return self
+            self.started = True
+        if self.storage is None:
+            self.storage = get_storage()
+        os.makedirs(self.spool_folder, exist_ok=True)
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"upload-worker-{i}", daemon=True).start()
+        return self
+
+    @staticmethod
+    def new_token():
+        """Token identifying one upload of a student image slot"""
+        return uuid.uuid4().hex
+
+    def enqueue(self, image_path, folder, public_id, student_id, slot, token):
+        """
+        Move an image into the spool folder and queue its upload
+
+        Args:
+            image_path: Local path to image, moved into the spool folder
+            folder: Storage folder
+            public_id: Public ID of the image in the folder
+            student_id: Student whose image_urls slot is patched
+            slot: Index in image_urls
+            token: Token stored in the student's pending_uploads for the slot
+
+        Returns:
+            bool: False if the queue was full and the image was uploaded inline
+        """
+        self.start()
+        spooled_path = os.path.join(self.spool_folder, f"{token}{os.path.splitext(image_path)[1] or '.jpg'}")
+        shutil.move(image_path, spooled_path)
+
+        task = {
+            "image_path": spooled_path,
+            "folder": folder,
+            "public_id": public_id,
+            "student_id": student_id,
+            "slot": slot,
+            "token": token,
+            "attempt": 0
+        }
+        with open(self._task_path(token), "w") as f:
+            json.dump(task, f)
+
+        try:
+            self.queue.put_nowait(task)
+            return True
+        except queue.Full:
+            # Back-pressure: pay the upload in the request rather than dropping it
+            self._upload(task)
+            return False
+
+    def resume(self):
+        """Queue the uploads left in the spool folder by a previous process"""
+        self.start()
+        resumed = 0
+        for filename in sorted(os.listdir(self.spool_folder)):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.spool_folder, filename), "r") as f:
+                    task = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping unreadable upload task {filename}: {str(e)}")
+                continue
+            if not os.path.exists(task["image_path"]):
+                os.remove(os.path.join(self.spool_folder, filename))
+                continue
+            task["attempt"] = 0
+            self.queue.put(task)
+            resumed += 1
+        if resumed:
+            print(f"Resumed {resumed} pending image uploads")
+        return resumed
+
+    def pending(self):
+        """Uploads queued or running"""
+        with self.lock:
+            return self.queue.qsize() + self.in_flight
+
+    def _task_path(self, token):
+        return os.path.join(self.spool_folder, f"{token}.json")
+
+    def _work(self):
+        while True:
+            task = self.queue.get()
+            with self.lock:
+                self.in_flight += 1
+            try:
+                self._upload(task)
+            except Exception as e:
+                print(f"Upload worker error: {str(e)}")
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+                self.queue.task_done()
+
+    def _upload(self, task):
+        task["attempt"] += 1
+        with metrics.timer('cloudinary_upload'):
+            result = self.storage.upload_image(
+                image_path=task["image_path"],
+                folder=task["folder"],
+                public_id=task["public_id"]
+            )
+
+        if not result:
+            if task["attempt"] < self.max_attempts:
+                metrics.inc('cloudinary_uploads_total', result='retry')
+                delay = self.backoff * 2 ** (task["attempt"] - 1)
+                timer = threading.Timer(delay, self.queue.put, args=(task,))
+                timer.daemon = True
+                timer.start()
+                return
+            # Keep the spooled image and task, the next resume() tries again
+            metrics.inc('cloudinary_uploads_total', result='failed')
+            print(f"Giving up uploading {task['public_id']} for student {task['student_id']} "
+                  f"after {task['attempt']} attempts")
+            return
+
+        metrics.inc('cloudinary_uploads_total', result='ok')
+        if not Student.complete_upload(task["student_id"], task["slot"], task["token"], result["secure_url"]):
+            print(f"Upload of {task['public_id']} was superseded by a newer image")
+
+        for path in (task["image_path"], self._task_path(task["token"])):
+            if os.path.exists(path):
+                os.remove(path)
+
+upload_queue = UploadQueue()
+
+def init_upload_queue(app):
+    """Start the upload workers and queue uploads left over from the last run"""
+    upload_queue.resume()
+    app.extensions['upload_queue'] = upload_queue
+    return upload_queue
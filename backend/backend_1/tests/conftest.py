@@ -0,0 +1,22 @@
+import os
+import sys
+import pytest
+
+# Settings are read at import, so select the in-memory database and local storage first
+os.environ.setdefault('MONGODB_URI', 'mongomock://localhost')
+os.environ.setdefault('STORAGE_BACKEND', 'local')
+os.environ.setdefault('PRELOAD_MODELS', 'false')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def student_model(tmp_path, monkeypatch):
+    """models.student backed by an empty mongomock database, with relative folders under tmp_path"""
+    pytest.importorskip('dotenv')
+    pytest.importorskip('pymongo')
+    pytest.importorskip('mongomock')
+    monkeypatch.chdir(tmp_path)
+
+    from models import student
+    student.students.drop()
+    student.meta.drop()
+    return student
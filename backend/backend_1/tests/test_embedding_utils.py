@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('bson')
+
+from utils.embedding_utils import assign_faces, match_faces
+
+def test_assign_faces_is_one_to_one():
+    similarities = np.array([
+        [0.9, 0.8],
+        [0.85, 0.1]
+    ], dtype=np.float32)
+
+    # Greedy would give face 0 student 0 and leave face 1 unmatched
+    assert assign_faces(similarities, 0.4) == [1, 0]
+
+def test_assign_faces_respects_threshold():
+    similarities = np.array([[0.65, 0.55]], dtype=np.float32)
+
+    assert assign_faces(similarities, 0.4) == [0]
+    assert assign_faces(similarities, 0.3) == [None]
+
+def test_assign_faces_never_matches_non_positive_similarity():
+    # A threshold above 1 would admit these pairs on distance alone
+    similarities = np.array([
+        [0.0, -0.5],
+        [-0.3, -0.2]
+    ], dtype=np.float32)
+
+    assert assign_faces(similarities, 1.5) == [None, None]
+
+def test_assign_faces_without_faces_or_students():
+    assert assign_faces(np.zeros((0, 3), dtype=np.float32), 0.4) == []
+    assert assign_faces(np.zeros((2, 0), dtype=np.float32), 0.4) == [None, None]
+
+def test_match_faces_uses_best_row_of_each_student():
+    gallery = np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float32)
+    faces = np.array([[0, 0.1, 1], [0.05, 1, 0], [0.5, 0.5, 0.5]], dtype=np.float32)
+
+    # Student 0 owns rows 0 and 2, student 1 owns row 1
+    assert match_faces(faces, gallery, [0, 1, 0], 2, 0.4) == [0, 1, None]
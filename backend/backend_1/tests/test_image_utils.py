@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('dotenv')
+cv2 = pytest.importorskip('cv2')
+
+from utils.image_utils import ImageContext, check_image_quality
+
+def smooth_texture(width, height, sigma, amplitude, seed=0):
+    """Gray noise blurred to low-frequency content, around the blur threshold for small amplitudes"""
+    noise = np.random.default_rng(seed).standard_normal((height, width)).astype(np.float32)
+    texture = cv2.GaussianBlur(noise, (0, 0), sigma)
+    texture = 128 + amplitude * texture / texture.std()
+    return cv2.cvtColor(np.clip(texture, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+@pytest.mark.parametrize("width, height", [(2000, 1500), (4000, 3000)])
+def test_proxy_never_accepts_what_full_rejects(width, height):
+    for sigma in (2, 3, 6):
+        for amplitude in (20, 40, 80):
+            image = smooth_texture(width, height, sigma, amplitude)
+            full_passed, _ = check_image_quality(ImageContext(image=image), mode='full')
+            proxy_passed, message = check_image_quality(ImageContext(image=image), mode='proxy')
+            assert full_passed or not proxy_passed, (sigma, amplitude, message)
+
+def test_proxy_rejects_with_full_resolution_messages():
+    dark = np.full((1500, 2000, 3), 20, dtype=np.uint8)
+    small = np.full((100, 100, 3), 128, dtype=np.uint8)
+
+    assert check_image_quality(ImageContext(image=dark), mode='proxy') == \
+        check_image_quality(ImageContext(image=dark), mode='full')
+    assert check_image_quality(ImageContext(image=small), mode='proxy') == \
+        (False, "Image resolution too low")
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import pytest
+
+EMBEDDING_SIZE = 128
+
+@pytest.fixture
+def gallery_service(student_model):
+    """GalleryService with no gallery loaded yet"""
+    from config.settings import INDEX_FOLDER
+    from services.gallery_service import GalleryService
+    os.makedirs(INDEX_FOLDER, exist_ok=True)
+    GalleryService._gallery = None
+    GalleryService._version = None
+    yield GalleryService
+    GalleryService._gallery = None
+    GalleryService._version = None
+
+def register(student_model, roll_no, student_class="10A", model=None):
+    from utils.embedding_utils import embedding_to_binary
+    embedding = np.random.default_rng(int(roll_no)).standard_normal(EMBEDDING_SIZE).astype(np.float32)
+    student_id = student_model.Student.create(
+        f"Student {roll_no}", roll_no, student_class, [None] * 5, [embedding_to_binary(embedding)] + [None] * 4
+    )
+    if model:
+        student_model.students.update_one({"roll_no": roll_no}, {"$set": {"embedding_model": model}})
+    return student_id, embedding
+
+def test_ensure_indexes_creates_lookup_indexes(student_model):
+    student_model.Student.ensure_indexes()
+
+    keys = [index["key"] for index in student_model.students.index_information().values()]
+    assert [("roll_no", 1)] in keys
+    assert [("class", 1)] in keys
+    assert [("name", 1), ("roll_no", 1)] in keys
+
+def test_gallery_records_are_projected_to_current_model(student_model):
+    register(student_model, "1")
+    register(student_model, "2", model="VGG-Face")
+
+    records = list(student_model.Student.get_gallery_records())
+
+    assert [record["roll_no"] for record in records] == ["1"]
+    assert set(records[0]) == {"_id", "name", "roll_no", "class", "face_embeddings"}
+
+def test_gallery_version_counts_enrolments(student_model):
+    assert student_model.Student.get_gallery_version() == 0
+    assert student_model.Student.bump_gallery_version() == 1
+    assert student_model.Student.bump_gallery_version() == 2
+    assert student_model.Student.get_gallery_version() == 2
+
+def test_own_enrolment_keeps_cached_gallery(gallery_service, student_model):
+    register(student_model, "1")
+    gallery = gallery_service.get_gallery()
+    assert len(gallery.students) == 1
+
+    student_id, embedding = register(student_model, "2")
+    gallery_service.add_embeddings(student_id, "Student 2", "2", "10A", {0: embedding})
+
+    assert gallery_service.get_gallery() is gallery
+    assert len(gallery.students) == 2
+
+def test_enrolment_by_another_process_rebuilds_gallery(gallery_service, student_model):
+    register(student_model, "1")
+    gallery = gallery_service.get_gallery()
+
+    # Another process writes a student and bumps the version, this process never saw the insert
+    register(student_model, "2")
+    student_model.Student.bump_gallery_version()
+
+    rebuilt = gallery_service.get_gallery()
+    assert rebuilt is not gallery
+    assert sorted(student["roll_no"] for student in rebuilt.students) == ["1", "2"]
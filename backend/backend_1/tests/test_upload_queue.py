@@ -0,0 +1,88 @@
+import os
+import numpy as np
+import pytest
+
+@pytest.fixture
+def queue(student_model, tmp_path):
+    """UploadQueue storing images on disk with one worker and no retry delay"""
+    from services.local_storage_service import LocalStorageService
+    from services.upload_queue import UploadQueue
+    return UploadQueue(storage=LocalStorageService, spool_folder=str(tmp_path / "spool"), workers=1, backoff=0)
+
+def create_student(student_model, slot, token):
+    from utils.embedding_utils import embedding_to_binary
+    face_embeddings = [None] * 5
+    face_embeddings[slot] = embedding_to_binary(np.ones(128))
+    return student_model.Student.create("Student 1", "1", "10A", [None] * 5, face_embeddings, {slot: token})
+
+def write_image(tmp_path, name="upload.jpg"):
+    image_path = tmp_path / name
+    image_path.write_bytes(b"jpeg bytes")
+    return str(image_path)
+
+def test_upload_patches_url_and_cleans_spool(queue, student_model, tmp_path):
+    token = queue.new_token()
+    student_id = create_student(student_model, 2, token)
+    image_path = write_image(tmp_path)
+
+    assert queue.enqueue(image_path, "students/Student 1_1", "image_2", student_id, 2, token)
+    queue.queue.join()
+
+    student = student_model.Student.get_by_id(student_id)
+    assert student["image_urls"][2].startswith("file://")
+    assert os.path.exists(tmp_path / "local_storage" / "students" / "Student 1_1" / "image_2.jpg")
+    assert "2" not in student["pending_uploads"]
+    assert not os.path.exists(image_path)
+    assert os.listdir(queue.spool_folder) == []
+    assert queue.pending() == 0
+
+def test_superseded_upload_keeps_newer_slot(queue, student_model, tmp_path):
+    old_token, new_token = queue.new_token(), queue.new_token()
+    student_id = create_student(student_model, 0, new_token)
+
+    queue.enqueue(write_image(tmp_path), "students/Student 1_1", "image_0", student_id, 0, old_token)
+    queue.queue.join()
+
+    student = student_model.Student.get_by_id(student_id)
+    assert student["image_urls"][0] is None
+    assert student["pending_uploads"]["0"] == new_token
+
+def test_resume_uploads_spooled_images(student_model, tmp_path):
+    from services.local_storage_service import LocalStorageService
+    from services.upload_queue import UploadQueue
+
+    class Offline:
+        @staticmethod
+        def upload_image(image_path, folder, public_id=None):
+            return None
+
+    spool_folder = str(tmp_path / "spool")
+    stopped = UploadQueue(storage=Offline, spool_folder=spool_folder, workers=1, max_attempts=1)
+    token = stopped.new_token()
+    student_id = create_student(student_model, 1, token)
+    stopped.enqueue(write_image(tmp_path), "students/Student 1_1", "image_1", student_id, 1, token)
+    stopped.queue.join()
+    assert len(os.listdir(spool_folder)) == 2
+
+    restarted = UploadQueue(storage=LocalStorageService, spool_folder=spool_folder, workers=1)
+    assert restarted.resume() == 1
+    restarted.queue.join()
+
+    assert student_model.Student.get_by_id(student_id)["image_urls"][1].startswith("file://")
+    assert os.listdir(spool_folder) == []
+
+def test_update_face_slot_keeps_other_slots(student_model):
+    from utils.embedding_utils import embedding_to_binary
+    student_id = create_student(student_model, 0, "old")
+    student_model.students.update_one(
+        {"_id": student_model.ObjectId(student_id)}, {"$set": {"image_urls.0": "https://example.com/image_0.jpg"}}
+    )
+
+    student_model.Student.update_face_slot(student_id, 3, embedding_to_binary(np.ones(128)), "new")
+
+    student = student_model.Student.get_by_id(student_id)
+    assert student["image_urls"][0] == "https://example.com/image_0.jpg"
+    assert student["image_urls"][3] is None
+    assert student["face_embeddings"][0] is not None
+    assert student["face_embeddings"][3] is not None
+    assert student["pending_uploads"] == {"0": "old", "3": "new"}
@@ -0,0 +1,254 @@
+import os
+import threading
+import numpy as np
+
+from config.settings import ANN_NPROBE
+
+# This file is a copy of backend_2/ann_index.py, keep the two identical apart from the settings
+ANN_NLIST = None  # Number of IVF lists, None picks ~sqrt(N)
+
+
+def _normalize(vectors, dim):
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, dim)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _grow(buffer, rows, capacity):
+    """Copy of buffer with room for capacity rows, only the first rows are kept"""
+    grown = np.zeros((capacity,) + buffer.shape[1:], dtype=buffer.dtype)
+    grown[:rows] = buffer[:rows]
+    return grown
+
+
+def _top_k(scores, ids, k):
+    """Best k (score, id) pairs, highest score first"""
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        scores, ids = scores[keep], ids[keep]
+    order = np.argsort(-scores, kind='stable')
+    return scores[order], ids[order]
+
+
+class ExactIndex:
+    """
+    Brute-force cosine search over every stored vector. Reference for recall
+    measurements and the right choice for galleries of this app's size.
+
+    Vectors and ids are views into buffers that double when full, so inserts
+    cost amortised O(rows inserted). Removed ids are overwritten with -1 and
+    never returned; len() still counts their rows so row positions stay stable.
+    """
+
+    kind = 'exact'
+
+    def __init__(self, dim=128):
+        self.dim = dim
+        self.lock = threading.Lock()
+        self._set_arrays(np.zeros((0, dim), dtype=np.float32), np.zeros(0, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _set_arrays(self, vectors, ids):
+        self._vector_buffer = vectors
+        self._id_buffer = ids
+        self.vectors = vectors
+        self.ids = ids
+        self.removed = int(np.count_nonzero(ids < 0))
+
+    def _append(self, vectors, ids):
+        """Write rows after the current ones, growing the buffers when full. Caller holds the lock."""
+        start = len(self.ids)
+        end = start + len(vectors)
+        if end > len(self._id_buffer):
+            capacity = max(end, 2 * len(self._id_buffer), 64)
+            self._vector_buffer = _grow(self._vector_buffer, start, capacity)
+            self._id_buffer = _grow(self._id_buffer, start, capacity)
+        self._vector_buffer[start:end] = vectors
+        self._id_buffer[start:end] = ids
+        # New views, searches holding the old ones never see the new rows half-written
+        self.vectors = self._vector_buffer[:end]
+        self.ids = self._id_buffer[:end]
+
+    def add(self, vectors, ids):
+        """Insert vectors labelled with integer ids"""
+        vectors = _normalize(vectors, self.dim)
+        with self.lock:
+            self._append(vectors, np.asarray(ids, dtype=np.int64))
+
+    def remove(self, ids):
+        """Stop returning the given ids, e.g. rows superseded by a newer embedding of the same slot"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return
+        with self.lock:
+            removed = np.isin(self.ids, ids) & (self.ids >= 0)
+            self.ids[removed] = -1
+            self.removed += int(np.count_nonzero(removed))
+
+    def search(self, queries, k=10):
+        """
+        Find the k most similar stored vectors for every query
+
+        Returns:
+            (similarities, ids): two (Q x k) arrays, ids are -1 where fewer than k results exist
+        """
+        queries = _normalize(queries, self.dim)
+        similarities = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+
+        # add() replaces both arrays, so a pair read under the lock stays consistent
+        with self.lock:
+            vectors, row_ids = self.vectors, self.ids
+        if len(row_ids) == 0:
+            return similarities, ids
+
+        scores = queries @ vectors.T
+        if self.removed:
+            scores[:, row_ids < 0] = -np.inf
+        for q in range(len(queries)):
+            top_scores, top_ids = _top_k(scores[q], row_ids, k)
+            similarities[q, :len(top_scores)] = top_scores
+            ids[q, :len(top_ids)] = top_ids
+        return similarities, ids
+
+    def save(self, path):
+        with self.lock:
+            np.savez(path, kind=self.kind, dim=self.dim, vectors=self.vectors, ids=self.ids)
+
+    @classmethod
+    def from_arrays(cls, data):
+        index = cls(int(data['dim']))
+        index._set_arrays(data['vectors'].astype(np.float32), data['ids'].astype(np.int64))
+        return index
+
+
+class IVFIndex(ExactIndex):
+    """
+    Inverted-file index: vectors are bucketed by their nearest k-means centroid
+    and a query only scans the nprobe closest buckets. The centroids are
+    retrained once the index has grown well past the size it was trained on.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, dim=128, nlist=ANN_NLIST, nprobe=ANN_NPROBE, seed=0):
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.seed = seed
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self.assignments = np.zeros(0, dtype=np.int64)
+        self.trained_size = 0
+        self._lists = None
+
+    def _train(self, iterations=10):
+        """Spherical k-means over (a sample of) the stored vectors"""
+        n = len(self.vectors)
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+
+        rng = np.random.default_rng(self.seed)
+        sample = self.vectors
+        if n > nlist * 256:
+            sample = self.vectors[rng.choice(n, nlist * 256, replace=False)]
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            # Empty clusters keep their previous centroid
+            filled = counts > 0
+            centroids[filled] = _normalize(sums[filled], self.dim)
+
+        self.centroids = centroids
+        self.assignments = np.argmax(self.vectors @ centroids.T, axis=1).astype(np.int64)
+        self.trained_size = n
+        self._lists = None
+
+    def add(self, vectors, ids):
+        vectors = _normalize(vectors, self.dim)
+        with self.lock:
+            self._append(vectors, np.asarray(ids, dtype=np.int64))
+
+            if len(self.centroids) == 0 or len(self.vectors) > 4 * max(1, self.trained_size):
+                self._train()
+            else:
+                new_assignments = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int64)
+                self.assignments = np.concatenate([self.assignments, new_assignments])
+                self._lists = None
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind='stable')
+            bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        return self._lists
+
+    def search(self, queries, k=10):
+        queries = _normalize(queries, self.dim)
+        similarities = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        if len(self.ids) == 0:
+            return similarities, ids
+
+        with self.lock:
+            lists = self._inverted_lists()
+            nprobe = min(self.nprobe, len(self.centroids))
+            centroid_scores = queries @ self.centroids.T
+            probes = np.argsort(-centroid_scores, axis=1)[:, :nprobe]
+
+            for q in range(len(queries)):
+                rows = np.concatenate([lists[c] for c in probes[q]])
+                if self.removed:
+                    rows = rows[self.ids[rows] >= 0]
+                if len(rows) == 0:
+                    continue
+                scores = self.vectors[rows] @ queries[q]
+                top_scores, top_ids = _top_k(scores, self.ids[rows], k)
+                similarities[q, :len(top_scores)] = top_scores
+                ids[q, :len(top_ids)] = top_ids
+
+        return similarities, ids
+
+    def save(self, path):
+        with self.lock:
+            np.savez(
+                path, kind=self.kind, dim=self.dim, vectors=self.vectors, ids=self.ids,
+                centroids=self.centroids, assignments=self.assignments,
+                trained_size=self.trained_size, nprobe=self.nprobe
+            )
+
+    @classmethod
+    def from_arrays(cls, data):
+        index = cls(int(data['dim']), nprobe=int(data['nprobe']))
+        index._set_arrays(data['vectors'].astype(np.float32), data['ids'].astype(np.int64))
+        index.centroids = data['centroids'].astype(np.float32)
+        index.assignments = data['assignments'].astype(np.int64)
+        index.trained_size = int(data['trained_size'])
+        return index
+
+
+INDEX_TYPES = {
+    ExactIndex.kind: ExactIndex,
+    IVFIndex.kind: IVFIndex,
+}
+
+
+def create_index(kind, dim=128, **kwargs):
+    """Create an empty index of the given kind ('exact' or 'ivf')"""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown ANN index type: {kind}")
+    return INDEX_TYPES[kind](dim, **kwargs)
+
+
+def load_index(path):
+    """Load an index written by save(), None if the file does not exist"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return INDEX_TYPES[str(data['kind'])].from_arrays(data)
@@ -0,0 +1,124 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from bson.binary import Binary
+
+def embedding_to_binary(embedding):
+    """
+    Pack an embedding into a compact BSON binary field
+
+    Args:
+        embedding: Sequence of floats
+
+    Returns:
+        Binary: float32 bytes of the embedding
+    """
+    return Binary(np.asarray(embedding, dtype=np.float32).flatten().tobytes())
+
+def binary_to_embedding(data):
+    """
+    Unpack an embedding stored with embedding_to_binary
+
+    Args:
+        data: Stored bytes
+
+    Returns:
+        numpy.ndarray: float32 vector
+    """
+    return np.frombuffer(bytes(data), dtype=np.float32)
+
+def normalize_rows(vectors):
+    """
+    L2-normalise each row so a dot product equals cosine similarity
+
+    Args:
+        vectors: 2D array of embeddings
+
+    Returns:
+        numpy.ndarray: Normalised float32 copy
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def student_similarities(face_embeddings, gallery, row_to_student, num_students):
+    """
+    Best cosine similarity of every face against each student's stored embeddings
+
+    Args:
+        face_embeddings: (F x D) array of face embeddings
+        gallery: (N x D) array of stored student embeddings
+        row_to_student: Student index for every gallery row
+        num_students: Number of students referenced by row_to_student
+
+    Returns:
+        numpy.ndarray: (F x S) similarities, -inf for students without rows
+    """
+    face_embeddings = np.asarray(face_embeddings, dtype=np.float32)
+    similarities = np.full((len(face_embeddings), num_students), -np.inf, dtype=np.float32)
+    if len(face_embeddings) == 0 or len(gallery) == 0:
+        return similarities
+
+    row_similarities = normalize_rows(face_embeddings) @ normalize_rows(gallery).T
+    np.maximum.at(similarities.T, np.asarray(row_to_student), row_similarities.T)
+    return similarities
+
+def assign_faces(similarities, threshold):
+    """
+    Optimal one-to-one assignment of faces to students (Hungarian algorithm),
+    maximising the total similarity over pairs under the distance threshold
+
+    Args:
+        similarities: (F x S) face to student similarities
+        threshold: Maximum cosine distance for a match
+
+    Returns:
+        list: Student index (or None) for every face
+    """
+    num_faces, num_students = similarities.shape
+    matches = [None] * num_faces
+    if num_faces == 0 or num_students == 0:
+        return matches
+
+    # Same validity rule as backend_2's matcher: a match needs a positive similarity under the threshold
+    valid = (similarities > 0) & ((1 - similarities) < threshold)
+    scores = np.where(valid, similarities, -np.inf)
+
+    # Other faces can take at most F-1 students, so some optimal assignment
+    # only uses each face's top F candidates: solve on the union of those columns
+    top = min(num_faces, num_students)
+    candidates = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    columns = np.unique(candidates[np.isfinite(candidate_scores)])
+    if len(columns) == 0:
+        return matches
+
+    sub_scores = scores[:, columns]
+    # One zero-cost "unassigned" column per face, invalid pairs cost more than staying unassigned
+    cost = np.hstack([
+        np.where(np.isfinite(sub_scores), -sub_scores, 1.0),
+        np.zeros((num_faces, num_faces), dtype=np.float32)
+    ])
+    face_ids, column_ids = linear_sum_assignment(cost)
+
+    for face, column in zip(face_ids, column_ids):
+        if column < len(columns) and np.isfinite(sub_scores[face, column]):
+            matches[face] = int(columns[column])
+    return matches
+
+def match_faces(face_embeddings, gallery, row_to_student, num_students, threshold):
+    """
+    Match group photo faces to students using cosine distance
+
+    Args:
+        face_embeddings: (F x D) array of face embeddings
+        gallery: (N x D) array of stored student embeddings
+        row_to_student: Student index for every gallery row
+        num_students: Number of students referenced by row_to_student
+        threshold: Maximum cosine distance for a match
+
+    Returns:
+        list: Student index (or None) for every face, each student used at most once
+    """
+    similarities = student_similarities(face_embeddings, gallery, row_to_student, num_students)
+    return assign_faces(similarities, threshold)
@@ -1,42 +1,209 @@
 import cv2
 import numpy as np
+from utils.metrics import metrics
+from config.settings import (
+    QUALITY_CHECK_MODE,
+    QUALITY_PROXY_MAX_SIDE,
+    QUALITY_BLUR_SCALE_EXPONENT,
+    QUALITY_PROXY_MARGIN
+)
 
-def check_image_quality(image_path):
+MIN_BRIGHTNESS = 50
+MAX_BRIGHTNESS = 240
+MIN_BLUR_VARIANCE = 30  # Laplacian variance of the full-resolution image
+MIN_IMAGE_SIZE = 200
+BRIGHTNESS_MARGIN = 1.0  # Proxy means this close to a brightness limit are recomputed at full resolution
+
+class ImageContext:
+    """
+    An uploaded image decoded at most once, with derived views (RGB, gray,
+    downscaled) computed on first use and cached for the rest of the request
+    """
+
+    def __init__(self, image_path=None, image=None):
+        """
+        Args:
+            image_path: Path to the image file, decoded lazily
+            image: Already decoded BGR image
+        """
+        self.image_path = image_path
+        self._bgr = image
+        self._decoded = image is not None
+        self._views = {}
+
+    @staticmethod
+    def wrap(image):
+        """Accept either an ImageContext or a path"""
+        return image if isinstance(image, ImageContext) else ImageContext(image)
+
+    @property
+    def bgr(self):
+        """Decoded BGR image, None if the file could not be read"""
+        if not self._decoded:
+            with metrics.timer('decode'):
+                self._bgr = cv2.imread(self.image_path)
+            self._decoded = True
+        return self._bgr
+
+    def _view(self, key, build):
+        if key not in self._views:
+            self._views[key] = build() if self.bgr is not None else None
+        return self._views[key]
+
+    @property
+    def rgb(self):
+        return self._view('rgb', lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB))
+
+    @property
+    def gray(self):
+        return self._view('gray', lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def shape(self):
+        return self.bgr.shape if self.bgr is not None else None
+
+    def downscaled(self, max_side):
+        """
+        BGR image shrunk so its longer side is at most max_side
+
+        Returns:
+            tuple: (image, scale) where scale maps downscaled coordinates back to the original
+        """
+        def build():
+            height, width = self.bgr.shape[:2]
+            scale = max(height, width) / max_side
+            if scale <= 1:
+                return self.bgr, 1.0
+            size = (max(1, int(round(width / scale))), max(1, int(round(height / scale))))
+            return cv2.resize(self.bgr, size, interpolation=cv2.INTER_AREA), scale
+        return self._view(('downscaled', max_side), build)
+
+    def gray_pyramid(self, max_side):
+        """
+        Gray image halved with pyrDown until its longer side is at most max_side
+
+        Returns:
+            tuple: (image, scale) with scale a power of two
+        """
+        def build():
+            gray = self.gray
+            scale = 1
+            while max(gray.shape[:2]) > max_side and min(gray.shape[:2]) >= 2:
+                gray = cv2.pyrDown(gray)
+                scale *= 2
+            return gray, scale
+        return self._view(('gray_pyramid', max_side), build)
+
+def fit_to_input(face, target_size):
+    """
+    Resize an aligned RGB face in [0, 1] to the model input the way DeepFace
+    does: aspect-preserving resize, then zero padding to the target size
+    
+    Args:
+        face: Face returned by DeepFace.extract_faces
+        target_size: Model input (height, width)
+        
+    Returns:
+        numpy.ndarray: float32 (height x width x 3) face
+    """
+    face = np.asarray(face, dtype=np.float32)
+    if face.ndim == 4:
+        face = face[0]
+    target_h, target_w = target_size
+    
+    factor = min(target_h / face.shape[0], target_w / face.shape[1])
+    resized = cv2.resize(face, (max(1, int(face.shape[1] * factor)), max(1, int(face.shape[0] * factor))))
+    
+    diff_h = target_h - resized.shape[0]
+    diff_w = target_w - resized.shape[1]
+    return np.pad(
+        resized,
+        ((diff_h // 2, diff_h - diff_h // 2), (diff_w // 2, diff_w - diff_w // 2), (0, 0)),
+        'constant'
+    )
+
+def check_image_quality(image, mode=QUALITY_CHECK_MODE):
     """
     Check if image meets quality standards (brightness, blur)
     
     Args:
-        image_path: Path to the image
+        image: ImageContext or path to the image
+        mode: 'proxy' to check a downscaled copy, 'full' for the full-resolution image
         
     Returns:
         tuple: (passed, message)
     """
     try:
-        img = cv2.imread(image_path)
+        image = ImageContext.wrap(image)
+        img = image.bgr
         if img is None:
             return False, "Failed to read image"
+        
+        if mode == 'proxy':
+            return _check_quality_proxy(image)
             
         # Convert to grayscale for analysis
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        gray = image.gray
         
         # Check brightness
         brightness = np.mean(gray)
-        if brightness < 50:
+        if brightness < MIN_BRIGHTNESS:
             return False, "Poor lighting conditions (too dark)"
-        if brightness > 240:
+        if brightness > MAX_BRIGHTNESS:
             return False, "Poor lighting conditions (too bright/overexposed)"
             
         # Check blurriness (Laplacian variance - lower means more blur)
         laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-        if laplacian_var < 30:
+        if laplacian_var < MIN_BLUR_VARIANCE:
             return False, "Image is too blurry"
             
         # Check image dimensions
         height, width = img.shape[:2]
-        if width < 200 or height < 200:
+        if width < MIN_IMAGE_SIZE or height < MIN_IMAGE_SIZE:
             return False, "Image resolution too low"
             
         return True, "Image quality is good"
         
     except Exception as e:
-        return False, f"Error checking image quality: {str(e)}"
\ No newline at end of file
+        return False, f"Error checking image quality: {str(e)}"
+
+def _check_quality_proxy(image):
+    """
+    Same checks as the full-resolution path, cheapest first, on a pyramid
+    proxy. Brightness near a limit and any blur score that is not a clear
+    pass are recomputed on the full-resolution image.
+
+    Returns:
+        tuple: (passed, message)
+    """
+    # Dimensions need no pixel access at all
+    height, width = image.shape[:2]
+    if width < MIN_IMAGE_SIZE or height < MIN_IMAGE_SIZE:
+        return False, "Image resolution too low"
+    
+    proxy, scale = image.gray_pyramid(QUALITY_PROXY_MAX_SIDE)
+    
+    # pyrDown preserves the mean, only recompute it right at a limit
+    brightness = np.mean(proxy)
+    if scale > 1 and min(abs(brightness - MIN_BRIGHTNESS), abs(brightness - MAX_BRIGHTNESS)) < BRIGHTNESS_MARGIN:
+        metrics.inc('quality_full_resolution_checks_total', check='brightness')
+        brightness = np.mean(image.gray)
+    if brightness < MIN_BRIGHTNESS:
+        return False, "Poor lighting conditions (too dark)"
+    if brightness > MAX_BRIGHTNESS:
+        return False, "Poor lighting conditions (too bright/overexposed)"
+    
+    # pyrDown removes much of the fine detail the Laplacian variance measures,
+    # and how much depends on the image, so the proxy score cannot be calibrated
+    # back to full resolution. For smooth, low-frequency content it grows by up
+    # to scale^4 instead, so with an exponent of 4 the normalised proxy score
+    # stays at or below the full-resolution one. Only a clear pass is decided on
+    # the proxy, every possible rejection is measured on the full-resolution image.
+    laplacian_var = cv2.Laplacian(proxy, cv2.CV_64F).var() / scale ** QUALITY_BLUR_SCALE_EXPONENT
+    if scale > 1 and laplacian_var < MIN_BLUR_VARIANCE * QUALITY_PROXY_MARGIN:
+        metrics.inc('quality_full_resolution_checks_total', check='blur')
+        laplacian_var = cv2.Laplacian(image.gray, cv2.CV_64F).var()
+    if laplacian_var < MIN_BLUR_VARIANCE:
+        return False, "Image is too blurry"
+    
+    return True, "Image quality is good"
@@ -0,0 +1,130 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Histogram buckets in seconds, from a fast matrix multiply to a cold model run
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_PREFIX = 'face_'
+
+# This file is a copy of backend_2/metrics.py, keep the two identical. Only the
+# descriptions of this app's own metrics at the end differ
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Metrics:
+    """
+    Minimal thread-safe counters and histograms, rendered in the Prometheus
+    text exposition format
+    """
+
+    def __init__(self, prefix=METRICS_PREFIX, buckets=LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.help = {}
+        self.counters = {}
+        self.histograms = {}
+
+    def describe(self, name, text):
+        """Set the HELP text of a metric"""
+        self.help[self.prefix + name] = text
+
+    def inc(self, name, value=1, **labels):
+        """Increase a counter"""
+        key = (self.prefix + name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """Record one histogram observation"""
+        key = (self.prefix + name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    @contextmanager
+    def timer(self, stage):
+        """Time a pipeline stage into the stage_duration_seconds histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_duration_seconds', time.perf_counter() - start, stage=stage)
+
+    def render(self):
+        """All metrics in the Prometheus text format"""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: {"buckets": list(h["buckets"]), "sum": h["sum"], "count": h["count"]}
+                          for key, h in self.histograms.items()}
+
+        lines = []
+        for metric_type, series in (('counter', counters), ('histogram', histograms)):
+            for name in sorted({name for name, _ in series}):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for (series_name, labels), value in sorted(series.items()):
+                    if series_name != name:
+                        continue
+                    if metric_type == 'counter':
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+                        continue
+                    for bound, count in zip(self.buckets, value["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {value['count']}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe('stage_duration_seconds', 'Time spent in each recognition pipeline stage')
+metrics.describe('request_duration_seconds', 'HTTP request latency per endpoint')
+metrics.describe('requests_total', 'HTTP requests per endpoint and status code')
+metrics.describe('faces_detected_total', 'Faces found by the detectors')
+metrics.describe('model_invocations_total', 'Detector and embedding model calls')
+
+
+def init_request_metrics(app):
+    """Record latency and status of every request, and serve GET /metrics"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = getattr(g, 'metrics_start', None)
+        if start is not None and request.endpoint != 'metrics_endpoint':
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics.observe('request_duration_seconds', time.perf_counter() - start, endpoint=endpoint)
+            metrics.inc('requests_total', endpoint=endpoint, status=response.status_code)
+        return response
+
+    @app.route('/metrics', methods=['GET'], endpoint='metrics_endpoint')
+    def _metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
+
+
+# Metrics only this app records
+metrics.describe('cloudinary_uploads_total', 'Registration image upload attempts by result (ok, retry, failed)')
+metrics.describe('quality_full_resolution_checks_total', 'Quality checks the downscaled proxy could not decide')
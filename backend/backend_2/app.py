@@ -1,27 +1,87 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
 import numpy as np
 import cv2
-from deepface import DeepFace
 import uuid
 import shutil
 import json
 import pickle
 import time
-from mtcnn import MTCNN
-from scipy.spatial.distance import cosine
+import threading
+from matcher import MATCH_THRESHOLD, normalize_rows
+from embedding_store import EmbeddingStore
+from model_registry import registry
+from detectors import detectors, UPLOAD_DETECTOR, GROUP_DETECTOR, VIDEO_DETECTOR, TILED_DETECTION
+from embedder import embed_faces, crop_face
+from regeneration import (
+    RegenerationCheckpoint, find_stale, regenerate_students, save_features, fingerprint, IMAGES_PER_STUDENT, PIPELINE
+)
+from jobs import JobQueue
+from video import sample_frames, face_quality, IoUTracker, merge_tracks, TRACK_MIN_HITS
+from sessions import SessionStore, SESSION_MAX_PHOTOS
+from metrics import metrics, init_request_metrics
 
 app = Flask(__name__)
 CORS(app)
 
+# Per-request latency and the Prometheus /metrics endpoint
+init_request_metrics(app)
+
 UPLOAD_FOLDER = 'uploads'
 FACE_INFO_FOLDER = 'face_info'
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', 'true').lower() == 'true'  # Load and warm up models at startup
+STALE_CHECK_INTERVAL = int(os.getenv('STALE_CHECK_INTERVAL', '60'))  # Seconds between checks for students missing from the store
+PROGRESS_POLL_INTERVAL = 0.5  # Seconds between regeneration progress events
 
 # Create folders if they don't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(FACE_INFO_FOLDER, exist_ok=True)
 
+# Created empty here and loaded on the first request: regeneration worker
+# processes import this module again (as __mp_main__) and never serve requests
+embedding_store = EmbeddingStore(FACE_INFO_FOLDER, pipeline=PIPELINE)
+
+# Which registration image every feature file was built from, for incremental regeneration
+regeneration_checkpoint = RegenerationCheckpoint(FACE_INFO_FOLDER)
+
+_initialized = False
+_init_lock = threading.Lock()
+
+def init_app():
+    """
+    Load the embedding store and checkpoint and warm up the models, once per
+    serving process. Called before the first request however the app is
+    started (app.run, flask run, gunicorn), or eagerly when run directly.
+    """
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        
+        # Memory-map all stored embeddings once, importing legacy per-student pickles on first run
+        embedding_store.load()
+        if len(embedding_store) == 0:
+            imported = embedding_store.import_legacy(FACE_INFO_FOLDER)
+            if imported:
+                # Built by an older pipeline, the stale check queues these students for re-embedding
+                print(f"Imported {imported} legacy feature vectors into the embedding store")
+        
+        regeneration_checkpoint.load()
+        
+        # Load and warm up the detectors and embedder once instead of on the first recognition
+        if PRELOAD_MODELS:
+            registry.load_all()
+            detectors.preload([UPLOAD_DETECTOR, GROUP_DETECTOR, VIDEO_DETECTOR])
+        
+        _initialized = True
+
+@app.before_request
+def ensure_initialized():
+    init_app()
+
 def detect_face(image_path):
     """
     Detects if there's exactly one face in the image with good conditions
@@ -35,9 +95,8 @@ def detect_face(image_path):
         # Convert to grayscale for face detection
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
-        # Use haar cascade for quick face detection
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+        # Quick single-face check with the upload detector (haar cascade by default)
+        faces = detectors.detect(UPLOAD_DETECTOR, img)
         
         if len(faces) == 0:
             return False, "No face detected", None
@@ -50,7 +109,7 @@ def detect_face(image_path):
             return False, "Poor lighting conditions", None
             
         # Store face area
-        x, y, w, h = faces[0]
+        x, y, w, h, _ = faces[0]
         
         face_area = {
             'x': int(x),
@@ -65,28 +124,44 @@ def detect_face(image_path):
     except Exception as e:
         return False, f"Error: {str(e)}", None
 
-def extract_face_features(image_path):
+def decode_image(file_storage):
+    """
+    Decode an uploaded image straight from the request stream
+    Returns: BGR image or None
+    """
+    data = np.frombuffer(file_storage.read(), dtype=np.uint8)
+    if data.size == 0:
+        return None
+    with metrics.timer('decode'):
+        return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+def parse_classes(form):
+    """
+    Read the optional class filter of a request
+    Accepts repeated 'class' fields and comma-separated values
+    Returns: list of classes or None for all classes
+    """
+    classes = []
+    for value in form.getlist('class'):
+        classes.extend(c.strip() for c in value.split(',') if c.strip())
+    return classes or None
+
+def extract_face_features(image_path, face_area=None):
     """
     Extract facial features for recognition - ensures consistent format
+    Crops to face_area (with margin) when given, otherwise embeds the whole image
     """
     try:
-        # Use DeepFace to get representation
-        embedding_obj = DeepFace.represent(
-            img_path=image_path, 
-            model_name="Facenet",
-            enforce_detection=False
-        )
+        img = cv2.imread(image_path)
+        if img is None:
+            print(f"Error extracting features: failed to read {image_path}")
+            return None
         
-        # Make sure we're extracting just the vector
-        if isinstance(embedding_obj, list) and len(embedding_obj) > 0:
-            # If it's a list (multiple faces), take the first one
-            embedding = embedding_obj[0]["embedding"]
-        else:
-            # If it's a single object
-            embedding = embedding_obj["embedding"]
-            
-        # Convert to numpy array to ensure consistent format and flatten
-        embedding_array = np.array(embedding).flatten()
+        if face_area:
+            img = crop_face(img, (face_area['x'], face_area['y'], face_area['w'], face_area['h']))
+        
+        # Single-face batch through the shared embedding path
+        embedding_array = embed_faces([img], detector=UPLOAD_DETECTOR if face_area else None, cache_new=True)[0]
         
         # Verify shape before returning
         if embedding_array.size != 128:  # Facenet typically uses 128-dimensional embeddings
@@ -97,67 +172,203 @@ def extract_face_features(image_path):
         print(f"Error extracting features: {str(e)}")
         return None
 
-def regenerate_features(student_id):
+def load_staged_features(face_info_folder):
     """
-    Regenerate features for a student using their stored images
-    Returns: True if successful, False otherwise
+    Feature files written for a student before registration completed
+    Returns: list of (slot, vector)
     """
-    try:
-        user_folder = os.path.join(UPLOAD_FOLDER, student_id)
-        face_info_folder = os.path.join(FACE_INFO_FOLDER, student_id)
-        
-        if not os.path.exists(user_folder) or not os.path.exists(face_info_folder):
-            print(f"Student folders not found for {student_id}")
-            return False
-            
-        # Process each image
-        success_count = 0
-        for i in range(5):  # 5 images per student
-            img_path = os.path.join(user_folder, f"image_{i}.jpg")
-            if not os.path.exists(img_path):
-                continue
-                
-            # Extract new features
-            features = extract_face_features(img_path)
-            if features is not None and features.size == 128:
-                # Save the regenerated features
-                feature_path = os.path.join(face_info_folder, f"features_{i}.pkl")
-                with open(feature_path, "wb") as f:
-                    pickle.dump(features, f)
-                success_count += 1
-                
-        print(f"Regenerated {success_count} feature vectors for {student_id}")
-        return success_count > 0
-    except Exception as e:
-        print(f"Error regenerating features for {student_id}: {str(e)}")
-        return False
+    staged = []
+    for i in range(IMAGES_PER_STUDENT):
+        feature_path = os.path.join(face_info_folder, f"features_{i}.pkl")
+        if os.path.exists(feature_path):
+            with open(feature_path, "rb") as f:
+                staged.append((i, pickle.load(f)))
+    return staged
 
-# Add a route to regenerate features for all students
+def get_student_details(student_id):
+    """
+    Look up name, roll number and class of a student
+    Returns: (name, roll_no, class)
+    """
+    info_path = os.path.join(FACE_INFO_FOLDER, student_id, "info.json")
+    if os.path.exists(info_path):
+        with open(info_path, "r") as f:
+            student_info = json.load(f)
+        return student_info.get('name'), student_info.get('roll_no'), student_info.get('class')
+    
+    for student in embedding_store.students():
+        if student['id'] == student_id:
+            return student['name'], student['roll_no'], student['class']
+    
+    # Fall back to the folder naming scheme name_rollno
+    name, _, roll_no = student_id.rpartition('_')
+    return name, roll_no, None
+
+def run_regeneration(student_ids=None, progress=None):
+    """
+    Rebuild the feature files of students whose files are missing or stale,
+    embedding them in worker processes and checkpointing after every student
+    so a restarted job only redoes what is still stale
+    Returns: summary of the run
+    """
+    stale = find_stale(UPLOAD_FOLDER, FACE_INFO_FOLDER, regeneration_checkpoint, embedding_store.slots(), student_ids)
+    
+    counts = {"total": len(stale), "done": 0, "failed": 0, "vectors": 0, "current": None}
+    if progress:
+        progress(counts)
+    print(f"Regenerating features for {len(stale)} stale students")
+    
+    successful_students = []
+    failed_students = []
+    for student_id, results, failed, error in regenerate_students(stale, UPLOAD_FOLDER, FACE_INFO_FOLDER):
+        if failed:
+            # Skipped by later runs until the image is replaced
+            regeneration_checkpoint.mark(student_id, dict(failed))
+        if error or not results:
+            print(f"Error regenerating features for {student_id}: {error or 'no valid face'}")
+            failed_students.append(student_id)
+            counts["failed"] += 1
+        else:
+            save_features(FACE_INFO_FOLDER, student_id, results)
+            name, roll_no, student_class = get_student_details(student_id)
+            # Newer rows supersede the old ones in the embedding store
+            embedding_store.append_many([
+                (student_id, name, roll_no, student_class, i, vector) for i, vector, _, _ in results
+            ])
+            regeneration_checkpoint.mark(student_id, {i: slot_fingerprint for i, _, slot_fingerprint, _ in results})
+            successful_students.append(student_id)
+            counts["done"] += 1
+            counts["vectors"] += len(results)
+        counts["current"] = student_id
+        if progress:
+            progress(counts)
+    
+    # Drop the superseded rows from the embedding store
+    if counts["vectors"]:
+        embedding_store.compact()
+    
+    return {
+        "success": True,
+        "message": f"Regenerated features for {len(successful_students)} students, {len(failed_students)} failed",
+        "successful_students": successful_students,
+        "failed_students": failed_students,
+        "up_to_date": counts["total"] == 0
+    }
+
+# A single background worker, a second request joins the job already queued or running
+regeneration_jobs = JobQueue(run_regeneration, workers=1, max_queue=1, track_progress=True)
+_last_stale_check = 0
+
+def submit_regeneration(student_ids=None):
+    """
+    Queue a regeneration job unless one is already pending
+    Returns: (job id, True if a new job was queued)
+    """
+    active = regeneration_jobs.active()
+    if active:
+        return active[0], False
+    job_id = regeneration_jobs.submit(student_ids)
+    if job_id is None:
+        active = regeneration_jobs.active()
+        return (active[0] if active else None), False
+    return job_id, True
+
+def schedule_stale_regeneration():
+    """
+    Queue registered students that have no embeddings from the current
+    pipeline in the store (new or legacy-imported), instead of regenerating
+    them on the recognition path. Checked at most once per
+    STALE_CHECK_INTERVAL seconds.
+    """
+    global _last_stale_check
+    now = time.time()
+    if now - _last_stale_check < STALE_CHECK_INTERVAL:
+        return
+    _last_stale_check = now
+    
+    stored_slots = embedding_store.slots()
+    stored = {student_id for student_id, _ in stored_slots}
+    missing = [
+        entry for entry in os.listdir(FACE_INFO_FOLDER)
+        if entry not in stored and os.path.exists(os.path.join(FACE_INFO_FOLDER, entry, "info.json"))
+    ]
+    if missing:
+        # Students whose images all failed to embed wait until an image is replaced
+        missing = [
+            student_id for student_id, _ in
+            find_stale(UPLOAD_FOLDER, FACE_INFO_FOLDER, regeneration_checkpoint, stored_slots, missing)
+        ]
+    if missing:
+        job_id, created = submit_regeneration(missing)
+        if created:
+            print(f"Queued feature regeneration for {len(missing)} students without embeddings (job {job_id})")
+
+def regeneration_status(job):
+    response = {
+        "success": True,
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "progress": job["progress"]
+    }
+    if job["status"] == "done":
+        response["result"] = job["result"]
+    elif job["status"] == "failed":
+        response["message"] = f"Error regenerating features: {job['error']}"
+    return response
+
+# Regenerate features for all students with stale or missing feature files
 @app.route('/api/regenerate-all-features', methods=['POST'])
 def regenerate_all_features():
-    try:
-        successful_students = []
-        failed_students = []
-        
-        for student_folder in os.listdir(FACE_INFO_FOLDER):
-            folder_path = os.path.join(FACE_INFO_FOLDER, student_folder)
-            if os.path.isdir(folder_path):
-                if regenerate_features(student_folder):
-                    successful_students.append(student_folder)
-                else:
-                    failed_students.append(student_folder)
-        
-        return jsonify({
-            "success": True,
-            "message": f"Regenerated features for {len(successful_students)} students, {len(failed_students)} failed",
-            "successful_students": successful_students,
-            "failed_students": failed_students
-        })
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "message": f"Error regenerating features: {str(e)}"
-        }), 500
+    """Start (or join) the background regeneration job and return its id immediately"""
+    student_ids = request.form.getlist('student_id') or None
+    job_id, created = submit_regeneration(student_ids)
+    if job_id is None:
+        return jsonify({"success": False, "message": "Regeneration queue is full, try again later"}), 429
+    
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued" if created else regeneration_jobs.get(job_id)["status"],
+        "message": "Regeneration started" if created else "Regeneration already in progress",
+        "status_url": f"/api/regenerate-all-features/{job_id}",
+        "events_url": f"/api/regenerate-all-features/{job_id}/events"
+    }), 202
+
+@app.route('/api/regenerate-all-features/<job_id>', methods=['GET'])
+def get_regeneration_job(job_id):
+    """Poll a regeneration job: progress counts while running, the summary once done"""
+    job = regeneration_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Unknown or expired job"}), 404
+    return jsonify(regeneration_status(job))
+
+@app.route('/api/regenerate-all-features/<job_id>/events', methods=['GET'])
+def stream_regeneration_job(job_id):
+    """Server-sent events with the job status every time its progress changes"""
+    if regeneration_jobs.get(job_id) is None:
+        return jsonify({"success": False, "message": "Unknown or expired job"}), 404
+    
+    def events():
+        last = None
+        while True:
+            job = regeneration_jobs.get(job_id)
+            if job is None:
+                return
+            status = regeneration_status(job)
+            if status != last:
+                yield f"data: {json.dumps(status)}\n\n"
+                last = status
+            if job["status"] in ("done", "failed"):
+                return
+            time.sleep(PROGRESS_POLL_INTERVAL)
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/models', methods=['GET'])
+def model_status():
+    """Report per-model load and warm-up times"""
+    return jsonify({"success": True, "models": registry.report(), "detectors": detectors.report()})
 
 @app.route('/api/upload-face', methods=['POST'])
 def upload_face():
@@ -199,12 +410,19 @@ def upload_face():
         with open(os.path.join(face_info_folder, f"face_area_{image_index}.json"), "w") as f:
             json.dump(face_area, f)
     
+    # Students become searchable only once info.json exists, until then
+    # their embeddings are staged in the feature files
+    registered = os.path.exists(os.path.join(face_info_folder, "info.json"))
+    
     # Extract features/representation
-    features = extract_face_features(image_path)
+    features = extract_face_features(image_path, face_area)
     if features is not None and features.size == 128:
         # Save features - make sure we're saving a 1D array of size 128
         with open(os.path.join(face_info_folder, f"features_{image_index}.pkl"), "wb") as f:
             pickle.dump(features, f)
+        if registered:
+            embedding_store.append(student_id, name, roll_no, student_class, image_index, features)
+        regeneration_checkpoint.mark(student_id, {image_index: fingerprint(image_path)})
     else:
         return jsonify({"success": False, "message": "Failed to extract valid facial features"}), 400
     
@@ -224,6 +442,13 @@ def upload_face():
         with open(os.path.join(face_info_folder, "info.json"), "w") as f:
             json.dump(student_info, f)
         
+        # Registration is complete, make all staged slots searchable in one write
+        if not registered:
+            embedding_store.append_many([
+                (student_id, name, roll_no, student_class, slot, vector)
+                for slot, vector in load_staged_features(face_info_folder)
+            ])
+        
         return jsonify({
             "success": True, 
             "message": "All images processed successfully and face information stored"
@@ -234,268 +459,113 @@ def upload_face():
         "message": f"Image {image_index+1} uploaded and validated successfully"
     })
 
-@app.route('/api/recognize-group', methods=['POST'])
-def recognize_group():
-    start_time = time.time()
-    
-    if 'image' not in request.files:
-        return jsonify({"success": False, "message": "No image provided"}), 400
+def select_gallery(classes):
+    """
+    Gallery of the requested class partitions (or all stored embeddings),
+    rebuilt only when the store has changed
+    Returns: (gallery, classes actually searched)
+    """
+    schedule_stale_regeneration()
+    with metrics.timer('gallery_load'):
+        gallery = embedding_store.gallery(classes)
+        if classes and len(gallery) == 0:
+            print(f"No students enrolled in {classes}, falling back to global search")
+            classes = None
+            gallery = embedding_store.gallery()
+    return gallery, classes
+
+def detect_and_embed_faces(img):
+    """
+    Detect faces (MTCNN by default) and embed all of them in one batched forward pass
+    Returns: (number of faces detected, list of {'features', 'face', 'face_area'})
+    """
+    # Pooled detector instances, built once and reused across requests. Large
+    # photos are tiled so faces at the back of the room are not too small to find
+    if TILED_DETECTION:
+        detected_faces = detectors.detect_tiled(GROUP_DETECTOR, img)
+    else:
+        detected_faces = detectors.detect(GROUP_DETECTOR, img)
+    print(f"{GROUP_DETECTOR} detected {len(detected_faces)} faces in the group photo")
     
-    image = request.files['image']
+    face_crops = []
+    for face in detected_faces:
+        try:
+            # Get face coordinates
+            x, y, width, height, _ = face
+            
+            # Crop face from image with a 10% margin on each side
+            face_img = crop_face(img, (x, y, width, height))
+            if face_img.size == 0:
+                continue
+            
+            face_crops.append((face_img, {'x': x, 'y': y, 'w': width, 'h': height}))
+        except Exception as crop_err:
+            print(f"Error processing face: {str(crop_err)}")
     
-    # Save the group image temporarily
-    group_image_path = os.path.join(UPLOAD_FOLDER, f"group_{uuid.uuid4()}.jpg")
-    image.save(group_image_path)
+    # Extract features for all faces in one batched forward pass
+    group_face_features = []
+    face_embeddings = embed_faces([face_img for face_img, _ in face_crops], detector=GROUP_DETECTOR)
+    for (face_img, face_area), face_embedding in zip(face_crops, face_embeddings):
+        if face_embedding.size == 128:
+            group_face_features.append({
+                'features': face_embedding,
+                'face': face_img,
+                'face_area': face_area
+            })
+        else:
+            print(f"Warning: Invalid face embedding for face at ({face_area['x']}, {face_area['y']})")
     
-    try:
-        # Load all students information first
-        all_students = []
-        
-        for student_folder in os.listdir(FACE_INFO_FOLDER):
-            folder_path = os.path.join(FACE_INFO_FOLDER, student_folder)
-            if os.path.isdir(folder_path):
-                info_path = os.path.join(folder_path, "info.json")
-                if os.path.exists(info_path):
-                    try:
-                        with open(info_path, "r") as f:
-                            student_info = json.load(f)
-                        
-                        # Add student ID and folder path
-                        student_info['id'] = student_folder
-                        student_info['folder'] = folder_path
-                        student_info['upload_folder'] = os.path.join(UPLOAD_FOLDER, student_folder)
-                        
-                        # Load pre-extracted facial features
-                        student_info['features'] = []
-                        needs_regeneration = False
-                        
-                        for i in range(5):  # 5 images per student
-                            feature_path = os.path.join(folder_path, f"features_{i}.pkl")
-                            if os.path.exists(feature_path):
-                                try:
-                                    with open(feature_path, "rb") as f:
-                                        features = pickle.load(f)
-                                        
-                                        # Check if features are valid
-                                        if features is not None:
-                                            features = np.array(features).flatten()
-                                            
-                                            # If the feature vector has incorrect dimensions
-                                            if features.size != 128:
-                                                needs_regeneration = True
-                                                break
-                                                
-                                            student_info['features'].append(features)
-                                        else:
-                                            needs_regeneration = True
-                                            break
-                                except Exception:
-                                    needs_regeneration = True
-                                    break
-                            else:
-                                needs_regeneration = True
-                                break
-                        
-                        # If features need regeneration, do it now
-                        if needs_regeneration or len(student_info['features']) < 5:
-                            print(f"Regenerating features for {student_folder}")
-                            if regenerate_features(student_folder):
-                                # Reload the regenerated features
-                                student_info['features'] = []
-                                for i in range(5):
-                                    feature_path = os.path.join(folder_path, f"features_{i}.pkl")
-                                    if os.path.exists(feature_path):
-                                        with open(feature_path, "rb") as f:
-                                            features = pickle.load(f)
-                                            if features is not None and isinstance(features, np.ndarray) and features.size == 128:
-                                                student_info['features'].append(features)
-                        
-                        # Only add student if we have valid features
-                        if len(student_info['features']) > 0:
-                            all_students.append(student_info)
-                        else:
-                            print(f"Skipping student {student_folder} - no valid feature vectors found")
-                    except Exception as e:
-                        print(f"Error loading student info: {str(e)}")
-        
-        print(f"Loaded {len(all_students)} students with valid feature vectors")
-        
-        # Detect faces in the group photo using MTCNN
-        img = cv2.imread(group_image_path)
-        if img is None:
-            return jsonify({"success": False, "message": "Failed to read group image"}), 400
+    print(f"Extracted features from {len(group_face_features)} faces in the group photo")
+    return len(detected_faces), group_face_features
 
-        # Convert to RGB as MTCNN works with RGB format
-        rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+def match_face_features(gallery, face_matrix, face_count):
+    """
+    Match face embeddings with the gallery
+    Returns: list of (student or None, similarity), one per row of face_matrix
+    """
+    # Match each face in the group photo with student database
+    # using the pre-extracted features, scored in one matrix multiply
+    with metrics.timer('match'):
+        matches = gallery.match(face_matrix, threshold=MATCH_THRESHOLD)
+    
+    # If we haven't recognized enough faces using vector comparison, give the
+    # unmatched faces a second pass on the same embeddings (relaxed threshold,
+    # multi-template voting) instead of running the model again
+    first_pass_count = sum(1 for student, _ in matches if student)
+    if first_pass_count < face_count:
+        print(f"Only recognized {first_pass_count} out of {face_count}. Trying second pass...")
+        with metrics.timer('match_second_pass'):
+            matches = gallery.second_pass(face_matrix, matches)
+    return matches
 
-        # Initialize MTCNN detector
-        detector = MTCNN()
+def student_summary(student):
+    return {
+        'name': student.get('name'),
+        'roll_no': student.get('roll_no'),
+        'class': student.get('class')
+    }
 
-        # Detect faces
-        detected_faces = detector.detect_faces(rgb_img)
-        actual_face_count = len(detected_faces)
-        print(f"MTCNN detected {actual_face_count} faces in the group photo")
-        
-        # Process each detected face
-        recognized_students = []
-        
-        # Extract facial features from each detected face in the group photo
-        group_face_features = []
-        
-        for face in detected_faces:
-            try:
-                # Get face coordinates
-                x, y, width, height = face['box']
-                
-                # Add margin to face crop (10% on each side)
-                margin_x = int(width * 0.1)
-                margin_y = int(height * 0.1)
-                
-                # Ensure coordinates are within image boundaries
-                x_start = max(0, x - margin_x)
-                y_start = max(0, y - margin_y)
-                x_end = min(img.shape[1], x + width + margin_x)
-                y_end = min(img.shape[0], y + height + margin_y)
-                
-                # Crop face from image
-                face_img = img[y_start:y_end, x_start:x_end]
-                
-                # Save face temporarily for feature extraction
-                face_path = os.path.join(UPLOAD_FOLDER, f"face_{uuid.uuid4()}.jpg")
-                cv2.imwrite(face_path, face_img)
-                
-                # Extract features using DeepFace
-                face_embedding = extract_face_features(face_path)
-                if face_embedding is not None and face_embedding.size == 128:
-                    group_face_features.append({
-                        'features': face_embedding,
-                        'face_path': face_path,
-                        'face_area': {'x': x, 'y': y, 'w': width, 'h': height}
-                    })
-                    print(f"Successfully extracted features for face at ({x}, {y})")
-                else:
-                    print(f"Warning: Invalid or missing face embedding for face at ({x}, {y})")
-                
-            except Exception as crop_err:
-                print(f"Error processing face: {str(crop_err)}")
-        
-        print(f"Extracted features from {len(group_face_features)} faces in the group photo")
+def recognize_image(img, classes=None):
+    """
+    Run the detect -> embed -> match pipeline on a decoded group photo
+    Returns: (response payload, HTTP status)
+    """
+    start_time = time.time()
+    
+    try:
+        gallery, classes = select_gallery(classes)
+        print(f"Loaded {len(gallery)} students with valid feature vectors")
         
-        # Match each face in the group photo with student database
-        # using the pre-extracted features
-        for face_data in group_face_features:
-            face_features = face_data['features']
-            if face_features is None or face_features.size != 128:
-                continue
-                
-            best_match = None
-            best_distance = 0.4  # Threshold for matching (lower is better)
-            best_student = None
-            
-            # Compare with each student's features
-            for student in all_students:
-                # Skip already recognized students
-                if any(s.get('roll_no') == student.get('roll_no') for s in recognized_students):
-                    continue
-                    
-                # Compare with each of the student's features
-                student_best_similarity = 0
-                
-                for features in student.get('features', []):
-                    if features is None or features.size != 128:
-                        continue
-                    
-                    try:
-                        # Compute cosine similarity (higher is better)
-                        similarity = 1 - cosine(face_features, features)
-                        
-                        # Keep track of the best similarity for this student
-                        if similarity > student_best_similarity:
-                            student_best_similarity = similarity
-                    except Exception as comp_err:
-                        print(f"Comparison error: {str(comp_err)}")
-                
-                # Convert to distance (lower is better) for threshold comparison
-                distance = 1 - student_best_similarity
-                
-                # If this student is a better match than previous best
-                if student_best_similarity > 0 and distance < best_distance:
-                    best_distance = distance
-                    best_student = student
-                    print(f"New best match: {student.get('name')} with similarity {student_best_similarity:.4f} (distance {distance:.4f})")
-            
-            # If we found a good match
-            if best_student:
-                print(f"Recognized: {best_student.get('name')} with distance {best_distance:.4f}")
-                recognized_students.append({
-                    'name': best_student.get('name'),
-                    'roll_no': best_student.get('roll_no'),
-                    'class': best_student.get('class')
-                })
+        actual_face_count, group_face_features = detect_and_embed_faces(img)
         
-        # If we haven't recognized enough faces using vector comparison, 
-        # fallback to DeepFace.verify for remaining students
-        if len(recognized_students) < actual_face_count:
-            print(f"Only recognized {len(recognized_students)} out of {actual_face_count}. Trying verification...")
-            
-            # For each unrecognized student, try verification with their images
-            for student in all_students:
-                # Skip already recognized students
-                if any(s.get('roll_no') == student.get('roll_no') for s in recognized_students):
-                    continue
-                    
-                student_id = student.get('id')
-                user_folder = student.get('upload_folder')
-                
-                # Try each of the student's images (we'll try image_2.jpg first as it's usually best)
-                images_to_try = ["image_2.jpg", "image_0.jpg", "image_1.jpg", "image_3.jpg", "image_4.jpg"]
-                verified = False
-                
-                for img_name in images_to_try:
-                    if verified:
-                        break
-                        
-                    img_path = os.path.join(user_folder, img_name)
-                    if not os.path.exists(img_path):
-                        continue
-                    
-                    try:
-                        # Try each face in the group photo
-                        for face_data in group_face_features:
-                            if verified:
-                                break
-                                
-                            face_path = face_data['face_path']
-                            
-                            verification = DeepFace.verify(
-                                img1_path=face_path,
-                                img2_path=img_path,
-                                model_name="Facenet",
-                                distance_metric="cosine",
-                                detector_backend="skip",  # Skip detection since we already have face crops
-                                enforce_detection=False
-                            )
-                            
-                            if verification.get('verified', False):
-                                print(f"Verification success for {student['name']} with {img_name}")
-                                recognized_students.append({
-                                    'name': student.get('name'),
-                                    'roll_no': student.get('roll_no'),
-                                    'class': student.get('class')
-                                })
-                                verified = True
-                                break
-                                
-                    except Exception as verify_err:
-                        print(f"Verification error for {student['name']}: {str(verify_err)}")
+        face_matrix = np.array([face_data['features'] for face_data in group_face_features])
+        matches = match_face_features(gallery, face_matrix, actual_face_count)
         
-        # Clean up temporary files
-        if os.path.exists(group_image_path):
-            os.remove(group_image_path)
-            
-        for face_data in group_face_features:
-            if 'face_path' in face_data and os.path.exists(face_data['face_path']):
-                os.remove(face_data['face_path'])
+        recognized_students = []
+        for student, similarity in matches:
+            if student:
+                print(f"Recognized: {student.get('name')} with distance {1 - similarity:.4f}")
+                recognized_students.append(student_summary(student))
         
         # Sort recognized students by name
         recognized_students.sort(key=lambda x: x.get('name', ''))
@@ -503,31 +573,234 @@ def recognize_group():
         end_time = time.time()
         processing_time = end_time - start_time
         
-        return jsonify({
+        return {
             "success": True,
             "recognized_students": recognized_students,
             "faces_detected": actual_face_count,
+            "classes": classes,
             "processing_time_seconds": processing_time
-        })
+        }, 200
     
     except Exception as e:
         print(f"Recognition process error: {str(e)}")
         import traceback
         traceback.print_exc()
+                
+        return {
+            "success": False,
+            "message": f"Recognition error: {str(e)}"
+        }, 500
+
+@app.route('/api/recognize-group', methods=['POST'])
+def recognize_group():
+    if 'image' not in request.files:
+        return jsonify({"success": False, "message": "No image provided"}), 400
+    
+    # Decode the upload in memory, it never touches the disk
+    img = decode_image(request.files['image'])
+    if img is None:
+        return jsonify({"success": False, "message": "Failed to read group image"}), 400
+    
+    payload, status = recognize_image(img, parse_classes(request.form))
+    return jsonify(payload), status
+
+@app.route('/api/recognize-video', methods=['POST'])
+def recognize_video():
+    """
+    Attendance from a short classroom clip: sampled frames are run through the
+    detector, faces are tracked across frames and every track is embedded only
+    from its best-quality crops, then matched like a single group photo
+    """
+    start_time = time.time()
+    
+    if 'video' not in request.files:
+        return jsonify({"success": False, "message": "No video provided"}), 400
+    
+    video = request.files['video']
+    classes = parse_classes(request.form)
+    
+    # OpenCV can only decode videos from a file
+    extension = os.path.splitext(video.filename or '')[1] or '.mp4'
+    video_path = os.path.join(UPLOAD_FOLDER, f"video_{uuid.uuid4()}{extension}")
+    video.save(video_path)
+    
+    try:
+        gallery, classes = select_gallery(classes)
+        tracker = IoUTracker()
         
-        # Clean up temporary files
-        if os.path.exists(group_image_path):
-            os.remove(group_image_path)
+        frames_sampled = 0
+        for frame_number, frame in sample_frames(video_path):
+            frames_sampled += 1
+            detections = []
+            for face in detectors.detect(VIDEO_DETECTOR, frame):
+                face_img = crop_face(frame, face[:4])
+                if face_img.size == 0:
+                    continue
+                detections.append((tuple(face[:4]), face_img, face_quality(face_img, face.confidence)))
+            tracker.update(frame_number, detections)
         
-        # Clean up any face images
-        for filename in os.listdir(UPLOAD_FOLDER):
-            if filename.startswith("face_") and filename.endswith(".jpg"):
-                os.remove(os.path.join(UPLOAD_FOLDER, filename))
-                
+        if frames_sampled == 0:
+            return jsonify({"success": False, "message": "Failed to read video"}), 400
+        
+        # A clip with very few sampled frames cannot require many sightings
+        tracks = tracker.confirmed_tracks(min(TRACK_MIN_HITS, frames_sampled))
+        print(f"Sampled {frames_sampled} frames, {len(tracker.tracks)} tracks, {len(tracks)} confirmed")
+        
+        # Embed only the best crops of each track, all in one batch
+        crops = [crop for track in tracks for _, _, crop in track['best']]
+        embeddings = normalize_rows(embed_faces(crops, detector=VIDEO_DETECTOR)) if crops else np.zeros((0, 128), dtype=np.float32)
+        
+        # One template per track: the normalised mean of its best crops
+        track_matrix = []
+        start = 0
+        for track in tracks:
+            count = len(track['best'])
+            track_matrix.append(embeddings[start:start + count].mean(axis=0))
+            start += count
+        track_matrix = np.array(track_matrix).reshape(-1, 128)
+        
+        # A student occluded for a while comes back as a new track, join the
+        # pieces first: matching is one-to-one, so a second track of the same
+        # student could otherwise be given to a similar-looking absent one
+        groups, person_matrix = merge_tracks(tracks, track_matrix)
+        if len(groups) < len(tracks):
+            print(f"Merged {len(tracks)} tracks into {len(groups)} people")
+        
+        matches = match_face_features(gallery, person_matrix, len(groups))
+        recognized_students = [student_summary(student) for student, _ in matches if student]
+        recognized_students.sort(key=lambda x: x.get('name', ''))
+        
+        return jsonify({
+            "success": True,
+            "recognized_students": recognized_students,
+            "frames_sampled": frames_sampled,
+            "faces_tracked": len(groups),
+            "faces_embedded": len(crops),
+            "classes": classes,
+            "processing_time_seconds": time.time() - start_time
+        })
+    
+    except Exception as e:
+        print(f"Video recognition error: {str(e)}")
+        return jsonify({
+            "success": False,
+            "message": f"Recognition error: {str(e)}"
+        }), 500
+    
+    finally:
+        if os.path.exists(video_path):
+            os.remove(video_path)
+
+def run_recognition_job(img, classes):
+    payload, _ = recognize_image(img, classes)
+    return payload
+
+# Bounded worker pool for asynchronous recognition jobs
+recognition_jobs = JobQueue(run_recognition_job)
+
+@app.route('/api/recognize-group/jobs', methods=['POST'])
+def submit_recognition_job():
+    """Queue a group photo for recognition and return a job id immediately"""
+    if 'image' not in request.files:
+        return jsonify({"success": False, "message": "No image provided"}), 400
+    
+    img = decode_image(request.files['image'])
+    if img is None:
+        return jsonify({"success": False, "message": "Failed to read group image"}), 400
+    
+    job_id = recognition_jobs.submit(img, parse_classes(request.form))
+    if job_id is None:
+        response = jsonify({"success": False, "message": "Recognition queue is full, try again later"})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/recognize-group/jobs/{job_id}"
+    }), 202
+
+@app.route('/api/recognize-group/jobs/<job_id>', methods=['GET'])
+def get_recognition_job(job_id):
+    """Poll a recognition job, the result is included once it is done"""
+    job = recognition_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Unknown or expired job"}), 404
+    
+    response = {
+        "success": True,
+        "job_id": job_id,
+        "status": job["status"],
+        "queued_seconds": (job["started_at"] or time.time()) - job["submitted_at"]
+    }
+    if job["status"] == "done":
+        response["result"] = job["result"]
+    elif job["status"] == "failed":
+        response["message"] = f"Recognition error: {job['error']}"
+    return jsonify(response)
+
+# Multi-photo lecture sessions, merged incrementally one photo at a time
+lecture_sessions = SessionStore()
+
+@app.route('/api/sessions', methods=['POST'])
+def create_session():
+    """Start a lecture session that accumulates several group photos"""
+    session = lecture_sessions.create(parse_classes(request.form))
+    return jsonify({"success": True, **session.to_dict()}), 201
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    session = lecture_sessions.get(session_id)
+    if session is None:
+        return jsonify({"success": False, "message": "Unknown or expired session"}), 404
+    return jsonify({"success": True, **session.to_dict()})
+
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    if not lecture_sessions.delete(session_id):
+        return jsonify({"success": False, "message": "Unknown or expired session"}), 404
+    return jsonify({"success": True})
+
+@app.route('/api/sessions/<session_id>/photos', methods=['POST'])
+def add_session_photo(session_id):
+    """
+    Add one photo to a lecture session. Only the new photo is detected,
+    embedded and matched, its matches are merged into the session keeping
+    the best confidence per student
+    """
+    start_time = time.time()
+    
+    session = lecture_sessions.get(session_id)
+    if session is None:
+        return jsonify({"success": False, "message": "Unknown or expired session"}), 404
+    if len(session.photos) >= SESSION_MAX_PHOTOS:
+        return jsonify({"success": False, "message": f"A session holds at most {SESSION_MAX_PHOTOS} photos"}), 400
+    
+    if 'image' not in request.files:
+        return jsonify({"success": False, "message": "No image provided"}), 400
+    
+    img = decode_image(request.files['image'])
+    if img is None:
+        return jsonify({"success": False, "message": "Failed to read group image"}), 400
+    
+    try:
+        gallery, _ = select_gallery(session.classes)
+        actual_face_count, group_face_features = detect_and_embed_faces(img)
+        
+        face_matrix = np.array([face_data['features'] for face_data in group_face_features]).reshape(-1, 128)
+        matches = match_face_features(gallery, face_matrix, actual_face_count)
+        
+        photo = session.add_photo(matches, actual_face_count, time.time() - start_time)
+        return jsonify({"success": True, "photo": photo, **session.to_dict()})
+    
+    except Exception as e:
+        print(f"Session photo error: {str(e)}")
         return jsonify({
             "success": False,
             "message": f"Recognition error: {str(e)}"
         }), 500
 
 if __name__ == '__main__':
+    init_app()
     app.run(debug=True, port=3000)
\ No newline at end of file
@@ -0,0 +1,320 @@
+import os
+import time
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from metrics import metrics
+
+# Detector used by each endpoint, any name registered below
+UPLOAD_DETECTOR = os.getenv('UPLOAD_DETECTOR', 'haar')  # Single-face check of registration images
+GROUP_DETECTOR = os.getenv('GROUP_DETECTOR', 'mtcnn')  # Group photos and lecture sessions
+VIDEO_DETECTOR = os.getenv('VIDEO_DETECTOR', 'mtcnn')  # Sampled video frames
+
+# OpenCV DNN (ResNet-10 SSD) model files, not shipped with the repo
+DNN_PROTOTXT = os.getenv('DNN_PROTOTXT', 'models/deploy.prototxt')
+DNN_MODEL = os.getenv('DNN_MODEL', 'models/res10_300x300_ssd_iter_140000.caffemodel')
+DNN_CONFIDENCE = float(os.getenv('DNN_CONFIDENCE', '0.5'))
+
+# Tiled detection of large group photos: small faces at the back are found on
+# full-resolution tiles, large ones on a downscaled copy of the whole image.
+# Off by default: a 4000x3000 photo costs ~20 detector passes and up to
+# TILE_WORKERS detector instances, enable it once benchmarks/tiled_detection.py
+# shows the recall gain is worth it on real photos
+TILED_DETECTION = os.getenv('TILED_DETECTION', 'false').lower() == 'true'
+TILE_SIZE = int(os.getenv('TILE_SIZE', '1024'))  # Tile side in pixels, images at most this big are not tiled
+TILE_OVERLAP = int(os.getenv('TILE_OVERLAP', '192'))  # Overlap between neighbouring tiles, larger than a back-row face
+TILE_WORKERS = int(os.getenv('TILE_WORKERS', str(min(8, os.cpu_count() or 1))))  # Tiles detected in parallel
+NMS_IOU_THRESHOLD = 0.3  # Boxes overlapping more than this are the same face
+
+# From Box to DetectorRegistry this file is a copy of backend_1/services/detector_registry.py,
+# keep the two identical. Tiled detection and MTCNN below are specific to this app
+Box = namedtuple('Box', ['x', 'y', 'w', 'h', 'confidence'])
+
+
+def _bgr(image):
+    """BGR array of an ImageContext, or the BGR array itself"""
+    return getattr(image, 'bgr', image)
+
+
+def _gray(image):
+    """Gray view of an ImageContext (cached there), or of a BGR/gray array"""
+    gray = getattr(image, 'gray', None)
+    if gray is not None:
+        return gray
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+class HaarDetector:
+    """OpenCV Haar cascade, fast but frontal faces only"""
+
+    def __init__(self, scale_factor=1.3, min_neighbors=5):
+        self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    def detect(self, image):
+        faces = self.cascade.detectMultiScale(_gray(image), self.scale_factor, self.min_neighbors)
+        return [Box(int(x), int(y), int(w), int(h), 1.0) for x, y, w, h in faces]
+
+
+class DNNDetector:
+    """OpenCV DNN ResNet-10 SSD face detector"""
+
+    def __init__(self, prototxt=DNN_PROTOTXT, model=DNN_MODEL, confidence=DNN_CONFIDENCE):
+        if not os.path.exists(prototxt) or not os.path.exists(model):
+            raise FileNotFoundError(f"OpenCV DNN face model not found ({prototxt}, {model})")
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, model)
+        self.confidence = confidence
+
+    def detect(self, image):
+        image = _bgr(image)
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(image, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+
+        boxes = []
+        for detection in detections[detections[:, 2] >= self.confidence]:
+            x1, y1, x2, y2 = (detection[3:7] * np.array([width, height, width, height])).astype(int)
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(width, x2), min(height, y2)
+            if x2 > x1 and y2 > y1:
+                boxes.append(Box(int(x1), int(y1), int(x2 - x1), int(y2 - y1), float(detection[2])))
+        return boxes
+
+
+class DeepFaceDetector:
+    """A DeepFace detector backend (opencv, ssd, mtcnn, retinaface, mediapipe)"""
+
+    def __init__(self, backend):
+        from deepface import DeepFace
+        self.extract_faces = DeepFace.extract_faces
+        self.backend = backend
+
+    def detect(self, image):
+        faces = self.extract_faces(img_path=_bgr(image), detector_backend=self.backend, enforce_detection=False)
+        boxes = []
+        for face in faces:
+            # Without a detection DeepFace returns the whole image with confidence 0
+            if not face.get('confidence'):
+                continue
+            area = face['facial_area']
+            boxes.append(Box(int(area['x']), int(area['y']), int(area['w']), int(area['h']), float(face['confidence'])))
+        return boxes
+
+
+class DetectorRegistry:
+    """
+    Face detectors behind one detect(image) -> boxes interface.
+
+    Detector objects are not safe to share between threads, so each one is
+    checked out of a per-name pool for the duration of a call: a thread
+    reuses an idle instance and a new one is only built when every existing
+    instance is busy. Unlike thread-local storage this also keeps instances
+    when the server starts a new thread per request.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._deepface_backends = {}
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.timings = {}
+
+    def register(self, name, factory, deepface_backend=None):
+        """
+        Register a detector
+
+        Args:
+            name: Registry key
+            factory: Callable building a detector with a detect(image) method
+            deepface_backend: DeepFace detector_backend name if the detector wraps one
+        """
+        self._factories[name] = factory
+        self._deepface_backends[name] = deepface_backend
+        self._idle[name] = []
+
+    def deepface_backend(self, name):
+        """DeepFace detector_backend behind a detector, None for the OpenCV ones"""
+        if name not in self._factories:
+            raise ValueError(f"Unknown face detector '{name}', expected one of {self.names()}")
+        return self._deepface_backends[name]
+
+    def names(self):
+        return sorted(self._factories)
+
+    def _build(self, name):
+        if name not in self._factories:
+            raise ValueError(f"Unknown face detector '{name}', expected one of {self.names()}")
+
+        start = time.perf_counter()
+        detector = self._factories[name]()
+        build_seconds = time.perf_counter() - start
+
+        with self._lock:
+            timing = self.timings.setdefault(name, {"instances": 0, "build_seconds": 0.0})
+            timing["instances"] += 1
+            timing["build_seconds"] = round(timing["build_seconds"] + build_seconds, 4)
+        print(f"Built {name} detector in {build_seconds:.2f}s")
+        return detector
+
+    @contextmanager
+    def acquire(self, name):
+        """Check out a detector instance, building one if none is idle"""
+        with self._lock:
+            pool = self._idle.get(name)
+            detector = pool.pop() if pool else None
+        if detector is None:
+            detector = self._build(name)
+        try:
+            yield detector
+        finally:
+            with self._lock:
+                self._idle[name].append(detector)
+
+    def detect(self, name, image):
+        """
+        Detect faces with the named detector
+
+        Args:
+            name: Registered detector name
+            image: ImageContext or BGR image
+
+        Returns:
+            list: Box(x, y, w, h, confidence) per face
+        """
+        with self.acquire(name) as detector:
+            with metrics.timer(f'detect_{name}'):
+                boxes = detector.detect(image)
+        metrics.inc('model_invocations_total', model=name)
+        metrics.inc('faces_detected_total', len(boxes), detector=name)
+        return boxes
+
+    def preload(self, names):
+        """Build and warm up one instance of each named detector"""
+        dummy = np.random.randint(0, 255, (160, 160, 3), dtype=np.uint8)
+        for name in sorted(set(names)):
+            try:
+                with self.acquire(name) as detector:
+                    detector.detect(dummy)
+            except Exception as e:
+                print(f"Preloading {name} detector failed: {str(e)}")
+
+    def report(self):
+        """Instances built and total build time per detector"""
+        with self._lock:
+            return {name: dict(timing, idle=len(self._idle[name])) for name, timing in self.timings.items()}
+
+
+def tile_grid(height, width, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """
+    Overlapping tiles covering an image, the last row and column aligned to its edges
+    Returns: list of (x, y, w, h)
+    """
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        stride = max(1, tile_size - overlap)
+        positions = list(range(0, length - tile_size, stride))
+        return positions + [length - tile_size]
+
+    return [
+        (x, y, min(tile_size, width), min(tile_size, height))
+        for y in starts(height) for x in starts(width)
+    ]
+
+
+def nms(boxes, iou_threshold=NMS_IOU_THRESHOLD):
+    """Greedy non-maximum suppression, keeps the most confident of overlapping boxes"""
+    if not boxes:
+        return []
+    coords = np.array([[b.x, b.y, b.x + b.w, b.y + b.h] for b in boxes], dtype=np.float64)
+    areas = (coords[:, 2] - coords[:, 0]) * (coords[:, 3] - coords[:, 1])
+    order = np.argsort([-b.confidence for b in boxes], kind='stable')
+
+    keep = []
+    while len(order):
+        best, rest = order[0], order[1:]
+        keep.append(boxes[best])
+        inter_w = np.clip(np.minimum(coords[best, 2], coords[rest, 2]) - np.maximum(coords[best, 0], coords[rest, 0]), 0, None)
+        inter_h = np.clip(np.minimum(coords[best, 3], coords[rest, 3]) - np.maximum(coords[best, 1], coords[rest, 1]), 0, None)
+        intersection = inter_w * inter_h
+        iou = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return keep
+
+
+class MTCNNDetector:
+    """MTCNN cascade of CNNs, slower but finds small and turned faces"""
+
+    def __init__(self):
+        from mtcnn import MTCNN
+        self.model = MTCNN()
+
+    def detect(self, image):
+        faces = self.model.detect_faces(cv2.cvtColor(_bgr(image), cv2.COLOR_BGR2RGB))
+        return [Box(*[int(v) for v in face['box']], float(face.get('confidence', 1.0))) for face in faces]
+
+
+class TiledDetectorRegistry(DetectorRegistry):
+    """DetectorRegistry that can also detect faces of large group photos on tiles"""
+
+    def detect_tiled(self, name, image, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, workers=TILE_WORKERS):
+        """
+        Detect faces on overlapping full-resolution tiles in parallel, plus
+        one pass over the whole image downscaled to tile_size for faces too
+        big for a tile, and merge everything with NMS
+
+        Args:
+            name: Registered detector name
+            image: BGR image
+            tile_size: Tile side in pixels
+            overlap: Overlap between neighbouring tiles in pixels
+
+        Returns:
+            list: Box(x, y, w, h, confidence) per face in image coordinates
+        """
+        height, width = image.shape[:2]
+        if max(height, width) <= tile_size:
+            return self.detect(name, image)
+
+        def detect_tile(tile):
+            x0, y0, w, h = tile
+            boxes = []
+            for box in self.detect(name, image[y0:y0 + h, x0:x0 + w]):
+                # A face cut by an inner tile edge lies fully inside the neighbouring tile
+                # (the overlap is larger than a small face), big ones come from the global pass
+                if ((box.x <= 1 and x0 > 0) or (box.y <= 1 and y0 > 0) or
+                        (box.x + box.w >= w - 1 and x0 + w < width) or
+                        (box.y + box.h >= h - 1 and y0 + h < height)):
+                    continue
+                boxes.append(box._replace(x=box.x + x0, y=box.y + y0))
+            return boxes
+
+        def detect_global():
+            scale = max(height, width) / tile_size
+            small = cv2.resize(image, (int(round(width / scale)), int(round(height / scale))), interpolation=cv2.INTER_AREA)
+            return [
+                Box(int(b.x * scale), int(b.y * scale), int(b.w * scale), int(b.h * scale), b.confidence)
+                for b in self.detect(name, small)
+            ]
+
+        tiles = tile_grid(height, width, tile_size, overlap)
+        with metrics.timer(f'detect_tiled_{name}'):
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                futures = [pool.submit(detect_tile, tile) for tile in tiles] + [pool.submit(detect_global)]
+                boxes = [box for future in futures for box in future.result()]
+            merged = nms(boxes)
+        print(f"Tiled detection: {len(tiles)} tiles, {len(boxes)} raw boxes, {len(merged)} faces")
+        return merged
+
+
+detectors = TiledDetectorRegistry()
+detectors.register('haar', HaarDetector)
+detectors.register('opencv-dnn', DNNDetector)
+detectors.register('mtcnn', MTCNNDetector)
+for backend in ('retinaface', 'ssd', 'mediapipe'):
+    detectors.register(backend, lambda backend=backend: DeepFaceDetector(backend), deepface_backend=backend)
@@ -0,0 +1,111 @@
+import os
+import cv2
+import numpy as np
+from model_registry import registry, input_size, FACE_MODEL
+from embedding_cache import EmbeddingCache, cache_key
+from metrics import metrics
+from matcher import EMBEDDING_SIZE
+
+MAX_BATCH_SIZE = int(os.getenv('EMBED_MAX_BATCH_SIZE', '32'))  # Faces per Facenet forward pass
+FACE_MARGIN = 0.1  # Margin added around a detected face box on each side
+PREPROCESS_VERSION = 1  # Bump when preprocess_face changes so cached embeddings are not reused
+
+# Identical crops (re-uploads, regeneration of unchanged images) are embedded only once
+embedding_cache = EmbeddingCache()
+
+
+def crop_face(img, box, margin=FACE_MARGIN):
+    """
+    Crop a face from an image with a margin around its box, clipped to the image
+    Returns: crop as a view into img
+    """
+    x, y, width, height = box
+    margin_x = int(width * margin)
+    margin_y = int(height * margin)
+
+    x_start = max(0, x - margin_x)
+    y_start = max(0, y - margin_y)
+    x_end = min(img.shape[1], x + width + margin_x)
+    y_end = min(img.shape[0], y + height + margin_y)
+
+    return img[y_start:y_end, x_start:x_end]
+
+
+def preprocess_face(face_bgr, target_size):
+    """
+    Prepare a BGR face crop the way DeepFace does: RGB, aspect-preserving
+    resize with zero padding to the model input size, scaled to [0, 1]
+    """
+    face = face_bgr[:, :, ::-1]
+    target_h, target_w = target_size
+
+    factor = min(target_h / face.shape[0], target_w / face.shape[1])
+    resized = cv2.resize(face, (max(1, int(face.shape[1] * factor)), max(1, int(face.shape[0] * factor))))
+
+    diff_h = target_h - resized.shape[0]
+    diff_w = target_w - resized.shape[1]
+    padded = np.pad(
+        resized,
+        ((diff_h // 2, diff_h - diff_h // 2), (diff_w // 2, diff_w - diff_w // 2), (0, 0)),
+        'constant'
+    )
+
+    return padded.astype(np.float32) / 255.0
+
+
+def embed_faces(faces, max_batch_size=MAX_BATCH_SIZE, detector=None, cache_new=False):
+    """
+    Embed a list of BGR face crops, reusing cached embeddings of identical
+    crops and running the rest through batched Facenet forward passes
+
+    Args:
+        faces: List of face crops as numpy arrays
+        max_batch_size: Maximum number of faces per forward pass
+        detector: Name of the detector that produced the crops, part of the cache key
+        cache_new: Add newly computed embeddings to the cache. Only for registration
+            images, which are embedded again on regeneration; group, session and
+            video crops never repeat and would evict them
+
+    Returns:
+        (F x 128) float32 array, one row per face
+    """
+    if len(faces) == 0:
+        return np.zeros((0, EMBEDDING_SIZE), dtype=np.float32)
+
+    keys = [cache_key(face, FACE_MODEL, detector, PREPROCESS_VERSION) for face in faces]
+    cached = embedding_cache.get_many(keys)
+
+    # Embed each distinct uncached crop once
+    missing = {}
+    for i, (key, vector) in enumerate(zip(keys, cached)):
+        if vector is None and key not in missing:
+            missing[key] = i
+    metrics.inc('embedding_cache_hits_total', len(faces) - len(missing))
+    metrics.inc('embedding_cache_misses_total', len(missing))
+
+    if missing:
+        computed = dict(zip(missing, _embed_batch([faces[i] for i in missing.values()], max_batch_size)))
+        if cache_new:
+            embedding_cache.put_many(list(computed), list(computed.values()))
+        cached = [vector if vector is not None else computed[key] for key, vector in zip(keys, cached)]
+
+    return np.vstack(cached).reshape(len(faces), -1)
+
+
+def _embed_batch(faces, max_batch_size):
+    model = registry.get('embedder')
+    # DeepFace clients wrap the Keras model, older versions return it directly
+    keras_model = getattr(model, 'model', model)
+    target_size = input_size(model)
+
+    with metrics.timer('preprocess'):
+        batch = np.stack([preprocess_face(face, target_size) for face in faces])
+    embeddings = []
+    with metrics.timer('embed'):
+        for start in range(0, len(batch), max(1, max_batch_size)):
+            chunk = batch[start:start + max_batch_size]
+            embeddings.append(np.asarray(keras_model.predict(chunk, verbose=0), dtype=np.float32))
+            metrics.inc('model_invocations_total', model=FACE_MODEL)
+    metrics.inc('faces_embedded_total', len(faces))
+
+    return np.vstack(embeddings).reshape(len(faces), -1)
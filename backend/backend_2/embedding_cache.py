@@ -0,0 +1,116 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from matcher import EMBEDDING_SIZE
+
+EMBEDDING_CACHE_FILE = os.getenv('EMBEDDING_CACHE_FILE', os.path.join('face_info', 'embedding_cache.bin'))
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '50000'))  # Cached embeddings kept, 0 disables the cache
+KEY_SIZE = 20  # sha1 digest
+
+
+def cache_key(face, model, detector, preprocess_version):
+    """
+    Content address of a face crop for a given embedding pipeline
+    Returns: 20-byte sha1 digest
+    """
+    face = np.ascontiguousarray(face)
+    digest = hashlib.sha1(f"{model}|{detector}|{preprocess_version}|{face.shape}|{face.dtype}|".encode())
+    digest.update(face.data)
+    return digest.digest()
+
+
+class EmbeddingCache:
+    """
+    LRU cache of embeddings keyed by the content hash of the face crop and
+    the model, detector and preprocessing version that produced them.
+
+    Entries are persisted to an append-only file of fixed-size records
+    (key + float32 vector). The file is rewritten with only the live entries,
+    most recently used last, once it holds twice as many records as the cache.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_FILE, max_entries=EMBEDDING_CACHE_SIZE, dim=EMBEDDING_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self.dim = dim
+        self.record_size = KEY_SIZE + dim * 4
+        self.entries = OrderedDict()
+        self.records = 0
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.read_only = False  # Keep new entries in memory only, e.g. in worker processes sharing the file
+
+    def _load(self):
+        self.loaded = True
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+        # Ignore a partially written last record
+        self.records = len(data) // self.record_size
+        records = np.frombuffer(data[:self.records * self.record_size], dtype=np.uint8).reshape(-1, self.record_size)
+        for record in records:
+            key = record[:KEY_SIZE].tobytes()
+            self.entries[key] = record[KEY_SIZE:].view(np.float32).copy()
+            self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_many(self, keys):
+        """
+        Look up several keys
+
+        Returns:
+            list: Cached vector or None for every key
+        """
+        if self.max_entries <= 0:
+            return [None] * len(keys)
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            vectors = []
+            for key in keys:
+                vector = self.entries.get(key)
+                if vector is not None:
+                    self.entries.move_to_end(key)
+                vectors.append(vector)
+            return vectors
+
+    def put_many(self, keys, vectors):
+        """Store embeddings and append them to the cache file"""
+        if self.max_entries <= 0 or len(keys) == 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), self.dim)
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            for key, vector in zip(keys, vectors):
+                self.entries[key] = vector.copy()
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            if self.read_only:
+                return
+
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                if self.records + len(keys) > 2 * self.max_entries:
+                    self._rewrite()
+                else:
+                    with open(self.path, "ab") as f:
+                        f.write(b"".join(key + vector.tobytes() for key, vector in zip(keys, vectors)))
+                    self.records += len(keys)
+            except OSError as e:
+                print(f"Error writing embedding cache: {str(e)}")
+
+    def _rewrite(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(key + vector.tobytes() for key, vector in self.entries.items()))
+        os.replace(tmp_path, self.path)
+        self.records = len(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,367 @@
+import os
+import json
+import pickle
+import threading
+import numpy as np
+from matcher import GalleryMatcher, EMBEDDING_SIZE
+from ann_index import create_index, load_index, ANN_INDEX, ANN_MIN_ROWS, ANN_CANDIDATES
+
+VECTORS_FILE = 'embeddings.f32'
+INDEX_FILE = 'embeddings_index.jsonl'
+ANN_FILE = 'ann_index.npz'
+ANN_SAVE_EVERY = 1000  # Persist the ANN index after this many unsaved inserts
+LEGACY_PIPELINE = 'legacy'  # Rows imported from feature files of an unknown pipeline
+
+
+class EmbeddingStore:
+    """
+    Single on-disk store for all student embeddings.
+
+    Vectors live in one contiguous float32 file that is memory-mapped, and every
+    row has a line in a compact JSON-lines index (student id, name, roll_no,
+    class, slot, pipeline). Appends never rewrite existing rows: a newer row for
+    the same (student id, slot) simply supersedes the older one until the store is
+    compacted. Rows built by another embedding pipeline are not comparable and
+    are ignored until the slot is embedded again.
+    """
+
+    def __init__(self, folder, dim=EMBEDDING_SIZE, ann_kind=ANN_INDEX, ann_min_rows=ANN_MIN_ROWS, pipeline=None):
+        self.folder = folder
+        self.dim = dim
+        self.pipeline = pipeline
+        self.vectors_path = os.path.join(folder, VECTORS_FILE)
+        self.index_path = os.path.join(folder, INDEX_FILE)
+        self.ann_path = os.path.join(folder, ANN_FILE)
+        self.ann_kind = ann_kind
+        self.ann_min_rows = ann_min_rows
+        self.ann = None
+        self._ann_unsaved = 0
+        self.lock = threading.Lock()
+        self.version = 0
+
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._index = []
+        self._latest = {}
+        self._galleries = {}
+        self._galleries_version = -1
+
+        os.makedirs(folder, exist_ok=True)
+
+    def load(self):
+        """Memory-map the vectors file and read the metadata index"""
+        with self.lock:
+            self._index = []
+            if os.path.exists(self.index_path):
+                with open(self.index_path, "r") as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            self._index.append(json.loads(line))
+            self._map_vectors()
+            self._index_latest()
+            self._load_ann()
+            self.version += 1
+        return self
+
+    def _index_latest(self):
+        self._latest = {(entry["id"], entry["slot"]): row for row, entry in enumerate(self._index)}
+
+    def _load_ann(self):
+        """Load the persisted ANN index and catch it up with rows appended since it was saved"""
+        try:
+            ann = load_index(self.ann_path)
+        except Exception as e:
+            print(f"Rebuilding ANN index, failed to load it: {str(e)}")
+            ann = None
+        if ann is None or ann.kind != self.ann_kind or len(ann) > len(self._index):
+            ann = create_index(self.ann_kind, self.dim)
+
+        if len(ann) < len(self._index):
+            start = len(ann)
+            ann.add(np.asarray(self._vectors[start:]), np.arange(start, len(self._index)))
+            ann.save(self.ann_path)
+
+        # Superseded and other-pipeline rows would otherwise take candidate slots in every search
+        active = np.zeros(len(self._index), dtype=bool)
+        active[self._active_rows()] = True
+        ann.remove(np.flatnonzero(~active))
+
+        self.ann = ann
+        self._ann_unsaved = 0
+
+    def _map_vectors(self):
+        rows = 0
+        if os.path.exists(self.vectors_path):
+            rows = os.path.getsize(self.vectors_path) // (self.dim * 4)
+
+        # A crash between the vector write and the index write leaves extra rows, ignore them
+        rows = min(rows, len(self._index))
+        self._index = self._index[:rows]
+
+        if rows == 0:
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        else:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+
+    def __len__(self):
+        return len(self._index)
+
+    def append(self, student_id, name, roll_no, student_class, slot, vector):
+        """
+        Append one embedding for a student image slot
+
+        Args:
+            student_id: Student folder id (name_rollno)
+            name: Student name
+            roll_no: Student roll number
+            student_class: Student class
+            slot: Image index (0-4)
+            vector: 128-d embedding
+
+        Returns:
+            bool: True if the vector was stored
+        """
+        return self.append_many([(student_id, name, roll_no, student_class, slot, vector)]) > 0
+
+    def append_many(self, entries, pipeline=None):
+        """
+        Append several (student_id, name, roll_no, class, slot, vector) entries in one write
+
+        Args:
+            entries: Entries to append
+            pipeline: Pipeline that built the vectors, the store's current one by default
+
+        Returns:
+            int: Number of vectors stored
+        """
+        pipeline = pipeline or self.pipeline
+        rows = []
+        metadata = []
+        for student_id, name, roll_no, student_class, slot, vector in entries:
+            vector = np.asarray(vector, dtype=np.float32).flatten()
+            if vector.size != self.dim:
+                print(f"Skipping embedding for {student_id} slot {slot}: unexpected size {vector.size}")
+                continue
+            rows.append(vector)
+            metadata.append({
+                "id": student_id,
+                "name": name,
+                "roll_no": roll_no,
+                "class": student_class,
+                "slot": int(slot),
+                "pipeline": pipeline
+            })
+
+        if not rows:
+            return 0
+
+        with self.lock:
+            # Vectors first, then the index, so a crash never leaves an index row without data
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.vstack(rows).astype(np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_path, "a") as f:
+                for entry in metadata:
+                    f.write(json.dumps(entry) + "\n")
+
+            start = len(self._index)
+            new_rows = np.arange(start, start + len(rows))
+            # Rows the new ones supersede, and the new ones too if another pipeline built them,
+            # would otherwise take candidate slots in every search
+            stale = [self._latest[(entry["id"], entry["slot"])] for entry in metadata
+                     if (entry["id"], entry["slot"]) in self._latest]
+            if pipeline != self.pipeline:
+                stale.extend(new_rows)
+
+            self._index.extend(metadata)
+            self._map_vectors()
+            for row, entry in zip(new_rows, metadata):
+                self._latest[(entry["id"], entry["slot"])] = int(row)
+
+            # Incremental insert, the index is only rewritten to disk every ANN_SAVE_EVERY rows
+            self.ann.add(np.vstack(rows), new_rows)
+            self.ann.remove(stale)
+            self._ann_unsaved += len(rows)
+            if self._ann_unsaved >= ANN_SAVE_EVERY:
+                self.ann.save(self.ann_path)
+                self._ann_unsaved = 0
+
+            self.version += 1
+
+        return len(rows)
+
+    def _active_rows(self, classes=None):
+        """
+        Latest row per (student id, slot) if it was built by the current pipeline,
+        optionally only for students of the given classes
+        """
+        rows = sorted(row for row in self._latest.values() if self._index[row].get("pipeline") == self.pipeline)
+        if classes is not None:
+            rows = [row for row in rows if self._index[row]["class"] in classes]
+        return rows
+
+    def classes(self):
+        """Classes that have at least one stored embedding"""
+        with self.lock:
+            classes = {self._index[row]["class"] for row in self._active_rows()}
+            return sorted(str(student_class) for student_class in classes if student_class is not None)
+
+    def slots(self):
+        """Set of (student id, slot) that have a stored embedding"""
+        with self.lock:
+            return {(self._index[row]["id"], self._index[row]["slot"]) for row in self._active_rows()}
+
+    def students(self):
+        """
+        Get the students present in the store
+
+        Returns:
+            list: Student dicts with id, name, roll_no, class and the slots they have
+        """
+        with self.lock:
+            rows = self._active_rows()
+            students = {}
+            for row in rows:
+                entry = self._index[row]
+                student = students.setdefault(entry["id"], {
+                    "id": entry["id"],
+                    "name": entry["name"],
+                    "roll_no": entry["roll_no"],
+                    "class": entry["class"],
+                    "slots": []
+                })
+                student["slots"].append(entry["slot"])
+            return list(students.values())
+
+    def gallery(self, classes=None):
+        """
+        Get a GalleryMatcher over the active rows, rebuilt only when the store changed
+
+        Args:
+            classes: Optional collection of classes, only their partition is loaded and searched
+
+        Returns:
+            GalleryMatcher
+        """
+        key = frozenset(classes) if classes else None
+        with self.lock:
+            if self._galleries_version != self.version:
+                self._galleries = {}
+                self._galleries_version = self.version
+            if key in self._galleries:
+                return self._galleries[key]
+
+            rows = self._active_rows(key)
+            students = []
+            student_positions = {}
+            row_to_student = []
+
+            for row in rows:
+                entry = self._index[row]
+                if entry["id"] not in student_positions:
+                    student_positions[entry["id"]] = len(students)
+                    students.append({
+                        "id": entry["id"],
+                        "name": entry["name"],
+                        "roll_no": entry["roll_no"],
+                        "class": entry["class"]
+                    })
+                row_to_student.append(student_positions[entry["id"]])
+
+            vectors = np.asarray(self._vectors[rows]) if rows else np.zeros((0, self.dim), dtype=np.float32)
+
+            # Large global galleries search the ANN index instead of scoring every row,
+            # class partitions are small enough for the full matrix multiply
+            ann_options = {}
+            if key is None and len(rows) >= self.ann_min_rows:
+                index_to_student = np.full(len(self._index), -1, dtype=np.int64)
+                index_to_student[rows] = row_to_student
+                ann_options = {
+                    "index": self.ann,
+                    "index_to_student": index_to_student,
+                    "candidates": ANN_CANDIDATES
+                }
+
+            gallery = GalleryMatcher.from_rows(students, vectors, row_to_student, **ann_options)
+            self._galleries[key] = gallery
+            return gallery
+
+    def compact(self):
+        """Rewrite the store keeping only the latest current-pipeline row per (student id, slot)"""
+        with self.lock:
+            rows = self._active_rows()
+            if len(rows) == len(self._index):
+                return
+
+            vectors = np.asarray(self._vectors[rows], dtype=np.float32)
+            index = [self._index[row] for row in rows]
+
+            tmp_vectors = self.vectors_path + ".tmp"
+            tmp_index = self.index_path + ".tmp"
+            with open(tmp_vectors, "wb") as f:
+                f.write(vectors.tobytes())
+            with open(tmp_index, "w") as f:
+                for entry in index:
+                    f.write(json.dumps(entry) + "\n")
+
+            # Drop the memory map before replacing the file underneath it
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+            os.replace(tmp_vectors, self.vectors_path)
+            os.replace(tmp_index, self.index_path)
+
+            self._index = index
+            self._map_vectors()
+            self._index_latest()
+
+            # Row numbers changed, rebuild the ANN index from scratch
+            if os.path.exists(self.ann_path):
+                os.remove(self.ann_path)
+            self._load_ann()
+            self.version += 1
+
+    def import_legacy(self, face_info_folder, slots=5):
+        """
+        One-time import of per-student info.json and features_{i}.pkl files.
+        Their pipeline is unknown, so the rows are tagged LEGACY_PIPELINE and
+        only serve as stale slots for regeneration to replace.
+
+        Returns:
+            int: Number of vectors imported
+        """
+        entries = []
+        for student_folder in sorted(os.listdir(face_info_folder)):
+            folder_path = os.path.join(face_info_folder, student_folder)
+            info_path = os.path.join(folder_path, "info.json")
+            if not os.path.isdir(folder_path) or not os.path.exists(info_path):
+                continue
+
+            try:
+                with open(info_path, "r") as f:
+                    student_info = json.load(f)
+            except Exception as e:
+                print(f"Error loading student info for {student_folder}: {str(e)}")
+                continue
+
+            for i in range(slots):
+                feature_path = os.path.join(folder_path, f"features_{i}.pkl")
+                if not os.path.exists(feature_path):
+                    continue
+                try:
+                    with open(feature_path, "rb") as f:
+                        features = pickle.load(f)
+                except Exception as e:
+                    print(f"Error loading {feature_path}: {str(e)}")
+                    continue
+                if features is None:
+                    continue
+                entries.append((
+                    student_folder,
+                    student_info.get("name"),
+                    student_info.get("roll_no"),
+                    student_info.get("class"),
+                    i,
+                    features
+                ))
+
+        return self.append_many(entries, pipeline=LEGACY_PIPELINE)
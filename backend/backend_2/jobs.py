@@ -0,0 +1,129 @@
+import os
+import time
+import uuid
+import queue
+import threading
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))  # Jobs processed in parallel
+JOB_QUEUE_DEPTH = int(os.getenv('JOB_QUEUE_DEPTH', '20'))  # Waiting jobs before new ones are rejected
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', '3600'))  # Seconds a finished job can still be fetched
+
+
+class JobQueue:
+    """
+    Bounded local job queue with a fixed pool of worker threads.
+
+    submit() never blocks: when the queue is full it returns None so the
+    caller can answer 429. Finished jobs are kept for result_ttl seconds.
+    With track_progress the handler gets a progress(dict) callback whose
+    last value is exposed as the job's "progress".
+    """
+
+    def __init__(self, handler, workers=JOB_WORKERS, max_queue=JOB_QUEUE_DEPTH, result_ttl=JOB_RESULT_TTL,
+                 track_progress=False):
+        self.handler = handler
+        self.track_progress = track_progress
+        self.result_ttl = result_ttl
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.workers = workers
+        self.started = False
+
+    def _start(self):
+        # Worker threads start with the first job, not when the queue is created at import time
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        for i in range(self.workers):
+            worker = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+
+    def submit(self, *args, **kwargs):
+        """
+        Queue a call of the handler
+
+        Returns:
+            str: job id, or None when the queue is full
+        """
+        self._start()
+        job_id = str(uuid.uuid4())
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "progress": None,
+            "result": None,
+            "error": None
+        }
+
+        self._evict_expired()
+        with self.lock:
+            self.jobs[job_id] = job
+        try:
+            self.queue.put_nowait((job_id, args, kwargs))
+        except queue.Full:
+            with self.lock:
+                del self.jobs[job_id]
+            return None
+        return job_id
+
+    def get(self, job_id):
+        """Snapshot of a job, None if unknown or expired"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def active(self):
+        """Ids of queued and running jobs, oldest first"""
+        with self.lock:
+            return [job_id for job_id, job in self.jobs.items() if job["status"] in ("queued", "running")]
+
+    def pending(self):
+        """Number of jobs waiting for a worker"""
+        return self.queue.qsize()
+
+    def _work(self):
+        while True:
+            job_id, args, kwargs = self.queue.get()
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job:
+                    job["status"] = "running"
+                    job["started_at"] = time.time()
+
+            if self.track_progress:
+                kwargs = dict(kwargs, progress=lambda progress, job_id=job_id: self._set_progress(job_id, progress))
+            try:
+                result = self.handler(*args, **kwargs)
+                status, error = "done", None
+            except Exception as e:
+                print(f"Job {job_id} failed: {str(e)}")
+                result, status, error = None, "failed", str(e)
+
+            with self.lock:
+                if job:
+                    job["status"] = status
+                    job["result"] = result
+                    job["error"] = error
+                    job["finished_at"] = time.time()
+            self.queue.task_done()
+
+    def _set_progress(self, job_id, progress):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job:
+                job["progress"] = dict(progress)
+
+    def _evict_expired(self):
+        now = time.time()
+        with self.lock:
+            expired = [
+                job_id for job_id, job in self.jobs.items()
+                if job["finished_at"] and now - job["finished_at"] > self.result_ttl
+            ]
+            for job_id in expired:
+                del self.jobs[job_id]
@@ -0,0 +1,254 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+EMBEDDING_SIZE = 128  # Facenet embedding dimension
+MATCH_THRESHOLD = 0.4  # Cosine distance threshold for matching (lower is better)
+RELAXED_MATCH_THRESHOLD = 0.5  # Second pass threshold for faces left unmatched
+MIN_TEMPLATE_VOTES = 2  # Stored vectors of a student that must agree in the second pass
+
+
+def normalize_rows(vectors):
+    """
+    L2-normalise each row of a 2D array so a dot product equals cosine similarity
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Zero vectors stay zero instead of turning into NaN
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def assign_faces(similarities, threshold=MATCH_THRESHOLD):
+    """
+    Optimal one-to-one assignment of faces to students (Hungarian algorithm)
+    maximising the total similarity over all pairs under the distance threshold.
+    A face may stay unassigned, so a weak match never displaces a stronger one.
+
+    Args:
+        similarities: (F x S) face to student similarities
+        threshold: Maximum cosine distance for a match
+
+    Returns:
+        list: Student index (or None) for every face
+    """
+    num_faces, num_students = similarities.shape
+    matches = [None] * num_faces
+    if num_faces == 0 or num_students == 0:
+        return matches
+
+    valid = (similarities > 0) & ((1 - similarities) < threshold)
+    scores = np.where(valid, similarities, -np.inf)
+
+    # Other faces can take at most F-1 students, so some optimal assignment
+    # only uses each face's top F candidates: solve on the union of those columns
+    top = min(num_faces, num_students)
+    candidates = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    columns = np.unique(candidates[np.isfinite(candidate_scores)])
+    if len(columns) == 0:
+        return matches
+
+    sub_scores = scores[:, columns]
+    # One zero-cost "unassigned" column per face, invalid pairs cost more than staying unassigned
+    cost = np.hstack([
+        np.where(np.isfinite(sub_scores), -sub_scores, 1.0),
+        np.zeros((num_faces, num_faces), dtype=np.float32)
+    ])
+    face_ids, column_ids = linear_sum_assignment(cost)
+
+    for face, column in zip(face_ids, column_ids):
+        if column < len(columns) and np.isfinite(sub_scores[face, column]):
+            matches[face] = int(columns[column])
+    return matches
+
+
+class GalleryMatcher:
+    """
+    Keeps every stored feature vector of every student as one L2-normalised
+    (N x 128) matrix, with a row -> student index, so all faces of a group
+    photo can be scored against the whole gallery in a single matrix multiply.
+    """
+
+    def __init__(self, students, matrix, row_to_student, index=None, index_to_student=None, candidates=50):
+        # Students without rows would break reduceat, so drop them and reindex
+        present = np.unique(row_to_student)
+        if len(present) != len(students):
+            remap = np.full(len(students), -1, dtype=np.int64)
+            remap[present] = np.arange(len(present))
+            students = [students[i] for i in present]
+            row_to_student = remap[row_to_student]
+            if index_to_student is not None:
+                index_to_student = np.where(index_to_student >= 0, remap[np.maximum(index_to_student, 0)], -1)
+
+        self.students = students
+        self.matrix = matrix
+        self.row_to_student = row_to_student
+
+        # Optional ANN index: its ids map to student positions (-1 for rows not in the gallery)
+        self.index = index
+        self.index_to_student = index_to_student
+        self.candidates = candidates
+
+        # Rows of the same student are contiguous, remember where each block starts
+        if len(row_to_student) > 0:
+            self.offsets = np.flatnonzero(np.r_[True, np.diff(row_to_student) != 0])
+        else:
+            self.offsets = np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def from_rows(cls, students, vectors, row_to_student, **kwargs):
+        """
+        Build the gallery from stored vectors in any order
+
+        Args:
+            students: List of student dicts
+            vectors: (N x 128) array of raw embeddings
+            row_to_student: Index into students for every row of vectors
+
+        Returns:
+            GalleryMatcher
+        """
+        row_to_student = np.asarray(row_to_student, dtype=np.int64)
+        if len(row_to_student) == 0:
+            return cls(students, np.zeros((0, EMBEDDING_SIZE), dtype=np.float32), row_to_student, **kwargs)
+
+        # Group the rows of each student together so reduceat can take per-student maxima
+        order = np.argsort(row_to_student, kind='stable')
+        matrix = normalize_rows(np.asarray(vectors, dtype=np.float32)[order])
+        return cls(students, matrix, row_to_student[order], **kwargs)
+
+    @classmethod
+    def from_students(cls, students):
+        """
+        Build the gallery from student dicts carrying a 'features' list of 128-d vectors.
+        Students without a single valid vector are left out of the gallery.
+        """
+        kept_students = []
+        rows = []
+        row_to_student = []
+
+        for student in students:
+            vectors = [
+                np.asarray(features, dtype=np.float32).flatten()
+                for features in student.get('features', [])
+                if features is not None
+            ]
+            vectors = [v for v in vectors if v.size == EMBEDDING_SIZE]
+            if not vectors:
+                continue
+
+            student_index = len(kept_students)
+            kept_students.append(student)
+            rows.extend(vectors)
+            row_to_student.extend([student_index] * len(vectors))
+
+        return cls.from_rows(kept_students, np.array(rows).reshape(-1, EMBEDDING_SIZE), row_to_student)
+
+    def __len__(self):
+        return len(self.students)
+
+    def student_similarities(self, face_features):
+        """
+        Score faces against the gallery
+
+        Args:
+            face_features: (F x 128) array of face embeddings
+
+        Returns:
+            (F x S) array holding, for every face, the best cosine similarity
+            over each student's stored vectors
+        """
+        faces = normalize_rows(np.asarray(face_features, dtype=np.float32).reshape(-1, EMBEDDING_SIZE))
+        if len(self.students) == 0 or faces.shape[0] == 0:
+            return np.zeros((faces.shape[0], len(self.students)), dtype=np.float32)
+
+        if self.index is not None:
+            return self._index_similarities(faces)
+
+        row_similarities = faces @ self.matrix.T
+        return np.maximum.reduceat(row_similarities, self.offsets, axis=1)
+
+    def _index_similarities(self, faces):
+        """
+        Per-student similarities from the ANN candidates of each face.
+        Students outside a face's candidate list score -inf for that face.
+        """
+        row_similarities, ids = self.index.search(faces, self.candidates)
+        student_ids = np.where(ids >= 0, self.index_to_student[np.maximum(ids, 0)], -1)
+
+        similarities = np.full((faces.shape[0], len(self.students)), -np.inf, dtype=np.float32)
+        face_ids, candidate_ids = np.nonzero(student_ids >= 0)
+        np.maximum.at(
+            similarities,
+            (face_ids, student_ids[face_ids, candidate_ids]),
+            row_similarities[face_ids, candidate_ids]
+        )
+        return similarities
+
+    def match(self, face_features, threshold=MATCH_THRESHOLD):
+        """
+        Match faces to students with a global one-to-one assignment over the
+        full face x student similarity matrix
+
+        Args:
+            face_features: (F x 128) array of face embeddings
+            threshold: Maximum cosine distance for a match
+
+        Returns:
+            list: One (student, similarity) tuple per face, student is None when unmatched
+                  (similarity is then the face's best score, for logging)
+        """
+        similarities = self.student_similarities(face_features)
+        matches = []
+
+        for face, student_index in enumerate(assign_faces(similarities, threshold)):
+            if student_index is not None:
+                matches.append((self.students[student_index], float(similarities[face, student_index])))
+            elif len(self.students) > 0:
+                matches.append((None, float(np.max(similarities[face]))))
+            else:
+                matches.append((None, 0.0))
+
+        return matches
+
+    def second_pass(self, face_features, matches, threshold=RELAXED_MATCH_THRESHOLD, min_votes=MIN_TEMPLATE_VOTES):
+        """
+        Second chance for faces the first pass left unmatched, reusing the
+        embeddings already computed. A relaxed threshold is only accepted when
+        several of a student's stored vectors agree (multi-template voting),
+        so a single lucky template cannot produce a match.
+
+        Args:
+            face_features: (F x 128) array of face embeddings
+            matches: Result of match() for the same faces
+            threshold: Relaxed maximum cosine distance
+            min_votes: Stored vectors that must be within the threshold
+
+        Returns:
+            list: matches with newly recognized students filled in
+        """
+        unmatched_faces = [face for face, (student, _) in enumerate(matches) if student is None]
+        if not unmatched_faces or len(self.students) == 0:
+            return matches
+
+        claimed = {id(student) for student, _ in matches if student is not None}
+        faces = normalize_rows(np.asarray(face_features, dtype=np.float32).reshape(-1, EMBEDDING_SIZE))
+        faces = faces[unmatched_faces]
+
+        row_similarities = faces @ self.matrix.T
+        best = np.maximum.reduceat(row_similarities, self.offsets, axis=1)
+        votes = np.add.reduceat((1 - row_similarities < threshold).astype(np.int32), self.offsets, axis=1)
+
+        # A student with fewer stored vectors than min_votes needs all of them to agree
+        templates = np.diff(np.r_[self.offsets, len(self.row_to_student)])
+        required = np.minimum(templates, min_votes)
+        eligible = (votes >= required) & np.array([id(s) not in claimed for s in self.students])[None, :]
+
+        scores = np.where(eligible, best, -np.inf)
+        matches = list(matches)
+        for position, student_index in enumerate(assign_faces(scores, threshold)):
+            if student_index is not None:
+                matches[unmatched_faces[position]] = (self.students[student_index], float(best[position, student_index]))
+        return matches
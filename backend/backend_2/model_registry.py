@@ -0,0 +1,95 @@
+import time
+import threading
+import numpy as np
+from deepface import DeepFace
+
+FACE_MODEL = "Facenet"
+
+# ModelRegistry and the helpers up to _warmup_embedder are a copy of
+# backend_1/services/model_registry.py, keep the two identical
+
+class ModelRegistry:
+    """Loads each model once per process, warms it up and records the cold-start cost"""
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._lock = threading.Lock()
+        self.timings = {}
+
+    def register(self, name, loader, warmup=None):
+        """
+        Register a model
+
+        Args:
+            name: Registry key
+            loader: Callable returning the loaded model
+            warmup: Optional callable running one inference on the loaded model
+        """
+        self._loaders[name] = (loader, warmup)
+
+    def load(self, name):
+        """Load and warm up a model, replacing any cached instance"""
+        loader, warmup = self._loaders[name]
+
+        start = time.perf_counter()
+        model = loader()
+        load_seconds = time.perf_counter() - start
+
+        warmup_seconds = None
+        if warmup:
+            start = time.perf_counter()
+            try:
+                warmup(model)
+            except Exception as e:
+                print(f"Warm-up failed for {name}: {str(e)}")
+            warmup_seconds = time.perf_counter() - start
+
+        self._models[name] = model
+        self.timings[name] = {
+            "load_seconds": round(load_seconds, 4),
+            "warmup_seconds": round(warmup_seconds, 4) if warmup_seconds is not None else None
+        }
+        print(f"Loaded {name} in {load_seconds:.2f}s (warm-up {warmup_seconds or 0:.2f}s)")
+        return model
+
+    def load_all(self):
+        """Load every registered model"""
+        for name in self._loaders:
+            self.get(name)
+        return self
+
+    def get(self, name):
+        """Get a model, loading it on first use if it was not preloaded"""
+        if name not in self._models:
+            with self._lock:
+                if name not in self._models:
+                    self.load(name)
+        return self._models[name]
+
+    def report(self):
+        """Per-model load and warm-up times"""
+        return {name: dict(timing) for name, timing in self.timings.items()}
+
+def input_size(model):
+    """Model input (height, width) for both DeepFace client objects and raw Keras models"""
+    shape = tuple(getattr(model, 'input_shape'))
+    if len(shape) == 4:
+        shape = shape[1:3]
+    return int(shape[0]), int(shape[1])
+
+def _dummy_face():
+    """Dummy face-sized image used for warm-up inferences"""
+    return np.random.randint(0, 255, (160, 160, 3), dtype=np.uint8)
+
+def _warmup_embedder(model):
+    DeepFace.represent(
+        img_path=_dummy_face(),
+        model_name=FACE_MODEL,
+        detector_backend='skip',
+        enforce_detection=False
+    )
+
+# Face detectors live in detectors.DetectorRegistry
+registry = ModelRegistry()
+registry.register('embedder', lambda: DeepFace.build_model(FACE_MODEL), _warmup_embedder)
@@ -8,7 +8,10 @@ import uuid
 import shutil
 import json
 import time
+import threading
 from concurrent.futures import ThreadPoolExecutor
+from matcher import GalleryMatcher, EMBEDDING_SIZE
+from embedder import embed_faces
 
 app = Flask(__name__)
 CORS(app)
@@ -16,7 +19,7 @@ CORS(app)
 UPLOAD_FOLDER = 'uploads'
 EMBEDDINGS_FOLDER = 'embeddings'
 CONFIDENCE_THRESHOLD = 0.45  # Adjusted threshold for face matching
-MAX_WORKERS = 4  # For parallel processing
+MAX_WORKERS = 4  # Parallel file loading when building the gallery
 
 # Create folders if they don't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -55,17 +58,124 @@ def detect_face(image_path):
     except Exception as e:
         return False, f"Error: {str(e)}"
 
-def create_embedding(image_path):
+def align_face(image_path):
     """
-    Creates facial embedding using FaceNet
+    Detects and aligns the face of a registration image the way DeepFace.represent does
+    Returns: BGR uint8 face crop, or None
     """
     try:
-        embedding = DeepFace.represent(img_path=image_path, model_name="Facenet", enforce_detection=False)
-        return embedding
+        faces = DeepFace.extract_faces(img_path=image_path, detector_backend="opencv", enforce_detection=False, align=True)
+        # extract_faces returns RGB in [0, 1], embed_faces takes BGR crops like cv2.imread
+        return (faces[0]["face"][:, :, ::-1] * 255).astype(np.uint8)
     except Exception as e:
-        print(f"Error creating embedding: {str(e)}")
+        print(f"Error aligning face: {str(e)}")
         return None
 
+def create_embeddings(image_paths):
+    """
+    Creates the embeddings of several registration images: each face is aligned
+    once and all of them go through FaceNet in a single batched forward pass
+    Returns: list with a 128-d float32 vector or None per image
+    """
+    faces = [align_face(image_path) for image_path in image_paths]
+    aligned = [i for i, face in enumerate(faces) if face is not None]
+    embeddings = [None] * len(image_paths)
+    try:
+        vectors = embed_faces([faces[i] for i in aligned], detector="opencv", cache_new=True)
+        for i, vector in zip(aligned, vectors):
+            embeddings[i] = vector
+    except Exception as e:
+        print(f"Error creating embeddings: {str(e)}")
+    return embeddings
+
+def save_student(name, roll_no, student_class, embeddings):
+    """
+    Write info.json and one embedding_{i}.npy per image, then refresh the gallery
+    """
+    embedding_folder = os.path.join(EMBEDDINGS_FOLDER, f"{name}_{roll_no}")
+    os.makedirs(embedding_folder, exist_ok=True)
+    
+    # Save student info
+    student_info = {
+        "name": name,
+        "roll_no": roll_no,
+        "class": student_class
+    }
+    
+    with open(os.path.join(embedding_folder, "info.json"), "w") as f:
+        json.dump(student_info, f)
+    
+    # Save each embedding
+    for i, emb in enumerate(embeddings):
+        embedding_path = os.path.join(embedding_folder, f"embedding_{i}.npy")
+        np.save(embedding_path, emb)
+    
+    # Next recognition picks up the new student
+    invalidate_gallery()
+
+def load_embedding(embedding_path):
+    """
+    Load a saved embedding file
+    Older registrations saved the raw DeepFace.represent output (list of dicts)
+    Returns: 128-d float32 vector or None
+    """
+    try:
+        data = np.load(embedding_path, allow_pickle=True)
+        if data.dtype == object:
+            data = np.asarray(data.flat[0]["embedding"])
+        data = np.asarray(data, dtype=np.float32).flatten()
+        return data if data.size == EMBEDDING_SIZE else None
+    except Exception as e:
+        print(f"Error loading {embedding_path}: {str(e)}")
+        return None
+
+def load_student(student_folder):
+    """
+    Load info.json and embedding_{i}.npy files of one student
+    Returns: student dict with 'features', or None
+    """
+    folder_path = os.path.join(EMBEDDINGS_FOLDER, student_folder)
+    try:
+        with open(os.path.join(folder_path, "info.json"), "r") as f:
+            student_info = json.load(f)
+    except Exception as e:
+        print(f"Error loading student info: {str(e)}")
+        return None
+
+    student_info["features"] = [
+        load_embedding(os.path.join(folder_path, f"embedding_{i}.npy"))
+        for i in range(5)
+        if os.path.exists(os.path.join(folder_path, f"embedding_{i}.npy"))
+    ]
+    return student_info
+
+# Gallery of stored embeddings, rebuilt after a registration completes
+_gallery = None
+_gallery_lock = threading.Lock()
+
+def get_gallery():
+    """
+    Build (or reuse) the matcher over every student's saved embeddings
+    Loading the files is I/O bound, so it is spread over the thread pool
+    """
+    global _gallery
+    with _gallery_lock:
+        if _gallery is None:
+            student_folders = [
+                folder for folder in os.listdir(EMBEDDINGS_FOLDER)
+                if os.path.isdir(os.path.join(EMBEDDINGS_FOLDER, folder))
+            ]
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                students = [s for s in executor.map(load_student, student_folders) if s]
+            _gallery = GalleryMatcher.from_students(students)
+            print(f"Loaded gallery with {len(_gallery)} students")
+        return _gallery
+
+def invalidate_gallery():
+    global _gallery
+    with _gallery_lock:
+        _gallery = None
+
 @app.route('/api/upload-face', methods=['POST'])
 def upload_face():
     if 'image' not in request.files:
@@ -96,33 +206,16 @@ def upload_face():
     
     # If this is the last image (index 4), create embeddings for all images
     if image_index == 4:
-        user_embeddings = []
-        
-        for i in range(5):
-            img_path = os.path.join(user_folder, f"image_{i}.jpg")
-            embedding = create_embedding(img_path)
-            if embedding:
-                user_embeddings.append(embedding)
+        user_embeddings = [
+            embedding for embedding in create_embeddings(
+                [os.path.join(user_folder, f"image_{i}.jpg") for i in range(5)]
+            )
+            if embedding is not None
+        ]
         
         # Save embeddings
         if len(user_embeddings) == 5:
-            embedding_folder = os.path.join(EMBEDDINGS_FOLDER, f"{name}_{roll_no}")
-            os.makedirs(embedding_folder, exist_ok=True)
-            
-            # Save student info
-            student_info = {
-                "name": name,
-                "roll_no": roll_no,
-                "class": student_class
-            }
-            
-            with open(os.path.join(embedding_folder, "info.json"), "w") as f:
-                json.dump(student_info, f)
-            
-            # Save each embedding
-            for i, emb in enumerate(user_embeddings):
-                embedding_path = os.path.join(embedding_folder, f"embedding_{i}.npy")
-                np.save(embedding_path, np.array(emb))
+            save_student(name, roll_no, student_class, user_embeddings)
             
             return jsonify({
                 "success": True, 
@@ -139,26 +232,60 @@ def upload_face():
         "message": f"Image {image_index+1} uploaded and validated successfully"
     })
 
-def verify_face(args):
+@app.route('/api/register-student', methods=['POST'])
+def register_student():
     """
-    Worker function for parallel verification
+    Register a student with all 5 images in one request: the images are
+    checked and embedded in parallel and the student is saved once
     """
-    group_image_path, student_img_path, student_info = args
-    try:
-        verification = DeepFace.verify(
-            img1_path=group_image_path,
-            img2_path=student_img_path,
-            model_name="Facenet",
-            distance_metric="cosine",
-            detector_backend="opencv",
-            enforce_detection=False
-        )
-        
-        if verification.get('verified', False):
-            return student_info
-        return None
-    except Exception:
-        return None
+    images = request.files.getlist('images')
+    if len(images) != 5:
+        return jsonify({"success": False, "message": "Exactly 5 images are required"}), 400
+    
+    if 'name' not in request.form or 'roll_no' not in request.form or 'class' not in request.form:
+        return jsonify({"success": False, "message": "Missing student information"}), 400
+    
+    name = request.form['name']
+    roll_no = request.form['roll_no']
+    student_class = request.form['class']
+    
+    user_folder = os.path.join(UPLOAD_FOLDER, f"{name}_{roll_no}")
+    os.makedirs(user_folder, exist_ok=True)
+    
+    image_paths = [os.path.join(user_folder, f"image_{i}.jpg") for i in range(5)]
+    for image, image_path in zip(images, image_paths):
+        image.save(image_path)
+    
+    # Check every image before embedding any of them
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        checks = list(executor.map(detect_face, image_paths))
+    errors = [
+        {"image_index": i, "message": message}
+        for i, (is_valid, message) in enumerate(checks) if not is_valid
+    ]
+    
+    if not errors:
+        embeddings = create_embeddings(image_paths)
+        errors = [
+            {"image_index": i, "message": "Failed to create embedding"}
+            for i, embedding in enumerate(embeddings) if embedding is None
+        ]
+    
+    if errors:
+        for error in errors:
+            os.remove(image_paths[error["image_index"]])  # Remove invalid images
+        return jsonify({
+            "success": False,
+            "message": f"{len(errors)} of 5 images were rejected",
+            "errors": errors
+        }), 400
+    
+    save_student(name, roll_no, student_class, embeddings)
+    
+    return jsonify({
+        "success": True,
+        "message": "All images processed successfully and embeddings created"
+    })
 
 @app.route('/api/recognize-group', methods=['POST'])
 def recognize_group():
@@ -174,12 +301,17 @@ def recognize_group():
     image.save(group_image_path)
     
     try:
-        # Extract faces from the group photo first to validate face count
-        detected_faces = DeepFace.extract_faces(
-            img_path=group_image_path,
-            enforce_detection=True,
-            detector_backend="opencv"
-        )
+        # Detect and embed every face of the group photo exactly once
+        try:
+            detected_faces = DeepFace.represent(
+                img_path=group_image_path,
+                model_name="Facenet",
+                detector_backend="opencv",
+                enforce_detection=True
+            )
+        except ValueError:
+            # DeepFace raises when enforce_detection finds no face
+            detected_faces = []
         
         face_count = len(detected_faces)
         print(f"Detected {face_count} faces in the group photo")
@@ -192,79 +324,19 @@ def recognize_group():
                 "message": "No faces detected in the group photo"
             }), 400
         
-        # Get all student embeddings
-        all_students = []
-        student_db = {}
+        # Compare the face embeddings with the embedding_{i}.npy files saved at registration
+        face_matrix = np.array([face["embedding"] for face in detected_faces], dtype=np.float32)
+        matches = get_gallery().match(face_matrix, threshold=CONFIDENCE_THRESHOLD)
         
-        for student_folder in os.listdir(EMBEDDINGS_FOLDER):
-            folder_path = os.path.join(EMBEDDINGS_FOLDER, student_folder)
-            if os.path.isdir(folder_path):
-                # Load student info
-                try:
-                    with open(os.path.join(folder_path, "info.json"), "r") as f:
-                        student_info = json.load(f)
-                    
-                    student_id = f"{student_info['name']}_{student_info['roll_no']}"
-                    student_db[student_id] = student_info
-                    
-                    # Store image paths for verification
-                    student_img_folder = os.path.join(UPLOAD_FOLDER, student_id)
-                    if os.path.exists(student_img_folder):
-                        student_images = [
-                            os.path.join(student_img_folder, f"image_{i}.jpg") 
-                            for i in range(5) if os.path.exists(os.path.join(student_img_folder, f"image_{i}.jpg"))
-                        ]
-                        if student_images:  # Only add if we have at least one valid image
-                            student_info["images"] = student_images
-                            all_students.append(student_info)
-                except Exception as e:
-                    print(f"Error loading student info: {str(e)}")
-                    continue
-        
-        # Approach 1: Using parallel verification with a fixed maximum output
-        recognized_students = []
-        verification_tasks = []
-        
-        # Create verification tasks
-        for student_info in all_students:
-            for img_path in student_info.get('images', []):
-                if os.path.exists(img_path):
-                    verification_tasks.append((group_image_path, img_path, student_info))
-        
-        # Process tasks in parallel
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            results = list(executor.map(verify_face, verification_tasks))
-        
-        # Process results
-        student_matches = {}
-        for result in results:
-            if result:
-                student_id = f"{result['name']}_{result['roll_no']}"
-                # Count matches for each student
-                if student_id in student_matches:
-                    student_matches[student_id]["count"] += 1
-                else:
-                    student_matches[student_id] = {
-                        "info": result,
-                        "count": 1
-                    }
-        
-        # Sort by match count (more matches = higher confidence)
-        sorted_matches = sorted(student_matches.values(), key=lambda x: x["count"], reverse=True)
-        
-        # Limit to the actual number of faces detected
-        max_results = min(face_count, len(sorted_matches))
-        
-        # Take only the top matches
-        for i in range(max_results):
-            if i < len(sorted_matches):
-                student_info = sorted_matches[i]["info"]
-                student_copy = {
-                    'name': student_info.get('name'),
-                    'roll_no': student_info.get('roll_no'),
-                    'class': student_info.get('class')
-                }
-                recognized_students.append(student_copy)
+        # One-to-one matching never returns more students than faces detected
+        recognized_students = [
+            {
+                'name': student.get('name'),
+                'roll_no': student.get('roll_no'),
+                'class': student.get('class')
+            }
+            for student, _ in matches if student
+        ]
         
         # Clean up
         if os.path.exists(group_image_path):
@@ -0,0 +1,235 @@
+import os
+import json
+import pickle
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+import embedder
+from embedder import embed_faces, crop_face, PREPROCESS_VERSION
+from embedding_cache import cache_key
+from model_registry import FACE_MODEL
+from detectors import detectors, UPLOAD_DETECTOR
+from matcher import EMBEDDING_SIZE
+
+REGENERATION_WORKERS = int(os.getenv('REGENERATION_WORKERS', '2'))  # Processes embedding students in parallel, 0 embeds in the job thread
+CHECKPOINT_FILE = 'regeneration_state.jsonl'
+IMAGES_PER_STUDENT = 5
+PIPELINE = f"{FACE_MODEL}/{PREPROCESS_VERSION}"  # Feature files built by another pipeline are stale
+
+
+def load_face_crop(image_path, face_area_path):
+    """
+    Load a stored registration image cropped to its face
+    Uses the saved face area when available, otherwise detects it again
+    Returns: face crop or None
+    """
+    img = cv2.imread(image_path)
+    if img is None:
+        return None
+
+    face_area = None
+    if os.path.exists(face_area_path):
+        with open(face_area_path, "r") as f:
+            face_area = json.load(f)
+    else:
+        faces = detectors.detect(UPLOAD_DETECTOR, img)
+        if len(faces) == 1 and np.mean(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)) >= 50:
+            x, y, w, h, _ = faces[0]
+            face_area = {'x': x, 'y': y, 'w': w, 'h': h}
+
+    if not face_area:
+        return img
+    return crop_face(img, (face_area['x'], face_area['y'], face_area['w'], face_area['h']))
+
+
+def fingerprint(image_path):
+    """Identity of the image a feature file was built from, and of the pipeline that built it"""
+    stat = os.stat(image_path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "pipeline": PIPELINE}
+
+
+def failed_fingerprint(image_path):
+    """Fingerprint recorded for an image that yielded no embedding, so it is not retried until it changes"""
+    return {**fingerprint(image_path), "failed": True}
+
+
+class RegenerationCheckpoint:
+    """
+    Fingerprint of the image every feature file was last built from.
+
+    Kept as an append-only log with one line per marked student, so each
+    mark costs one small write however many students there are. Later lines
+    override earlier ones; the log is compacted to one line per student on load.
+    """
+
+    def __init__(self, face_info_folder):
+        self.path = os.path.join(face_info_folder, CHECKPOINT_FILE)
+        self.students = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        self.students = {}
+        lines = 0
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Partially written last line of an interrupted run
+                    self.students.setdefault(entry["id"], {}).update(entry["slots"])
+                    lines += 1
+        except OSError:
+            return self
+
+        if lines > len(self.students):
+            self._compact()
+        return self
+
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for student_id, slots in self.students.items():
+                f.write(json.dumps({"id": student_id, "slots": slots}) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def is_current(self, student_id, slot, image_path):
+        return self.students.get(student_id, {}).get(str(slot)) == fingerprint(image_path)
+
+    def has_failed(self, student_id, slot, image_path):
+        """True if this exact image already failed to embed with the current pipeline"""
+        return self.students.get(student_id, {}).get(str(slot)) == failed_fingerprint(image_path)
+
+    def mark(self, student_id, slot_fingerprints):
+        """Record the slots just rebuilt by appending one line to the log"""
+        slots = {str(slot): slot_fingerprint for slot, slot_fingerprint in slot_fingerprints.items()}
+        with self.lock:
+            self.students.setdefault(student_id, {}).update(slots)
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"id": student_id, "slots": slots}) + "\n")
+
+
+def find_stale(upload_folder, face_info_folder, checkpoint, stored_slots, student_ids=None):
+    """
+    Students with a feature slot that is missing, not in the embedding store,
+    or older than its image or the current pipeline. Slots whose image already
+    failed to embed are skipped until the image is replaced.
+
+    Args:
+        upload_folder: Folder holding image_{i}.jpg per student
+        face_info_folder: Folder holding features_{i}.pkl per student
+        checkpoint: RegenerationCheckpoint
+        stored_slots: Set of (student id, slot) present in the embedding store
+        student_ids: Optional subset of students to check
+
+    Returns:
+        list: (student_id, [stale slots])
+    """
+    if student_ids is None:
+        student_ids = sorted(
+            entry for entry in os.listdir(face_info_folder)
+            if os.path.isdir(os.path.join(face_info_folder, entry))
+        )
+
+    stale = []
+    for student_id in student_ids:
+        user_folder = os.path.join(upload_folder, student_id)
+        face_info = os.path.join(face_info_folder, student_id)
+        if not os.path.isdir(user_folder) or not os.path.isdir(face_info):
+            continue
+        # Half-registered students stay out of the store until their last image is uploaded
+        if not os.path.exists(os.path.join(face_info, "info.json")):
+            continue
+
+        slots = []
+        for i in range(IMAGES_PER_STUDENT):
+            image_path = os.path.join(user_folder, f"image_{i}.jpg")
+            if not os.path.exists(image_path) or checkpoint.has_failed(student_id, i, image_path):
+                continue
+            if (not os.path.exists(os.path.join(face_info, f"features_{i}.pkl")) or
+                    (student_id, i) not in stored_slots or
+                    not checkpoint.is_current(student_id, i, image_path)):
+                slots.append(i)
+        if slots:
+            stale.append((student_id, slots))
+    return stale
+
+
+def embed_student(upload_folder, face_info_folder, student_id, slots):
+    """
+    Embed the given slots of one student, runs in a worker process
+
+    Returns:
+        tuple: (student_id, list of (slot, vector, fingerprint, cache key),
+                list of (slot, failed fingerprint) for images without a valid face, error or None)
+    """
+    try:
+        user_folder = os.path.join(upload_folder, student_id)
+        face_info = os.path.join(face_info_folder, student_id)
+
+        found = []
+        crops = []
+        failed = []
+        for i in slots:
+            image_path = os.path.join(user_folder, f"image_{i}.jpg")
+            face_img = load_face_crop(image_path, os.path.join(face_info, f"face_area_{i}.json"))
+            if face_img is not None:
+                found.append((i, image_path))
+                crops.append(face_img)
+            else:
+                failed.append((i, failed_fingerprint(image_path)))
+
+        vectors = embed_faces(crops, detector=UPLOAD_DETECTOR, cache_new=True)
+        results = []
+        for (i, image_path), crop, vector in zip(found, crops, vectors):
+            if vector.size == EMBEDDING_SIZE:
+                key = cache_key(crop, FACE_MODEL, UPLOAD_DETECTOR, PREPROCESS_VERSION)
+                results.append((i, vector, fingerprint(image_path), key))
+            else:
+                failed.append((i, failed_fingerprint(image_path)))
+        return student_id, results, failed, None
+    except Exception as e:
+        # Not tied to one image (e.g. the model failed to load), so nothing is recorded and the next run retries
+        return student_id, [], [], str(e)
+
+
+def _init_worker():
+    # Only the parent appends to the cache file, workers read it and report new keys back
+    embedder.embedding_cache.read_only = True
+
+
+def regenerate_students(stale, upload_folder, face_info_folder, workers=REGENERATION_WORKERS):
+    """
+    Embed stale students, spread over a process pool when workers > 0
+
+    Yields:
+        tuple: embed_student result per student, in completion order
+    """
+    if workers <= 0:
+        for student_id, slots in stale:
+            yield embed_student(upload_folder, face_info_folder, student_id, slots)
+        return
+
+    # spawn, not fork: the parent already runs TensorFlow threads
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+        futures = [
+            pool.submit(embed_student, upload_folder, face_info_folder, student_id, slots)
+            for student_id, slots in stale
+        ]
+        for future in as_completed(futures):
+            student_id, results, failed, error = future.result()
+            embedder.embedding_cache.put_many(
+                [key for _, _, _, key in results],
+                [vector for _, vector, _, _ in results]
+            )
+            yield student_id, results, failed, error
+
+
+def save_features(face_info_folder, student_id, results):
+    """Write the legacy features_{i}.pkl files of a student"""
+    for i, vector, _, _ in results:
+        with open(os.path.join(face_info_folder, student_id, f"features_{i}.pkl"), "wb") as f:
+            pickle.dump(vector, f)
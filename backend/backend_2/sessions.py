@@ -0,0 +1,130 @@
+import os
+import time
+import uuid
+import threading
+
+SESSION_TTL = int(os.getenv('SESSION_TTL', '14400'))  # Seconds an idle lecture session is kept
+SESSION_MAX_PHOTOS = int(os.getenv('SESSION_MAX_PHOTOS', '10'))  # Photos accepted per session
+
+
+class LectureSession:
+    """
+    Attendance for one lecture built up from several photos.
+
+    Every photo is matched on its own and merged into the recognised set,
+    keeping the best similarity seen for each student, so adding a photo
+    never re-processes the earlier ones.
+    """
+
+    def __init__(self, classes=None):
+        self.session_id = str(uuid.uuid4())
+        self.classes = classes
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.photos = []
+        self.students = {}
+        self.lock = threading.Lock()
+
+    def add_photo(self, matches, faces_detected, processing_time):
+        """
+        Merge the matches of one new photo
+
+        Args:
+            matches: List of (student or None, similarity) for the photo's faces
+            faces_detected: Number of faces detected in the photo
+            processing_time: Seconds spent on the photo
+
+        Returns:
+            dict: Summary of the photo, including the students it added
+        """
+        with self.lock:
+            photo_index = len(self.photos)
+            new_students = []
+            recognized = 0
+
+            for student, similarity in matches:
+                if not student:
+                    continue
+                recognized += 1
+                similarity = float(similarity)
+                entry = self.students.get(student['id'])
+                if entry is None:
+                    entry = {
+                        'name': student.get('name'),
+                        'roll_no': student.get('roll_no'),
+                        'class': student.get('class'),
+                        'confidence': similarity,
+                        'best_photo': photo_index,
+                        'photos': []
+                    }
+                    self.students[student['id']] = entry
+                    new_students.append(entry)
+                elif similarity > entry['confidence']:
+                    entry['confidence'] = similarity
+                    entry['best_photo'] = photo_index
+                entry['photos'].append(photo_index)
+
+            photo = {
+                'photo': photo_index,
+                'faces_detected': faces_detected,
+                'faces_recognized': recognized,
+                'new_students': len(new_students),
+                'processing_time_seconds': processing_time
+            }
+            self.photos.append(photo)
+            self.updated_at = time.time()
+            return dict(photo, new_recognized_students=[self._public(entry) for entry in new_students])
+
+    def to_dict(self):
+        with self.lock:
+            recognized_students = sorted(
+                (self._public(entry) for entry in self.students.values()),
+                key=lambda x: x.get('name') or ''
+            )
+            return {
+                'session_id': self.session_id,
+                'classes': self.classes,
+                'created_at': self.created_at,
+                'photos': list(self.photos),
+                'recognized_students': recognized_students
+            }
+
+    @staticmethod
+    def _public(entry):
+        return dict(entry, photos=list(entry['photos']))
+
+
+class SessionStore:
+    """In-memory lecture sessions, idle ones expire after ttl seconds"""
+
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def create(self, classes=None):
+        self._evict_expired()
+        session = LectureSession(classes)
+        with self.lock:
+            self.sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id):
+        """Session by id, None if unknown or expired"""
+        self._evict_expired()
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def delete(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def _evict_expired(self):
+        now = time.time()
+        with self.lock:
+            expired = [
+                session_id for session_id, session in self.sessions.items()
+                if now - session.updated_at > self.ttl
+            ]
+            for session_id in expired:
+                del self.sessions[session_id]
@@ -0,0 +1,84 @@
+import os
+import numpy as np
+
+from embedding_cache import EmbeddingCache, cache_key, KEY_SIZE
+
+DIM = 4
+
+
+def key(i):
+    return bytes([i]) * KEY_SIZE
+
+
+def vector(i):
+    return np.full(DIM, i, dtype=np.float32)
+
+
+def test_cache_key_depends_on_crop_and_pipeline():
+    face = np.zeros((4, 4, 3), dtype=np.uint8)
+
+    assert cache_key(face, "Facenet", "haar", 1) == cache_key(face.copy(), "Facenet", "haar", 1)
+    assert cache_key(face, "Facenet", "haar", 1) != cache_key(face, "Facenet", "haar", 2)
+    assert cache_key(face, "Facenet", "haar", 1) != cache_key(face, "Facenet", "mtcnn", 1)
+    assert cache_key(face, "Facenet", "haar", 1) != cache_key(face[:2], "Facenet", "haar", 1)
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.bin"), max_entries=2, dim=DIM)
+    cache.put_many([key(1), key(2)], [vector(1), vector(2)])
+
+    # Reading key 1 makes key 2 the least recently used
+    cache.get_many([key(1)])
+    cache.put_many([key(3)], [vector(3)])
+
+    hits = cache.get_many([key(1), key(2), key(3)])
+    assert hits[1] is None
+    np.testing.assert_array_equal(hits[0], vector(1))
+    np.testing.assert_array_equal(hits[2], vector(3))
+
+
+def test_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    EmbeddingCache(path, max_entries=10, dim=DIM).put_many([key(1), key(2)], [vector(1), vector(2)])
+    # A partially written record at the end is ignored
+    with open(path, "ab") as f:
+        f.write(key(3)[:5])
+
+    restarted = EmbeddingCache(path, max_entries=10, dim=DIM)
+    hits = restarted.get_many([key(2), key(3)])
+
+    np.testing.assert_array_equal(hits[0], vector(2))
+    assert hits[1] is None
+    assert restarted.records == 2
+
+
+def test_file_is_rewritten_with_live_entries(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    cache = EmbeddingCache(path, max_entries=2, dim=DIM)
+    for i in range(5):
+        cache.put_many([key(i)], [vector(i)])
+
+    # Four records fit before the rewrite, the fifth rewrites only the two live entries
+    assert cache.records == 2
+    assert os.path.getsize(path) == 2 * cache.record_size
+
+    restarted = EmbeddingCache(path, max_entries=2, dim=DIM)
+    assert [hit is not None for hit in restarted.get_many([key(i) for i in range(5)])] == [False, False, False, True, True]
+
+
+def test_read_only_cache_does_not_write(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    cache = EmbeddingCache(path, max_entries=2, dim=DIM)
+    cache.read_only = True
+    cache.put_many([key(1)], [vector(1)])
+
+    assert cache.get_many([key(1)])[0] is not None
+    assert not os.path.exists(path)
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.bin"), max_entries=0, dim=DIM)
+    cache.put_many([key(1)], [vector(1)])
+
+    assert cache.get_many([key(1)]) == [None]
+    assert len(cache) == 0
@@ -0,0 +1,93 @@
+import json
+import pickle
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore, LEGACY_PIPELINE
+from matcher import EMBEDDING_SIZE
+
+
+def unit(axis):
+    vector = np.zeros(EMBEDDING_SIZE, dtype=np.float32)
+    vector[axis] = 1.0
+    return vector
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Store of the 'v1' pipeline that always searches its ANN index"""
+    return EmbeddingStore(str(tmp_path), ann_kind='exact', ann_min_rows=1, pipeline='v1').load()
+
+
+def matched_ids(gallery, faces):
+    return [student and student["id"] for student, _ in gallery.match(np.vstack(faces))]
+
+
+def test_newer_row_supersedes_slot(store):
+    store.append_many([
+        ("s1", "Student 1", "1", "10A", 0, unit(0)),
+        ("s1", "Student 1", "1", "10A", 1, unit(1)),
+        ("s2", "Student 2", "2", "10B", 0, unit(2)),
+    ])
+    store.append("s1", "Student 1", "1", "10A", 0, unit(3))
+
+    assert store._active_rows() == [1, 2, 3]
+    assert store._active_rows({"10B"}) == [2]
+    assert store.slots() == {("s1", 0), ("s1", 1), ("s2", 0)}
+    assert matched_ids(store.gallery(), [unit(0), unit(3), unit(2)]) == [None, "s1", "s2"]
+
+    # The superseded row is tombstoned in the ANN index, not only skipped by the gallery
+    _, ids = store.ann.search(np.vstack([unit(0)]), k=4)
+    assert 0 not in ids
+
+
+def test_other_pipeline_rows_are_ignored(store):
+    store.append("s1", "Student 1", "1", "10A", 0, unit(0))
+    store.append_many([("s2", "Student 2", "2", "10B", 0, unit(1))], pipeline=LEGACY_PIPELINE)
+
+    assert store.classes() == ["10A"]
+    assert [student["id"] for student in store.students()] == ["s1"]
+    assert matched_ids(store.gallery(), [unit(1)]) == [None]
+
+    # Embedding the slot again with the current pipeline makes the student matchable
+    store.append("s2", "Student 2", "2", "10B", 0, unit(4))
+    assert store.classes() == ["10A", "10B"]
+    assert matched_ids(store.gallery(), [unit(4)]) == ["s2"]
+
+
+def test_compact_keeps_latest_rows_across_reload(store, tmp_path):
+    store.append("s1", "Student 1", "1", "10A", 0, unit(0))
+    store.append("s1", "Student 1", "1", "10A", 0, unit(1))
+    store.append_many([("s2", "Student 2", "2", "10A", 0, unit(2))], pipeline=LEGACY_PIPELINE)
+    store.append("s3", "Student 3", "3", "10A", 2, unit(3))
+
+    store.compact()
+
+    assert len(store) == 2
+    assert store._active_rows() == [0, 1]
+    reloaded = EmbeddingStore(str(tmp_path), ann_kind='exact', ann_min_rows=1, pipeline='v1').load()
+    assert reloaded.slots() == {("s1", 0), ("s3", 2)}
+    assert matched_ids(reloaded.gallery(), [unit(3), unit(1), unit(0)]) == ["s3", "s1", None]
+
+
+def test_truncated_index_ignores_unindexed_vectors(store, tmp_path):
+    store.append("s1", "Student 1", "1", "10A", 0, unit(0))
+    # A crash after the vector write leaves a row without an index line
+    with open(store.vectors_path, "ab") as f:
+        f.write(unit(1).tobytes())
+
+    reloaded = EmbeddingStore(str(tmp_path), pipeline='v1').load()
+    assert len(reloaded) == 1
+
+
+def test_import_legacy_rows_are_stale(tmp_path):
+    student_folder = tmp_path / "face_info" / "Student 1_1"
+    student_folder.mkdir(parents=True)
+    (student_folder / "info.json").write_text(json.dumps({"name": "Student 1", "roll_no": "1", "class": "10A"}))
+    with open(student_folder / "features_0.pkl", "wb") as f:
+        pickle.dump(unit(0), f)
+
+    store = EmbeddingStore(str(tmp_path / "store"), pipeline='v1').load()
+    assert store.import_legacy(str(tmp_path / "face_info")) == 1
+    assert len(store) == 1
+    assert store.slots() == set()
@@ -0,0 +1,66 @@
+import threading
+
+from jobs import JobQueue
+
+
+def wait(queue):
+    queue.queue.join()
+
+
+def test_job_result_and_progress():
+    def handler(value, progress):
+        progress({"done": 1, "total": 1})
+        return value * 2
+
+    queue = JobQueue(handler, workers=1, track_progress=True)
+    job_id = queue.submit(21)
+    wait(queue)
+
+    job = queue.get(job_id)
+    assert (job["status"], job["result"], job["error"]) == ("done", 42, None)
+    assert job["progress"] == {"done": 1, "total": 1}
+    assert queue.active() == []
+
+
+def test_failed_job_keeps_error():
+    def handler():
+        raise ValueError("bad video")
+
+    queue = JobQueue(handler, workers=1)
+    job_id = queue.submit()
+    wait(queue)
+
+    job = queue.get(job_id)
+    assert (job["status"], job["result"], job["error"]) == ("failed", None, "bad video")
+
+
+def test_full_queue_rejects_jobs():
+    release = threading.Event()
+    started = threading.Event()
+
+    def handler():
+        started.set()
+        release.wait(5)
+
+    queue = JobQueue(handler, workers=1, max_queue=1)
+    running = queue.submit()
+    started.wait(5)
+    waiting = queue.submit()
+
+    assert queue.submit() is None
+    assert queue.active() == [running, waiting]
+    release.set()
+    wait(queue)
+    assert queue.get(waiting)["status"] == "done"
+
+
+def test_finished_jobs_expire():
+    queue = JobQueue(lambda: None, workers=1, result_ttl=0)
+    job_id = queue.submit()
+    wait(queue)
+    assert queue.get(job_id)["status"] == "done"
+
+    # Expired results are dropped the next time a job is submitted
+    queue.jobs[job_id]["finished_at"] -= 1
+    queue.submit()
+    assert queue.get(job_id) is None
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from matcher import GalleryMatcher, assign_faces, EMBEDDING_SIZE
+
+
+def test_assign_faces_is_one_to_one():
+    similarities = np.array([
+        [0.9, 0.8],
+        [0.85, 0.1]
+    ], dtype=np.float32)
+
+    # Greedy would give face 0 student 0 and leave face 1 unmatched
+    assert assign_faces(similarities, 0.4) == [1, 0]
+
+
+def test_assign_faces_respects_threshold():
+    similarities = np.array([[0.65, 0.55]], dtype=np.float32)
+
+    assert assign_faces(similarities, 0.4) == [0]
+    assert assign_faces(similarities, 0.3) == [None]
+
+
+def test_assign_faces_never_matches_non_positive_similarity():
+    # A threshold above 1 would admit these pairs on distance alone
+    similarities = np.array([
+        [0.0, -0.5],
+        [-0.3, -0.2]
+    ], dtype=np.float32)
+
+    assert assign_faces(similarities, 1.5) == [None, None]
+
+
+def test_assign_faces_without_faces_or_students():
+    assert assign_faces(np.zeros((0, 3), dtype=np.float32), 0.4) == []
+    assert assign_faces(np.zeros((2, 0), dtype=np.float32), 0.4) == [None, None]
+
+
+def unit(*components):
+    """128-d vector with the given (axis, value) components"""
+    vector = np.zeros(EMBEDDING_SIZE, dtype=np.float32)
+    for axis, value in components:
+        vector[axis] = value
+    return vector
+
+
+def test_gallery_match_scores_best_template_of_each_student():
+    students = [{"id": "a"}, {"id": "b"}]
+    # Rows in any order, student a owns two templates
+    gallery = GalleryMatcher.from_rows(students, [unit((0, 1)), unit((2, 1)), unit((1, 1))], [0, 1, 0])
+    faces = np.vstack([unit((1, 1), (3, 0.1)), unit((2, 1)), unit((5, 1))])
+
+    matches = gallery.match(faces)
+
+    assert [student and student["id"] for student, _ in matches] == ["a", "b", None]
+    assert matches[1][1] == pytest.approx(1.0)
+    # An unmatched face reports its best score for logging
+    assert matches[2][1] == pytest.approx(0.0)
+
+
+def test_gallery_match_without_students():
+    gallery = GalleryMatcher.from_students([{"id": "a", "features": [None, np.ones(3)]}])
+
+    assert len(gallery) == 0
+    assert gallery.match(np.vstack([unit((0, 1))])) == [(None, 0.0)]
+
+
+def test_second_pass_needs_several_templates_to_agree():
+    students = [{"id": "a"}, {"id": "b"}, {"id": "c"}]
+    gallery = GalleryMatcher.from_rows(
+        students,
+        [unit((0, 1)), unit((1, 1)), unit((3, 1)), unit((4, 1)), unit((5, 1)), unit((6, 1))],
+        [0, 0, 1, 1, 2, 2]
+    )
+    # Cosine distance 0.45 to both templates of a, and to one template of c
+    near_a = unit((0, 0.55), (1, 0.55), (2, np.sqrt(1 - 2 * 0.55 ** 2)))
+    near_c = unit((5, 0.55), (7, np.sqrt(1 - 0.55 ** 2)))
+    # Exactly b, then close to b again: b is already claimed by the first face
+    faces = np.vstack([unit((3, 1)), near_a, near_c, unit((3, 0.55), (4, 0.55), (8, np.sqrt(1 - 2 * 0.55 ** 2)))])
+
+    first = gallery.match(faces, threshold=0.4)
+    assert [student and student["id"] for student, _ in first] == ["b", None, None, None]
+
+    second = gallery.second_pass(faces, first, threshold=0.5, min_votes=2)
+    assert [student and student["id"] for student, _ in second] == ["b", "a", None, None]
+    assert second[1][1] == pytest.approx(0.55)
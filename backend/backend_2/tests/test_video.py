@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+
+from video import IoUTracker, box_iou, merge_tracks
+
+
+def crop(value=0):
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+def test_box_iou():
+    assert box_iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert box_iou((0, 0, 10, 10), (5, 0, 10, 10)) == pytest.approx(50 / 150)
+    assert box_iou((0, 0, 10, 10), (20, 20, 5, 5)) == 0.0
+
+
+def test_tracker_follows_overlapping_boxes_and_keeps_best_crops():
+    tracker = IoUTracker(iou_threshold=0.3, max_misses=1, best_frames=2)
+    tracker.update(0, [((0, 0, 10, 10), crop(1), 1.0), ((100, 100, 10, 10), crop(2), 5.0)])
+    tracker.update(1, [((1, 1, 10, 10), crop(3), 3.0)])
+    tracker.update(2, [((2, 2, 10, 10), crop(4), 2.0)])
+
+    first, second = tracker.tracks
+    assert (first["hits"], first["first_frame"], first["last_frame"]) == (3, 0, 2)
+    assert sorted(quality for quality, _, _ in first["best"]) == [2.0, 3.0]
+    assert (second["hits"], second["misses"]) == (1, 2)
+    assert [track["id"] for track in tracker.confirmed_tracks(min_hits=2)] == [first["id"]]
+
+
+def test_closed_track_is_not_continued():
+    tracker = IoUTracker(iou_threshold=0.3, max_misses=0)
+    tracker.update(0, [((0, 0, 10, 10), crop(), 1.0)])
+    tracker.update(1, [])
+    tracker.update(2, [((0, 0, 10, 10), crop(), 1.0)])
+
+    assert [track["hits"] for track in tracker.tracks] == [1, 1]
+
+
+def test_merge_tracks_joins_disjoint_tracks_of_one_person():
+    def track(first_frame, last_frame, best=1):
+        return {"first_frame": first_frame, "last_frame": last_frame, "best": [None] * best}
+
+    # Track 2 continues track 1 after an occlusion. Track 0 looks alike but is on
+    # screen together with 1, so it stays apart from that group. 3 is someone else
+    tracks = [track(0, 10), track(5, 15), track(20, 30, best=3), track(0, 30)]
+    templates = np.array([[1, 0, 0], [1, 0.05, 0], [1, 0.1, 0], [0, 0, 1]], dtype=np.float32)
+
+    groups, merged = merge_tracks(tracks, templates, max_distance=0.4)
+
+    assert groups == [[0], [1, 2], [3]]
+    assert merged.shape == (3, 3)
+    np.testing.assert_allclose(np.linalg.norm(merged, axis=1), 1.0, rtol=1e-5)
@@ -0,0 +1,185 @@
+import os
+import heapq
+import itertools
+import cv2
+import numpy as np
+from matcher import MATCH_THRESHOLD, normalize_rows
+
+VIDEO_SAMPLE_FPS = float(os.getenv('VIDEO_SAMPLE_FPS', '2'))  # Frames analysed per second of video
+VIDEO_MAX_FRAMES = int(os.getenv('VIDEO_MAX_FRAMES', '60'))  # Upper bound on sampled frames per clip
+TRACK_IOU_THRESHOLD = 0.3  # Minimum overlap to continue a track in the next sampled frame
+TRACK_MAX_MISSES = 3  # Sampled frames a track may go unseen before it is closed
+TRACK_BEST_FRAMES = 3  # Best-quality crops kept (and embedded) per track
+TRACK_MIN_HITS = 2  # Detections needed before a track counts as a person
+TRACK_MERGE_DISTANCE = MATCH_THRESHOLD  # Tracks that never share a frame and are this close are one person
+
+
+def sample_frames(video_path, sample_fps=VIDEO_SAMPLE_FPS, max_frames=VIDEO_MAX_FRAMES):
+    """
+    Decode a video and yield (frame_number, BGR frame) at roughly sample_fps.
+    Frames in between are skipped with grab() so they are never fully decoded.
+    """
+    capture = cv2.VideoCapture(video_path)
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        step = max(1, int(round(fps / sample_fps)))
+        frame_number = 0
+        sampled = 0
+
+        while sampled < max_frames:
+            if frame_number % step == 0:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield frame_number, frame
+                sampled += 1
+            elif not capture.grab():
+                break
+            frame_number += 1
+    finally:
+        capture.release()
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    intersection = inter_w * inter_h
+    union = aw * ah + bw * bh - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def face_quality(face_img, confidence):
+    """
+    Score a face crop for embedding: detector confidence x size x sharpness.
+    Bigger, sharper, more confident detections give better embeddings.
+    """
+    if face_img.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
+    sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+    area = face_img.shape[0] * face_img.shape[1]
+    return float(confidence) * np.sqrt(area) * np.log1p(sharpness)
+
+
+class IoUTracker:
+    """
+    Lightweight tracker: each detection continues the open track whose last
+    box overlaps it most, otherwise it starts a new track. Only the
+    best-quality crops of every track are kept, so embedding cost depends on
+    the number of people rather than on the number of frames.
+    """
+
+    def __init__(self, iou_threshold=TRACK_IOU_THRESHOLD, max_misses=TRACK_MAX_MISSES,
+                 best_frames=TRACK_BEST_FRAMES):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.best_frames = best_frames
+        self.tracks = []
+        self._ids = itertools.count()
+        self._tiebreak = itertools.count()
+
+    def update(self, frame_number, detections):
+        """
+        Add one sampled frame's detections
+
+        Args:
+            frame_number: Frame index in the video
+            detections: List of (box, face_img, quality)
+        """
+        open_tracks = [t for t in self.tracks if t["misses"] <= self.max_misses]
+
+        # Greedy association on the highest overlaps first
+        pairs = sorted(
+            (
+                (box_iou(track["box"], box), t, d)
+                for t, track in enumerate(open_tracks)
+                for d, (box, _, _) in enumerate(detections)
+            ),
+            reverse=True
+        )
+        used_tracks, used_detections = set(), set()
+        for iou, t, d in pairs:
+            if iou < self.iou_threshold:
+                break
+            if t in used_tracks or d in used_detections:
+                continue
+            used_tracks.add(t)
+            used_detections.add(d)
+            self._extend(open_tracks[t], frame_number, *detections[d])
+
+        for t, track in enumerate(open_tracks):
+            if t not in used_tracks:
+                track["misses"] += 1
+
+        for d, detection in enumerate(detections):
+            if d not in used_detections:
+                track = {"id": next(self._ids), "box": None, "hits": 0, "misses": 0,
+                         "first_frame": frame_number, "last_frame": frame_number, "best": []}
+                self.tracks.append(track)
+                self._extend(track, frame_number, *detection)
+
+    def _extend(self, track, frame_number, box, face_img, quality):
+        track["box"] = box
+        track["hits"] += 1
+        track["misses"] = 0
+        track["last_frame"] = frame_number
+
+        # Min-heap of the best crops, copied so the decoded frame can be released
+        entry = (quality, next(self._tiebreak), face_img.copy())
+        if len(track["best"]) < self.best_frames:
+            heapq.heappush(track["best"], entry)
+        elif quality > track["best"][0][0]:
+            heapq.heapreplace(track["best"], entry)
+
+    def confirmed_tracks(self, min_hits=TRACK_MIN_HITS):
+        """Tracks seen often enough to be a real face rather than a false detection"""
+        return [t for t in self.tracks if t["hits"] >= min_hits and t["best"]]
+
+
+def merge_tracks(tracks, templates, max_distance=TRACK_MERGE_DISTANCE):
+    """
+    Join tracks of one person that were split by an occlusion longer than
+    TRACK_MAX_MISSES: pairs whose templates are within max_distance (cosine)
+    and whose frame ranges never overlap, most similar pairs first
+
+    Args:
+        tracks: Confirmed tracks
+        templates: Normalised template per track, same order
+
+    Returns:
+        tuple: (list of track index groups, normalised template per group)
+    """
+    templates = normalize_rows(np.asarray(templates, dtype=np.float32))
+    groups = [[i] for i in range(len(tracks))]
+    group_of = list(range(len(tracks)))
+
+    def overlaps(a, b):
+        return any(
+            tracks[i]["first_frame"] <= tracks[j]["last_frame"] and tracks[j]["first_frame"] <= tracks[i]["last_frame"]
+            for i in groups[a] for j in groups[b]
+        )
+
+    similarities = templates @ templates.T
+    pairs = sorted(
+        ((similarities[i, j], i, j) for i in range(len(tracks)) for j in range(i + 1, len(tracks))
+         if similarities[i, j] >= 1 - max_distance),
+        reverse=True
+    )
+    for _, i, j in pairs:
+        a, b = group_of[i], group_of[j]
+        if a == b or overlaps(a, b):
+            continue
+        for t in groups[b]:
+            group_of[t] = a
+        groups[a].extend(groups[b])
+        groups[b] = []
+
+    groups = [sorted(group) for group in groups if group]
+    merged = [
+        np.average(templates[group], axis=0, weights=[len(tracks[t]["best"]) for t in group])
+        for group in groups
+    ]
+    return groups, normalize_rows(np.array(merged).reshape(len(groups), templates.shape[1]))
@@ -0,0 +1,103 @@
+"""
+Recall / latency report of the ANN gallery index against exact search.
+
+Builds synthetic galleries (5 noisy 128-d embeddings per student around a
+random identity vector) at several sizes, queries them with fresh noisy
+samples of enrolled students and compares each index with brute force.
+
+Usage:
+    python benchmarks/ann_recall.py [--sizes 1000 10000 50000] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend_2'))
+
+from ann_index import create_index
+
+EMBEDDING_SIZE = 128
+IMAGES_PER_STUDENT = 5
+
+
+def synthetic_gallery(num_students, rng, noise=0.35):
+    identities = rng.normal(size=(num_students, EMBEDDING_SIZE)).astype(np.float32)
+    samples = identities[:, None, :] + noise * rng.normal(size=(num_students, IMAGES_PER_STUDENT, EMBEDDING_SIZE))
+    return identities, samples.reshape(-1, EMBEDDING_SIZE).astype(np.float32)
+
+
+def timed_search(index, queries, k):
+    start = time.perf_counter()
+    _, ids = index.search(queries, k)
+    return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def run(sizes, num_queries, k, nprobes, seed):
+    rng = np.random.default_rng(seed)
+    results = []
+
+    for num_students in sizes:
+        identities, gallery = synthetic_gallery(num_students, rng)
+        ids = np.arange(len(gallery))
+        targets = rng.choice(num_students, num_queries, replace=num_queries > num_students)
+        queries = identities[targets] + 0.35 * rng.normal(size=(num_queries, EMBEDDING_SIZE))
+
+        exact = create_index('exact')
+        exact.add(gallery, ids)
+        exact_ids, exact_ms = timed_search(exact, queries, k)
+
+        results.append({
+            "students": num_students, "rows": len(gallery), "index": "exact", "nprobe": None,
+            "build_seconds": 0.0, "recall_at_1": 1.0, f"recall_at_{k}": 1.0,
+            "ms_per_query": round(exact_ms, 4)
+        })
+
+        for nprobe in nprobes:
+            start = time.perf_counter()
+            ivf = create_index('ivf', nprobe=nprobe)
+            ivf.add(gallery, ids)
+            build_seconds = time.perf_counter() - start
+
+            ivf_ids, ivf_ms = timed_search(ivf, queries, k)
+            recall_1 = np.mean(ivf_ids[:, 0] == exact_ids[:, 0])
+            recall_k = np.mean([
+                len(set(ivf_ids[q]) & set(exact_ids[q])) / k for q in range(num_queries)
+            ])
+
+            results.append({
+                "students": num_students, "rows": len(gallery), "index": "ivf", "nprobe": nprobe,
+                "build_seconds": round(build_seconds, 3), "recall_at_1": round(float(recall_1), 4),
+                f"recall_at_{k}": round(float(recall_k), 4), "ms_per_query": round(ivf_ms, 4)
+            })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000], help="Students per gallery")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Write results to this file")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.queries, args.k, args.nprobe, args.seed)
+
+    print(f"{'students':>9} {'rows':>8} {'index':>6} {'nprobe':>6} {'build s':>8} "
+          f"{'R@1':>6} {'R@' + str(args.k):>6} {'ms/query':>9}")
+    for r in results:
+        print(f"{r['students']:>9} {r['rows']:>8} {r['index']:>6} {str(r['nprobe'] or '-'):>6} "
+              f"{r['build_seconds']:>8} {r['recall_at_1']:>6} {r[f'recall_at_{args.k}']:>6} {r['ms_per_query']:>9}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
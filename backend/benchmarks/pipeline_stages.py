@@ -0,0 +1,428 @@
+"""
+Offline micro-benchmarks of the recognition pipeline, one stage at a time.
+
+Stages:
+    quality      backend_1 check_image_quality on synthetic photos
+    haar         Haar cascade detection on synthetic group photos
+    opencv       DeepFace 'opencv' detector backend (backend_1 FACE_DETECTOR)
+    mtcnn        MTCNN detection (backend_2 group photos)
+    detectors    Every --detectors entry of the backend_2 detector registry, side by side
+    represent    DeepFace.represent on single face crops
+    match_b1     backend_1 match_faces on a synthetic gallery
+    match_b2     backend_2 GalleryMatcher.match (+ second pass) on a synthetic gallery
+
+Galleries are random 128-d identities with 5 noisy samples per student, group
+photos are generated with a known number of faces (drawn faces, or crops from
+--faces-dir). Stages whose dependencies are not installed are reported as
+skipped. Results are JSON so runs of two commits can be compared:
+
+Usage:
+    python benchmarks/pipeline_stages.py --json before.json
+    python benchmarks/pipeline_stages.py --compare before.json [--tolerance 0.2]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_1_DIR = os.path.join(BENCHMARKS_DIR, '..', 'backend_1')
+BACKEND_2_DIR = os.path.join(BENCHMARKS_DIR, '..', 'backend_2')
+sys.path.insert(0, BACKEND_2_DIR)
+sys.path.insert(0, BACKEND_1_DIR)
+
+EMBEDDING_SIZE = 128
+IMAGES_PER_STUDENT = 5
+STAGES = ['quality', 'haar', 'opencv', 'mtcnn', 'detectors', 'represent', 'match_b1', 'match_b2']
+
+
+class Skipped(Exception):
+    """Stage cannot run in this environment"""
+
+
+def timed(func, repeat, warmup=1):
+    """Run func warmup + repeat times, return (last result, timing stats in ms)"""
+    for _ in range(warmup):
+        func()
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    times = np.asarray(times)
+    return result, {
+        "runs": repeat,
+        "mean_ms": round(float(times.mean()), 4),
+        "p50_ms": round(float(np.percentile(times, 50)), 4),
+        "p95_ms": round(float(np.percentile(times, 95)), 4),
+        "min_ms": round(float(times.min()), 4)
+    }
+
+
+def require(module):
+    try:
+        return __import__(module)
+    except ImportError as e:
+        raise Skipped(f"{module} not installed ({str(e)})")
+
+
+# Synthetic data
+
+def synthetic_gallery(num_students, rng, noise=0.35):
+    """Identity vectors and IMAGES_PER_STUDENT noisy samples of each, rows grouped by student"""
+    identities = rng.normal(size=(num_students, EMBEDDING_SIZE)).astype(np.float32)
+    samples = identities[:, None, :] + noise * rng.normal(size=(num_students, IMAGES_PER_STUDENT, EMBEDDING_SIZE))
+    row_to_student = np.repeat(np.arange(num_students), IMAGES_PER_STUDENT)
+    return identities, samples.reshape(-1, EMBEDDING_SIZE).astype(np.float32), row_to_student
+
+
+def synthetic_faces(identities, num_faces, rng, noise=0.35):
+    """Query embeddings of num_faces distinct enrolled students, returned with their ids"""
+    targets = rng.choice(len(identities), num_faces, replace=False)
+    faces = identities[targets] + noise * rng.normal(size=(num_faces, EMBEDDING_SIZE))
+    return faces.astype(np.float32), targets
+
+
+def face_crops(faces_dir):
+    """Face photos from a folder, used instead of drawn faces when given"""
+    cv2 = require('cv2')
+    crops = []
+    for name in sorted(os.listdir(faces_dir)):
+        img = cv2.imread(os.path.join(faces_dir, name))
+        if img is not None:
+            crops.append(img)
+    if not crops:
+        raise Skipped(f"no readable images in {faces_dir}")
+    return crops
+
+
+def draw_face(cv2, size, rng):
+    """Simple frontal face drawing: skin oval, eyes, brows, nose and mouth"""
+    face = np.full((size, size, 3), rng.integers(150, 200), dtype=np.uint8)
+    c = size // 2
+    skin = tuple(int(v) for v in rng.integers([140, 160, 200], [180, 200, 240]))
+    cv2.ellipse(face, (c, c), (int(size * 0.36), int(size * 0.46)), 0, 0, 360, skin, -1)
+    for side in (-1, 1):
+        eye = (c + side * int(size * 0.15), int(size * 0.42))
+        cv2.line(face, (eye[0] - int(size * 0.09), eye[1] - int(size * 0.08)),
+                 (eye[0] + int(size * 0.09), eye[1] - int(size * 0.08)), (40, 40, 60), max(1, size // 40))
+        cv2.ellipse(face, eye, (int(size * 0.07), int(size * 0.035)), 0, 0, 360, (255, 255, 255), -1)
+        cv2.circle(face, eye, max(1, int(size * 0.03)), (30, 30, 30), -1)
+    cv2.line(face, (c, int(size * 0.45)), (c, int(size * 0.6)), (110, 130, 170), max(1, size // 50))
+    cv2.ellipse(face, (c, int(size * 0.7)), (int(size * 0.12), int(size * 0.04)), 0, 0, 360, (60, 60, 150), -1)
+    return face
+
+
+def synthetic_group_photo(num_faces, rng, width=1920, height=1080, crops=None):
+    """Group photo with exactly num_faces faces on a jittered grid"""
+    cv2 = require('cv2')
+    img = rng.integers(60, 120, (height, width, 3), dtype=np.uint8)
+    img = cv2.GaussianBlur(img, (5, 5), 0)
+
+    cols = int(np.ceil(np.sqrt(num_faces * width / height)))
+    rows = int(np.ceil(num_faces / cols))
+    cell = min(width // cols, height // rows)
+    size = int(cell * 0.8)
+
+    for i in range(num_faces):
+        row, col = divmod(i, cols)
+        x = col * cell + (cell - size) // 2 + int(rng.integers(-cell // 20, cell // 20 + 1))
+        y = row * cell + (cell - size) // 2 + int(rng.integers(-cell // 20, cell // 20 + 1))
+        x, y = max(0, min(x, width - size)), max(0, min(y, height - size))
+        face = cv2.resize(crops[i % len(crops)], (size, size)) if crops else draw_face(cv2, size, rng)
+        img[y:y + size, x:x + size] = face
+    return img
+
+
+def synthetic_portrait(rng, width, height, crops=None):
+    """Single-face registration photo"""
+    return synthetic_group_photo(1, rng, width, height, crops)
+
+
+# Stages
+
+def bench_quality(args, rng, crops):
+    cv2 = require('cv2')
+    from utils.image_utils import check_image_quality
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for width, height in args.resolutions:
+            path = os.path.join(tmp, f"portrait_{width}x{height}.jpg")
+            cv2.imwrite(path, synthetic_portrait(rng, width, height, crops))
+            (passed, message), stats = timed(lambda: check_image_quality(path), args.repeat)
+            results.append({"resolution": f"{width}x{height}", "passed": passed, "message": message, **stats})
+    return results
+
+
+def bench_detector(args, rng, crops, detect):
+    results = []
+    for num_faces in args.faces:
+        img = synthetic_group_photo(num_faces, rng, *args.group_size, crops=crops)
+        detected, stats = timed(lambda: detect(img), args.repeat)
+        results.append({
+            "faces": num_faces,
+            "resolution": f"{args.group_size[0]}x{args.group_size[1]}",
+            "detected": int(detected),
+            **stats
+        })
+    return results
+
+
+def bench_haar(args, rng, crops):
+    cv2 = require('cv2')
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+    def detect(img):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return len(cascade.detectMultiScale(gray, 1.3, 5))
+
+    return bench_detector(args, rng, crops, detect)
+
+
+def bench_opencv(args, rng, crops):
+    require('deepface')
+    from deepface import DeepFace
+
+    def detect(img):
+        faces = DeepFace.extract_faces(img_path=img, detector_backend='opencv', enforce_detection=False)
+        return sum(1 for face in faces if face.get('confidence', 1) > 0)
+
+    return bench_detector(args, rng, crops, detect)
+
+
+def bench_mtcnn(args, rng, crops):
+    cv2 = require('cv2')
+    require('mtcnn')
+    from mtcnn import MTCNN
+    detector = MTCNN()
+
+    def detect(img):
+        return len(detector.detect_faces(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)))
+
+    return bench_detector(args, rng, crops, detect)
+
+
+def bench_detectors(args, rng, crops):
+    require('cv2')
+    from detectors import detectors
+
+    results = []
+    for name in args.detectors:
+        try:
+            with detectors.acquire(name):
+                pass
+        except Exception as e:
+            results.append({"detector": name, "status": "skipped", "reason": str(e)})
+            continue
+        for row in bench_detector(args, rng, crops, lambda img: len(detectors.detect(name, img))):
+            results.append({"detector": name, **row})
+    return results
+
+
+def bench_represent(args, rng, crops):
+    require('deepface')
+    require('cv2')
+    from deepface import DeepFace
+
+    face = synthetic_portrait(rng, 160, 160, crops)
+    results = []
+    for detector_backend in ('skip', 'opencv'):
+        _, stats = timed(lambda: DeepFace.represent(
+            img_path=face,
+            model_name='Facenet',
+            detector_backend=detector_backend,
+            enforce_detection=False
+        ), args.repeat)
+        results.append({"detector_backend": detector_backend, "faces": 1, **stats})
+    return results
+
+
+def match_accuracy(matches, targets):
+    return round(float(np.mean([match == target for match, target in zip(matches, targets)])), 4)
+
+
+def bench_match_b1(args, rng, crops):
+    require('bson')
+    require('dotenv')
+    from utils.embedding_utils import match_faces
+    from config.settings import FACE_DISTANCE_THRESHOLD
+
+    results = []
+    for num_students in args.sizes:
+        identities, gallery, row_to_student = synthetic_gallery(num_students, rng)
+        for num_faces in args.faces:
+            if num_faces > num_students:
+                continue
+            faces, targets = synthetic_faces(identities, num_faces, rng)
+            matches, stats = timed(
+                lambda: match_faces(faces, gallery, row_to_student, num_students, FACE_DISTANCE_THRESHOLD), args.repeat
+            )
+            results.append({
+                "students": num_students, "faces": num_faces,
+                "accuracy": match_accuracy(matches, targets), **stats
+            })
+    return results
+
+
+def bench_match_b2(args, rng, crops):
+    from matcher import GalleryMatcher, MATCH_THRESHOLD
+
+    results = []
+    for num_students in args.sizes:
+        identities, gallery, row_to_student = synthetic_gallery(num_students, rng)
+        students = [{"id": str(i), "name": f"student_{i}"} for i in range(num_students)]
+
+        matcher, build_stats = timed(
+            lambda: GalleryMatcher.from_rows(students, gallery, row_to_student), 1, warmup=0
+        )
+        for num_faces in args.faces:
+            if num_faces > num_students:
+                continue
+            faces, targets = synthetic_faces(identities, num_faces, rng)
+            matches, stats = timed(lambda: matcher.match(faces, MATCH_THRESHOLD), args.repeat)
+            _, second_stats = timed(lambda: matcher.second_pass(faces, matches), args.repeat)
+            results.append({
+                "students": num_students, "faces": num_faces,
+                "accuracy": match_accuracy(
+                    [int(student["id"]) if student else None for student, _ in matches], targets
+                ),
+                "build_ms": build_stats["mean_ms"],
+                "second_pass_mean_ms": second_stats["mean_ms"],
+                **stats
+            })
+    return results
+
+
+BENCHMARKS = {
+    'quality': bench_quality,
+    'haar': bench_haar,
+    'opencv': bench_opencv,
+    'mtcnn': bench_mtcnn,
+    'detectors': bench_detectors,
+    'represent': bench_represent,
+    'match_b1': bench_match_b1,
+    'match_b2': bench_match_b2
+}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    crops = face_crops(args.faces_dir) if args.faces_dir else None
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "stages": {}
+    }
+    for stage in args.stages:
+        start = time.perf_counter()
+        try:
+            results = BENCHMARKS[stage](args, rng, crops)
+            report["stages"][stage] = {"status": "ok", "results": results}
+        except Skipped as e:
+            report["stages"][stage] = {"status": "skipped", "reason": str(e), "results": []}
+        print(f"{stage}: {report['stages'][stage]['status']} ({time.perf_counter() - start:.1f}s)", file=sys.stderr)
+    return report
+
+
+def result_key(result):
+    """Parameters identifying a result row, everything that is not a measurement"""
+    measured = {"status", "reason", "runs", "mean_ms", "p50_ms", "p95_ms", "min_ms", "build_ms", "second_pass_mean_ms",
+                "accuracy", "detected", "passed", "message"}
+    return tuple(sorted((k, v) for k, v in result.items() if k not in measured))
+
+
+def compare(report, baseline, tolerance):
+    """
+    Compare p50 times with a baseline report
+
+    Returns:
+        list: (stage, parameters, baseline ms, current ms, ratio) of the rows slower than 1 + tolerance
+    """
+    regressions = []
+    for stage, current in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous or previous["status"] != "ok" or current["status"] != "ok":
+            continue
+        previous_rows = {result_key(r): r for r in previous["results"]}
+        for row in current["results"]:
+            old = previous_rows.get(result_key(row))
+            if not old or "p50_ms" not in row or old.get("p50_ms", 0) <= 0:
+                continue
+            ratio = row["p50_ms"] / old["p50_ms"]
+            print(f"{stage:>10} {dict(result_key(row))} {old['p50_ms']:>10.3f} -> {row['p50_ms']:>10.3f} ms  x{ratio:.2f}")
+            if ratio > 1 + tolerance:
+                regressions.append((stage, dict(result_key(row)), old["p50_ms"], row["p50_ms"], round(ratio, 3)))
+    return regressions
+
+
+def print_report(report):
+    for stage, data in report["stages"].items():
+        if data["status"] != "ok":
+            print(f"{stage:>10}  skipped: {data['reason']}")
+            continue
+        for row in data["results"]:
+            if "p50_ms" not in row:
+                print(f"{stage:>10}  {row.get('detector')} skipped: {row.get('reason')}")
+                continue
+            params = ", ".join(f"{k}={v}" for k, v in result_key(row))
+            extra = ", ".join(f"{k}={row[k]}" for k in ("detected", "accuracy", "passed") if k in row)
+            print(f"{stage:>10}  {params:<40} p50 {row['p50_ms']:>10.3f} ms  p95 {row['p95_ms']:>10.3f} ms  {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000],
+                        help="Students per synthetic gallery")
+    parser.add_argument('--faces', type=int, nargs='+', default=[1, 10, 40], help="Faces per group photo")
+    parser.add_argument('--resolutions', type=lambda s: tuple(map(int, s.split('x'))), nargs='+',
+                        default=[(640, 480), (1920, 1080), (4000, 3000)], help="Registration photo sizes, WxH")
+    parser.add_argument('--group-size', type=lambda s: tuple(map(int, s.split('x'))), default=(1920, 1080),
+                        help="Group photo size, WxH")
+    parser.add_argument('--detectors', nargs='+', default=['haar', 'opencv-dnn', 'mtcnn'],
+                        help="Detector registry entries for the detectors stage")
+    parser.add_argument('--faces-dir', help="Folder of face photos pasted into the synthetic images")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Write the report to this file")
+    parser.add_argument('--compare', help="Baseline report to compare p50 times with")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown before failing --compare")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
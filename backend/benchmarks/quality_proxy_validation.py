@@ -0,0 +1,132 @@
+"""
+Validate the downscaled-proxy quality check against the full-resolution one.
+
+Runs backend_1 check_image_quality in 'full' and 'proxy' mode over a corpus
+of images and reports how often the pass/fail decisions (and messages)
+agree, how often the proxy had to fall back to the full-resolution image,
+and the speedup. With --degrade every image is also checked in blurred,
+darkened and overexposed variants so the thresholds are exercised.
+
+Usage:
+    python benchmarks/quality_proxy_validation.py CORPUS_DIR [--degrade] [--json results.json]
+
+Exits with status 1 if any decision differs.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend_1'))
+
+import cv2
+from utils.image_utils import ImageContext, check_image_quality
+from utils.metrics import metrics
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+
+def corpus(folder):
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                yield os.path.join(root, name)
+
+
+def variants(img, degrade):
+    """The image itself and, with degrade, versions around each threshold"""
+    yield 'original', img
+    if not degrade:
+        return
+    for sigma in (1, 2, 4, 8):
+        yield f'blur_{sigma}', cv2.GaussianBlur(img, (0, 0), sigma)
+    for gain in (0.2, 0.35):
+        yield f'dark_{gain}', cv2.convertScaleAbs(img, alpha=gain)
+    yield 'overexposed', cv2.convertScaleAbs(img, alpha=2.5, beta=60)
+
+
+def timed_check(img, mode):
+    # A fresh context per run, so neither mode reuses the other's cached views
+    start = time.perf_counter()
+    result = check_image_quality(ImageContext(image=img), mode=mode)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def fallbacks():
+    return sum(value for (name, _), value in metrics.counters.items()
+               if name.endswith('quality_full_resolution_checks_total'))
+
+
+def run(folder, degrade):
+    rows = []
+    for path in corpus(folder):
+        img = cv2.imread(path)
+        if img is None:
+            print(f"Skipping unreadable {path}", file=sys.stderr)
+            continue
+        for variant, image in variants(img, degrade):
+            (full_passed, full_message), full_ms = timed_check(image, 'full')
+            before = fallbacks()
+            (proxy_passed, proxy_message), proxy_ms = timed_check(image, 'proxy')
+            rows.append({
+                "image": path,
+                "variant": variant,
+                "resolution": f"{image.shape[1]}x{image.shape[0]}",
+                "full_passed": full_passed,
+                "proxy_passed": proxy_passed,
+                "full_message": full_message,
+                "proxy_message": proxy_message,
+                "fallback": fallbacks() > before,
+                "full_ms": round(full_ms, 3),
+                "proxy_ms": round(proxy_ms, 3)
+            })
+    return rows
+
+
+def summarize(rows):
+    if not rows:
+        return {"images": 0}
+    agree = [r["full_passed"] == r["proxy_passed"] for r in rows]
+    same_message = [r["full_message"] == r["proxy_message"] for r in rows]
+    full_ms = np.array([r["full_ms"] for r in rows])
+    proxy_ms = np.array([r["proxy_ms"] for r in rows])
+    return {
+        "images": len(rows),
+        "decision_agreement": round(float(np.mean(agree)), 4),
+        "message_agreement": round(float(np.mean(same_message)), 4),
+        "fallback_rate": round(float(np.mean([r["fallback"] for r in rows])), 4),
+        "full_p50_ms": round(float(np.median(full_ms)), 3),
+        "proxy_p50_ms": round(float(np.median(proxy_ms)), 3),
+        "speedup": round(float(full_ms.sum() / max(proxy_ms.sum(), 1e-9)), 2),
+        "disagreements": [r for r, ok in zip(rows, agree) if not ok]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus', help="Folder of test images, searched recursively")
+    parser.add_argument('--degrade', action='store_true', help="Also check blurred/dark/overexposed variants")
+    parser.add_argument('--json', help="Write per-image results and the summary to this file")
+    args = parser.parse_args()
+
+    rows = run(args.corpus, args.degrade)
+    summary = summarize(rows)
+
+    for key, value in summary.items():
+        if key != "disagreements":
+            print(f"{key:>20}: {value}")
+    for r in summary.get("disagreements", []):
+        print(f"DIFFERS {r['image']} [{r['variant']}] full={r['full_message']!r} proxy={r['proxy_message']!r}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "results": rows}, f, indent=2)
+
+    if summary.get("disagreements"):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Full-image versus tiled face detection on high-resolution classroom photos.
+
+Generates lecture-hall photos with rows of faces that shrink towards the
+back (drawn faces, or crops from --faces-dir), runs a backend_2 registry
+detector on the whole image and through detect_tiled, and reports latency
+and recall per face-size bucket (a face counts as found when a box overlaps
+it with IoU >= 0.4).
+
+Usage:
+    python benchmarks/tiled_detection.py [--detector mtcnn] [--size 4000x3000] [--faces-dir DIR] [--json out.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..', 'backend_2'))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import cv2
+from detectors import detectors, TILE_SIZE, TILE_OVERLAP, TILE_WORKERS
+from pipeline_stages import draw_face, face_crops
+
+SIZE_BUCKETS = [(0, 48), (48, 96), (96, 192), (192, 10000)]  # Face side in pixels
+
+
+def classroom_photo(width, height, rows, rng, crops=None):
+    """Rows of faces, largest at the front (bottom), returned with their ground-truth boxes"""
+    img = cv2.GaussianBlur(rng.integers(60, 120, (height, width, 3), dtype=np.uint8), (5, 5), 0)
+    boxes = []
+    y = int(height * 0.05)
+    sizes = np.geomspace(height * 0.012, height * 0.09, rows)
+    for row, size in enumerate(sizes):
+        size = int(size)
+        gap = size
+        x = int(rng.integers(0, gap))
+        while x + size < width:
+            face = cv2.resize(crops[len(boxes) % len(crops)], (size, size)) if crops else draw_face(cv2, size, rng)
+            img[y:y + size, x:x + size] = face
+            boxes.append((x, y, size, size))
+            x += size + gap + int(rng.integers(0, gap // 2 + 1))
+        y += int(size * 1.6)
+        if y + int(sizes[min(row + 1, rows - 1)]) >= height:
+            break
+    return img, boxes
+
+
+def iou(a, b):
+    inter_w = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    inter_h = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    intersection = inter_w * inter_h
+    return intersection / (a[2] * a[3] + b[2] * b[3] - intersection)
+
+
+def recall_by_size(truth, boxes, threshold=0.4):
+    found = {bucket: [0, 0] for bucket in SIZE_BUCKETS}
+    for face in truth:
+        bucket = next(b for b in SIZE_BUCKETS if b[0] <= face[2] < b[1])
+        found[bucket][1] += 1
+        if any(iou(face, box[:4]) >= threshold for box in boxes):
+            found[bucket][0] += 1
+    return {f"{lo}-{hi}px": {"faces": total, "recall": round(hit / total, 4) if total else None}
+            for (lo, hi), (hit, total) in found.items()}
+
+
+def timed(func, repeat):
+    func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return result, round(float(np.median(times)), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--detector', default='mtcnn', help="Detector registry entry")
+    parser.add_argument('--size', type=lambda s: tuple(map(int, s.split('x'))), default=(4000, 3000))
+    parser.add_argument('--rows', type=int, default=8, help="Rows of students")
+    parser.add_argument('--photos', type=int, default=3)
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE)
+    parser.add_argument('--overlap', type=int, default=TILE_OVERLAP)
+    parser.add_argument('--workers', type=int, default=TILE_WORKERS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--faces-dir', help="Folder of face photos used instead of drawn faces")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Write results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    crops = face_crops(args.faces_dir) if args.faces_dir else None
+
+    results = []
+    for photo in range(args.photos):
+        img, truth = classroom_photo(*args.size, args.rows, rng, crops)
+        full_boxes, full_ms = timed(lambda: detectors.detect(args.detector, img), args.repeat)
+        tiled_boxes, tiled_ms = timed(lambda: detectors.detect_tiled(
+            args.detector, img, args.tile_size, args.overlap, args.workers
+        ), args.repeat)
+
+        for mode, boxes, ms in (("full", full_boxes, full_ms), ("tiled", tiled_boxes, tiled_ms)):
+            result = {
+                "photo": photo, "mode": mode, "detector": args.detector,
+                "resolution": f"{args.size[0]}x{args.size[1]}", "faces": len(truth),
+                "detected": len(boxes), "p50_ms": ms, "recall": recall_by_size(truth, boxes)
+            }
+            results.append(result)
+            recall = ", ".join(f"{bucket} {r['recall']}" for bucket, r in result["recall"].items() if r["faces"])
+            print(f"photo {photo} {mode:>5}: {ms:>9.1f} ms  {len(boxes):>3}/{len(truth)} boxes  recall {recall}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()